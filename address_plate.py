@@ -1,11 +1,19 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
+from contextlib import nullcontext
+import csv
+from glyph_store import glyph_metrics, open_store
 import io
-import pickle
+import json
+from layout_spec import compile_specs, load_sizes, plate_sizes
+import os
 import re
-from reportlab.pdfgen import canvas
-from reportlab.lib.colors import PCMYKColor
 import sys
 import textwrap
+import threading
+import time
+from types import MappingProxyType
 
 
 def pt(mm: float) -> float:
@@ -14,18 +22,73 @@ def pt(mm: float) -> float:
     return mm*2.834645669  # 72/25.4
 
 
+def mm(pt_: float) -> float:
+    """ pt to mm
+    """
+    return pt_/2.834645669
+
+
+GLYPH_STORE_PATH = os.environ.get('ADDRESS_PLATE_GLYPHS') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'paths.glyphs')
+
+
 def _load_path():
-    with open('paths' + '.pkl', 'rb') as f:
-        return pickle.load(f)
+    """ glyph store of ADDRESS_PLATE_GLYPHS or next to this file (see glyph_store.py),
+    or paths.pkl next to this file or in current dir
+    """
+    if 'ADDRESS_PLATE_GLYPHS' in os.environ or os.path.exists(GLYPH_STORE_PATH):
+        return open_store(GLYPH_STORE_PATH)
+    import pickle
+
+    for pkl_path in (os.path.join(os.path.dirname(os.path.abspath(__file__)), 'paths.pkl'), 'paths.pkl'):
+        if os.path.exists(pkl_path):
+            with open(pkl_path, 'rb') as f:
+                return pickle.load(f)
+    raise FileNotFoundError(f'no glyph paths: {GLYPH_STORE_PATH} or paths.pkl')
+
+
+class LazyPaths(Mapping):
+    """ glyph paths loaded by _load_path() on first lookup, so a run that draws nothing loads nothing,
+    loaded once if first lookups come from many threads
+    """
+
+    def __init__(self):
+        self._paths = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._paths is None:
+            with self._lock:
+                if self._paths is None:
+                    self._paths = _load_path()
+        return self._paths
+
+    def __getitem__(self, key: str) -> tuple:
+        if METRICS is None:
+            return self._load()[key]
+        start = time.perf_counter()
+        glyph = self._load()[key]
+        METRICS.add('glyph_lookup', time.perf_counter() - start)
+        return glyph
+
+    def metrics(self, key: str) -> tuple:
+        """ (current_point, path_extents) of glyph without its outline
+        """
+        return glyph_metrics(self._load(), key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._load()
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __iter__(self):
+        return iter(self._load())
 
 
 THIN = 'thin'
 WIDE = 'wide'
 
-COLOR_WHITE = PCMYKColor(0, 0, 0, 0)
-COLOR_DARK_BLUE = PCMYKColor(75, 65, 0, 75)
-# пока будет так, если цвета не подойдут поменяю
-
 HOUSE_NUMBER_RE_TUPLE = (
     re.compile(r'^(?P<lvl1>[1-9]\d*(-[1-9]\d*)?)$'),
     re.compile(r'^(?P<lvl1>[1-9]\d*(-[1-9]\d*)?)(?P<lvl2c>[А-Я]+)$'),
@@ -166,11 +229,50 @@ SIZES_PT = {
 
 }
 
+# more plate sizes (see layout_spec.py)
+SIZES_PATH = os.environ.get('ADDRESS_PLATE_SIZES') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sizes.json')
+if 'ADDRESS_PLATE_SIZES' in os.environ or os.path.exists(SIZES_PATH):
+    SIZES_PT.update(load_sizes(SIZES_PATH))
+
+PLATE_SIZES = plate_sizes(SIZES_PT)
+# {(plate kind, size, arrow): layout spec}, every size is checked here, not in the middle of a render
+LAYOUT_SPECS = compile_specs(SIZES_PT)
+# read only from here, plates get their (immutable) specs, so renders in threads share nothing mutable
+SIZES_PT = MappingProxyType(SIZES_PT)
+
+
+def layout_spec(kind: str, size: str, arrow: bool = False):
+    """ NameSpec/NumberSpec/VerticalSpec (layout_spec.py)
+
+    :param size: thin, wide or size from sizes file
+    """
+    try:
+        return LAYOUT_SPECS[kind, size, arrow]
+    except KeyError:
+        raise ValueError(f'unknown plate size {size!r}, expected one of {", ".join(PLATE_SIZES)}') from None
+
 
 def main():
     parser = ArgumentParser()
 
     parser.add_argument('--wide', help='Wide street', action='store_true')
+    parser.add_argument('--size', help='Plate size, overrides --wide (sizes file, see layout_spec.py)',
+                        choices=PLATE_SIZES)
+    parser.add_argument('--numpy', help='Numpy text layout (text_paths_numpy.py)', action='store_true')
+    parser.add_argument('--layout_cache', help='Cached text layouts, 0 - no cache', type=int,
+                        default=LAYOUT_CACHE.capacity)
+    parser.add_argument('--direct', help='Pdf operators written directly, not by reportlab path calls',
+                        action='store_true')
+    parser.add_argument('--pdf_mode', help='Pdf output: fast - not compressed, compact - rounded coordinates and '
+                                           'max compression, invariant - same bytes for same input',
+                        choices=PDF_MODES, default='default')
+    parser.add_argument('--precision', help='Digits after point of coordinates, overrides --pdf_mode', type=int)
+    parser.add_argument('--invariant', help='Same bytes for same input with any --pdf_mode', action='store_true')
+    parser.add_argument('--preview', help='Svg or png preview instead of pdf (plate_preview.py)',
+                        choices=('svg', 'png'))
+    parser.add_argument('--metrics', help='Render metrics file (.prom - prometheus text, else json, "-" - stderr)',
+                        type=str, default=os.environ.get('ADDRESS_PLATE_METRICS'))
 
     sub_parser = parser.add_subparsers(title='Address plate', description='Address plate description')
 
@@ -193,27 +295,687 @@ def main():
     vertical_parser.add_argument('--house_num', help='House number', type=str, required=True)
     vertical_parser.set_defaults(func=Vertical)
 
+    batch_parser = sub_parser.add_parser('batch', help='Many plates from csv/jsonl manifest')
+    batch_parser.add_argument('--manifest', help='Manifest file (.csv or .jsonl)', type=str, required=True)
+    batch_parser.add_argument('--out_dir', help='Directory for output files', type=str, default='.')
+    batch_parser.add_argument('--archive', help='Zip/tar file instead of out_dir, "-" - stdout', type=str)
+    batch_parser.add_argument('--archive_format', help='Archive format, by --archive extension if not set',
+                              choices=('zip', 'tar', 'tar.gz', 'tgz', 'tar.bz2', 'tar.xz'))
+    batch_parser.add_argument('--workers', help='Render processes, 0 - all cores', type=int, default=1)
+    batch_parser.add_argument('--chunksize', help='Plates per worker task', type=int, default=16)
+    batch_parser.add_argument('--cache', help='Render cache directory, only new or changed plates are rendered',
+                              type=str)
+    batch_parser.add_argument('--cache_size', help='Render cache size, MB', type=int, default=1024)
+    batch_parser.set_defaults(func=_main_batch)
+
+    dry_run_parser = sub_parser.add_parser('dry-run', help='Width and height of every manifest plate, no rendering')
+    dry_run_parser.add_argument('--manifest', help='Manifest file (.csv or .jsonl)', type=str, required=True)
+    dry_run_parser.add_argument('--output', help='Sizes file (.csv or .jsonl), csv to stdout if not set', type=str)
+    dry_run_parser.set_defaults(func=_main_dry_run)
+
+    impose_parser = sub_parser.add_parser('impose', help='Manifest plates packed onto print sheets '
+                                                         '(plate_imposition.py)')
+    impose_parser.add_argument('--manifest', help='Manifest file (.csv or .jsonl)', type=str, required=True)
+    impose_parser.add_argument('--output', help='Pdf file, page per sheet', type=str, required=True)
+    impose_parser.add_argument('--sheet', help='Sheet size WxH, mm', type=_sheet_size, default='3050x1525')
+    impose_parser.add_argument('--gutter', help='Space between plate bleeds, mm', type=float, default=10)
+    impose_parser.add_argument('--bleed', help='Background around plates, mm', type=float, default=3)
+    impose_parser.add_argument('--margin', help='Sheet border, mm', type=float, default=10)
+    impose_parser.add_argument('--rotate', help='Plates may be turned 90°', action='store_true')
+    impose_parser.add_argument('--no_crop_marks', help='No crop marks', action='store_true')
+    impose_parser.add_argument('--text_forms', help='Texts drawn 4 and more times (street names of name plates) '
+                                                    'written once as form xobjects, smaller pdf',
+                               action='store_true')
+    impose_parser.add_argument('--report', help='Utilisation json file', type=str)
+    impose_parser.set_defaults(func=_main_impose)
+
+    validate_parser = sub_parser.add_parser('validate', help='Check and normalise every manifest row, no rendering '
+                                                             '(plate_validation.py)')
+    validate_parser.add_argument('--manifest', help='Manifest file (.csv or .jsonl)', type=str, required=True)
+    validate_parser.add_argument('--report', help='Issues file (jsonl), stdout if not set', type=str)
+    validate_parser.add_argument('--output', help='Normalised manifest (.csv or .jsonl)', type=str)
+    validate_parser.set_defaults(func=_main_validate)
+
+    job_parser = sub_parser.add_parser('job', help='Resumable batch in sqlite queue, any number of workers '
+                                                   '(plate_jobs.py)')
+    job_parser.add_argument('action', help='create - load manifest, render settings (--numpy, --direct, --pdf_mode) '
+                                           'are kept for work, work - render till done (again to resume), '
+                                           'status - progress json, errors - failed rows, '
+                                           'retry - failed chunks rendered again by next work',
+                            choices=('create', 'work', 'status', 'errors', 'retry'))
+    job_parser.add_argument('--job', help='Job file (sqlite)', type=str, required=True)
+    job_parser.add_argument('--manifest', help='Manifest file (.csv or .jsonl), create', type=str)
+    job_parser.add_argument('--out_dir', help='Directory for output files, create', type=str, default='.')
+    job_parser.add_argument('--chunk_rows', help='Rows per claimed chunk, create', type=int, default=256)
+    job_parser.add_argument('--workers', help='Worker processes, 0 - all cores, work', type=int, default=1)
+    job_parser.add_argument('--stale', help='Claim not done in this time is taken again, s', type=float,
+                            default=600)
+    job_parser.add_argument('--cache', help='Render cache directory, work', type=str)
+    job_parser.add_argument('--cache_size', help='Render cache size, MB', type=int, default=1024)
+    job_parser.set_defaults(func=_main_job)
+
+    serve_parser = sub_parser.add_parser('serve', help='Http render service (plate_server.py)')
+    serve_parser.add_argument('--host', help='Listen address', type=str, default='127.0.0.1')
+    serve_parser.add_argument('--port', help='Listen port', type=int, default=8000)
+    serve_parser.add_argument('--workers', help='Render processes, 0 - all cores', type=int, default=0)
+    serve_parser.add_argument('--concurrency', help='Renders in flight, 0 - workers', type=int, default=0)
+    serve_parser.add_argument('--max_queue', help='Waiting requests before 503', type=int, default=256)
+    serve_parser.set_defaults(func=_main_serve)
+
     args = parser.parse_args()
+    LAYOUT_CACHE.capacity = args.layout_cache
+    if args.numpy:
+        use_numpy()
+    BasePlate.direct_pdf = args.direct
+    BasePlate.pdf_mode = PDF_MODES[args.pdf_mode]
+    if args.precision is not None:
+        BasePlate.pdf_mode = BasePlate.pdf_mode._replace(precision=args.precision)
+    if args.invariant:
+        BasePlate.pdf_mode = BasePlate.pdf_mode._replace(invariant=True)
+    if args.metrics:
+        enable_metrics()
+    if args.func in (_main_batch, _main_dry_run, _main_impose, _main_job, _main_serve, _main_validate):
+        status = args.func(args)
+        if METRICS is not None:
+            METRICS.dump(args.metrics)
+        sys.exit(status)
+
     func_args = dict(vars(args))
-    func_args['wide'] = WIDE if args.wide else THIN
+    func_args['wide'] = _size(args)
     del func_args['func']
+    del func_args['numpy']
+    del func_args['layout_cache']
+    del func_args['metrics']
+    del func_args['direct']
+    del func_args['pdf_mode']
+    del func_args['precision']
+    del func_args['invariant']
+    del func_args['preview']
+    del func_args['size']
 
     plate = args.func(**func_args)
-    pdf = plate.pdf()
 
-    if True:
-        sys.stdout = sys.stdout.detach()
-        sys.stdout.write(pdf.read())
+    if args.preview:
+        from plate_preview import preview
+
+        sys.stdout.buffer.write(preview(plate, args.preview))
+        sys.stdout.buffer.flush()
+    elif True:
+        plate.write_pdf(sys.stdout.buffer)
+        sys.stdout.buffer.flush()
     else:
         with open('test.pdf', 'wb') as out:
-            out.write(pdf.read())
+            plate.write_pdf(out)
+    if METRICS is not None:
+        METRICS.dump(args.metrics)
+
+
+def _size(args) -> str:
+    return args.size or (WIDE if args.wide else THIN)
+
+
+def use_numpy():
+    """ lay out text of all plates with NumpyTextPaths (text_paths_numpy.py, needs numpy)
+    """
+    from text_paths_numpy import NumpyTextPaths
+
+    BasePlate.text_paths_class = NumpyTextPaths
+    LAYOUT_CACHE.clear()
+
+
+def render_settings() -> dict:
+    """ BasePlate settings that change output (--numpy, --direct, --pdf_mode), plain values for worker processes
+    (spawn and forkserver workers do not inherit them) and job files, see apply_render_settings()
+    """
+    return {'numpy': BasePlate.text_paths_class is not None, 'direct_pdf': BasePlate.direct_pdf,
+            'pdf_mode': list(BasePlate.pdf_mode)}
+
+
+def apply_render_settings(settings: dict):
+    if settings['numpy']:
+        use_numpy()
+    elif BasePlate.text_paths_class is not None:
+        BasePlate.text_paths_class = None
+        LAYOUT_CACHE.clear()
+    BasePlate.direct_pdf = settings['direct_pdf']
+    BasePlate.pdf_mode = PdfMode(*settings['pdf_mode'])
+
+
+def init_worker(settings: dict, metrics: bool = False):
+    """ ProcessPoolExecutor initializer: settings of the parent (render_settings()), metrics from empty
+    """
+    # spawned worker imports the script as __mp_main__, text_paths_numpy must get it as address_plate too
+    sys.modules.setdefault('address_plate', sys.modules[__name__])
+    apply_render_settings(settings)
+    if metrics:
+        enable_metrics(reset=True)
+
+
+METRICS = None  # plate_metrics.Metrics while recording, see enable_metrics()
+_NO_PHASE = nullcontext()
+
+
+def enable_metrics(reset: bool = False) -> 'Metrics':
+    """ record render phases and counters from now on (plate_metrics.py)
+
+    :param reset: start from empty metrics if already recording
+    :return: recording Metrics, add hooks to Metrics.hooks to get every phase as it ends
+    """
+    global METRICS
+    if METRICS is None or reset:
+        from plate_metrics import Metrics
+
+        METRICS = Metrics(LAYOUT_CACHE)
+    return METRICS
+
+
+def disable_metrics():
+    global METRICS
+    METRICS = None
+
+
+def _phase(name: str, plate: str = None):
+    """ METRICS.phase() or nothing if metrics are not recorded
+    """
+    return _NO_PHASE if METRICS is None else METRICS.phase(name, plate)
+
+
+def _main_serve(args) -> int:
+    from plate_server import serve
+
+    serve(args.host, args.port, workers=args.workers or None, concurrency=args.concurrency or None,
+          max_queue=args.max_queue, default_wide=_size(args))
+    return 0
+
+
+def _main_batch(args) -> int:
+    from plate_output import open_sink
+
+    cache = None
+    if args.cache:
+        from render_cache import RenderCache
+
+        cache = RenderCache(args.cache, max_bytes=args.cache_size * 1024 * 1024)
+    sink = open_sink(args.archive, args.out_dir, args.archive_format, BasePlate.pdf_mode.invariant or None)
+    try:
+        results = render_batch(read_manifest(args.manifest), default_wide=_size(args),
+                               workers=args.workers, chunksize=args.chunksize, sink=sink, cache=cache)
+    finally:
+        sink.close()
+    errors = [result for result in results if result.error]
+    for result in errors:
+        print(f'{args.manifest}:{result.line}: {result.error}', file=sys.stderr)
+    print(f'rendered {len(results) - len(errors)} of {len(results)} rows', file=sys.stderr)
+    if cache is not None:
+        print(f'cache: {cache.hits} plates from cache, {cache.writes} rendered, {cache.evictions} evicted',
+              file=sys.stderr)
+    return 1 if errors else 0
+
+
+def _main_dry_run(args) -> int:
+    sizes = measure_rows(read_manifest(args.manifest), default_wide=_size(args))
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.output and args.output.endswith('.jsonl'):
+            for size in sizes:
+                out.write(json.dumps(size._asdict(), ensure_ascii=False) + '\n')
+        else:
+            writer = csv.writer(out)
+            writer.writerow(PlateSize._fields)
+            writer.writerows(sizes)
+    finally:
+        if args.output:
+            out.close()
+
+    blanks = {}
+    errors = 0
+    for size in sizes:
+        if size.error:
+            print(f'{args.manifest}:{size.line}: {size.error}', file=sys.stderr)
+            errors += 1
+        else:
+            blank = (size.plate, size.wide, size.width_mm, size.height_mm)
+            blanks[blank] = blanks.get(blank, 0) + 1
+    for (plate, wide, width, height), count in sorted(blanks.items(), key=lambda item: -item[1]):
+        print(f'{plate} {wide} {width} x {height} mm: {count}', file=sys.stderr)
+    print(f'measured {len(sizes) - errors} of {len(sizes)} rows', file=sys.stderr)
+    return 1 if errors else 0
+
+
+def _sheet_size(value: str) -> tuple:
+    """ 'WxH' mm to (width, height) mm
+    """
+    try:
+        width, height = (float(x) for x in value.lower().split('x'))
+    except ValueError:
+        raise ArgumentTypeError(f'bad sheet size {value!r}, expected WxH mm, e.g. 3050x1525') from None
+    return width, height
+
+
+def _main_impose(args) -> int:
+    from plate_imposition import impose
+
+    plates = []
+    lines = []
+    errors = 0
+    keys = {}
+    for line, row in enumerate(read_manifest(args.manifest), 1):
+        try:
+            key = row_key(row, _size(args))
+            if key not in keys:
+                keys[key] = plate_from_key(key)
+        except (KeyError, ValueError) as e:
+            print(f'{args.manifest}:{line}: {type(e).__name__}: {e}', file=sys.stderr)
+            errors += 1
+            continue
+        plates.append(keys[key])
+        lines.append(line)
+
+    sheet_width, sheet_height = args.sheet
+    report = impose(plates, args.output, pt(sheet_width), pt(sheet_height), gutter=pt(args.gutter),
+                    bleed=pt(args.bleed), margin=pt(args.margin), rotate=args.rotate,
+                    crop_marks=not args.no_crop_marks, text_forms=args.text_forms)
+    for index in report['too_large']:
+        print(f'{args.manifest}:{lines[index]}: plate is larger than sheet', file=sys.stderr)
+    print(f'{report["plates"]} plates on {report["sheets"]} sheets {sheet_width:g}x{sheet_height:g} mm, '
+          f'utilisation {report["utilisation"]:.1%}', file=sys.stderr)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if errors or report['too_large'] else 0
+
+
+def _main_job(args) -> int:
+    import plate_jobs
+
+    if args.action == 'create':
+        if not args.manifest:
+            print('job create needs --manifest', file=sys.stderr)
+            return 2
+        rows = plate_jobs.create(args.job, read_manifest(args.manifest), args.out_dir, _size(args), args.chunk_rows)
+        print(f'{rows} rows in chunks of {args.chunk_rows}', file=sys.stderr)
+        return 0
+    if args.action == 'errors':
+        errors = 0
+        for line, output, error in plate_jobs.row_errors(args.job):
+            print(f'{args.job}:{line}: {output}: {error}')
+            errors += 1
+        return 1 if errors else 0
+    if args.action == 'retry':
+        print(f'{plate_jobs.retry(args.job)} failed chunks pending again', file=sys.stderr)
+        return 0
+    if args.action == 'work':
+        work_args = (args.job, args.stale, plate_jobs.MAX_ATTEMPTS, args.cache, args.cache_size * 1024 * 1024)
+        if args.workers == 1:
+            done = [plate_jobs.work(*work_args)]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            workers = args.workers or os.cpu_count()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                done = list(executor.map(plate_jobs.work, *zip(*[work_args] * workers)))
+        for worker in done:
+            print(f'{worker["worker"]}: {worker["rows"]} rows in {worker["chunks"]} chunks, '
+                  f'{worker["errors"]} errors, {worker["failed"]} chunks failed, {worker["seconds"]:.1f} s',
+                  file=sys.stderr)
+    status = plate_jobs.status(args.job, args.stale)
+    print(json.dumps(status, indent=2))
+    return 0 if args.action == 'status' or status['done'] and not status['errors'] and not status['rows_failed'] \
+        else 1
+
+
+def _main_validate(args) -> int:
+    from plate_validation import NORMALIZED, validate_rows
+
+    report = open(args.report, 'w', encoding='utf-8') if args.report else sys.stdout
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else None
+    writer = None
+    counts = {}
+    rows = errors = 0
+    try:
+        for line, row, issues in validate_rows(read_manifest(args.manifest), _size(args), TextPaths.path_dict):
+            rows += 1
+            row_errors = 0
+            for issue in issues:
+                report.write(json.dumps(issue._asdict(), ensure_ascii=False) + '\n')
+                counts[issue.code] = counts.get(issue.code, 0) + 1
+                row_errors += issue.code != NORMALIZED
+            errors += bool(row_errors)
+            if output is None:
+                continue
+            if args.output.endswith('.jsonl'):
+                output.write(json.dumps(row, ensure_ascii=False) + '\n')
+                continue
+            if writer is None:
+                # fields of every plate, then other columns of first row (same in every row of csv manifest),
+                # other keys of later jsonl rows are left out
+                fields = ['plate', 'wide', *dict.fromkeys(field for plate_fields in PLATE_FIELDS.values()
+                                                          for field in plate_fields), 'output']
+                writer = csv.DictWriter(output, fields + [key for key in row if key not in fields], restval='',
+                                        extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+    finally:
+        if args.report:
+            report.close()
+        if output is not None:
+            output.close()
+
+    for code, count in sorted(counts.items()):
+        print(f'{code}: {count}', file=sys.stderr)
+    print(f'{rows - errors} of {rows} rows valid', file=sys.stderr)
+    return 1 if errors else 0
+
+
+PLATE_FIELDS = {
+    'name': ('street_type', 'street_name', 'street_translit'),
+    'number': ('house_num', 'left_num', 'right_num'),
+    'vertical': ('street_type', 'street_name', 'street_translit', 'house_num'),
+}
+
+BatchResult = namedtuple('BatchResult', 'line output error')
+PlateSize = namedtuple('PlateSize', 'line output plate wide width_mm height_mm error')
+
+
+def read_manifest(path: str):
+    """ yield rows (dict) of csv (with header) or jsonl manifest
+
+    row keys: plate (name/number/vertical), wide, street_type, street_name, street_translit,
+              house_num, left_num, right_num, output
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.endswith('.jsonl'):
+            for number, line in enumerate(f, 1):
+                row = json.loads(line) if line.strip() else {}
+                if not isinstance(row, dict):
+                    raise ValueError(f'{path}:{number}: json object expected')
+                yield row
+        else:
+            yield from csv.DictReader(f)
+
+
+def row_key(row: dict, default_wide: str = THIN) -> tuple:
+    """ (plate, wide, field values) - rows with same key give same pdf
+    """
+    plate = row.get('plate')
+    if not isinstance(plate, str) or plate not in PLATE_FIELDS:
+        raise ValueError(f'unknown plate {plate!r}, expected one of {", ".join(PLATE_FIELDS)}')
+
+    wide = row_wide(row, default_wide)
+    values = {field: cell_text(row.get(field), field) for field in PLATE_FIELDS[plate]}
+    for field, regex_tuple in (('house_num', HOUSE_NUMBER_RE_TUPLE),
+                               ('left_num', HOUSE_NUMBER_ARROW_RE_TUPLE),
+                               ('right_num', HOUSE_NUMBER_ARROW_RE_TUPLE)):
+        if field not in values:
+            continue
+        if values[field] is None and field == 'house_num' \
+                or values[field] is not None and BasePlate.parse_house_number(values[field], regex_tuple) is None:
+            raise ValueError(f'bad {field} {values[field]!r}')
+
+    return (plate, wide) + tuple(values.values())
+
+
+def cell_text(value, field: str) -> str:
+    """ manifest cell as text, None if empty, numbers of jsonl cells are text ({"house_num": 12} - '12')
+
+    :raise ValueError: other json values (true/false, list, object)
+    """
+    if value is None or isinstance(value, str):
+        return value or None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f'bad {field} {value!r}, expected text')
+
+
+def row_wide(row: dict, default_wide: str = THIN) -> str:
+    """ plate size of row wide field: true/false or size name
+    """
+    wide = row.get('wide')
+    if wide in (None, ''):
+        return default_wide
+    if str(wide).lower() in (WIDE, '1', 'true', 'yes'):
+        return WIDE
+    if str(wide).lower() in (THIN, '0', 'false', 'no'):
+        return THIN
+    if not isinstance(wide, str) or wide not in PLATE_SIZES:
+        raise ValueError(f'bad wide value {wide!r}, expected true/false or one of {", ".join(PLATE_SIZES)}')
+    return wide
+
+
+# sources of everything drawn: layout, glyph scaling, path backends, pdf canvas, svg/png previews
+RENDER_SOURCES = ('address_plate.py', 'layout_spec.py', 'glyph_store.py', 'text_paths_numpy.py', 'plate_canvas.py',
+                  'plate_preview.py')
+
+
+def render_version() -> bytes:
+    """ changes with anything that changes output of a plate key: code, glyphs, SIZES_PT, backend, reportlab
+    """
+    import hashlib
+    from reportlab import Version
+
+    version = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in RENDER_SOURCES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            version.update(f.read())
+    version.update(f'reportlab {Version}'.encode())
+    for path in (GLYPH_STORE_PATH, os.path.join(directory, 'paths.pkl'), 'paths.pkl'):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            version.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    version.update(repr(sorted(SIZES_PT.items())).encode())
+    version.update(f'{BasePlate.direct_pdf}:{BasePlate.text_paths_class}:{BasePlate.pdf_mode}'.encode())
+    return version.digest()
+
+
+def plate_from_key(key: tuple):
+    plate, wide, *values = key
+    return PLATE_CLASSES[plate](wide=wide, **dict(zip(PLATE_FIELDS[plate], values)))
+
+
+def render_batch(rows, out_dir: str = '.', default_wide: str = THIN, workers: int = 1, chunksize: int = 16,
+                 sink=None, cache=None) -> list:
+    """ render every manifest row into out_dir/row['output'] or sink
+
+    identical rows are rendered once and written to every output,
+    a failed row is reported in its BatchResult.error and does not stop the batch
+
+    :param workers: render processes, 1 - in this process, None or 0 - all cores
+    :param sink: DirectorySink/ZipSink/TarSink (plate_output.py), every pdf is written as soon as it is done,
+                 DirectorySink(out_dir) if None
+    :param cache: RenderCache (render_cache.py), cached plates are not rendered, rendered ones are added,
+                  cache is evicted to its max_bytes at the end
+    :return: [BatchResult(line, output, error)] in rows order, line is 1-based data row number
+    """
+    if sink is None:
+        from plate_output import DirectorySink
+
+        sink = DirectorySink(out_dir)
+
+    results = []
+    groups = {}
+    for line, row in enumerate(rows, 1):
+        output = row.get('output')
+        try:
+            if not output:
+                raise ValueError('no output file')
+            if not isinstance(output, str):
+                raise ValueError(f'bad output {output!r}, expected file name')
+            key = row_key(row, default_wide)
+        except ValueError as e:
+            results.append(BatchResult(line, output, str(e)))
+            continue
+        results.append(BatchResult(line, output, None))
+        groups.setdefault(key, []).append(len(results) - 1)
+
+    def write(key, pdf, error):
+        for i in groups[key]:
+            if error:
+                results[i] = results[i]._replace(error=error)
+                continue
+            try:
+                sink.write(results[i].output, pdf)
+            except (OSError, ValueError) as e:
+                results[i] = results[i]._replace(error=str(e))
+
+    keys = list(groups)
+    if cache is not None:
+        misses = []
+        for key in keys:
+            pdf = cache.get(key)
+            if pdf is None:
+                misses.append(key)
+            else:
+                write(key, pdf, None)
+        if METRICS is not None:
+            METRICS.count('render_cache_hits', len(keys) - len(misses), plate='')
+            METRICS.count('render_cache_misses', len(misses), plate='')
+        keys = misses
+
+    if workers == 1:
+        rendered = ((index, *render_key(key)) for index, key in enumerate(keys))
+    else:
+        rendered = render_parallel(keys, workers=workers or None, chunksize=chunksize, ordered=False)
+
+    for index, pdf, error in rendered:
+        if cache is not None and pdf is not None:
+            cache.put(keys[index], pdf)
+        write(keys[index], pdf, error)
+
+    if cache is not None:
+        cache.evict()
+    return results
+
+
+def measure_rows(rows, default_wide: str = THIN) -> list:
+    """ final width and height of every manifest row plate, text is measured by glyph metrics (TextMetrics),
+    nothing is laid out or drawn, identical rows are measured once
+
+    :return: [PlateSize(line, output, plate, wide, width_mm, height_mm, error)] in rows order, mm to 0.1
+    """
+    sizes = []
+    measured = {}
+    for line, row in enumerate(rows, 1):
+        output = row.get('output')
+        try:
+            key = row_key(row, default_wide)
+            if key not in measured:
+                plate = plate_from_key(key)
+                measured[key] = (round(mm(plate.width), 1), round(mm(plate.height), 1))
+        except (KeyError, ValueError) as e:
+            sizes.append(PlateSize(line, output, row.get('plate'), row.get('wide'), None, None,
+                                   f'{type(e).__name__}: {e}'))
+            continue
+        sizes.append(PlateSize(line, output, key[0], key[1], *measured[key], None))
+    return sizes
+
+
+def render(row: dict, output_format: str = 'pdf', default_wide: str = THIN) -> bytes:
+    """ one plate of manifest row fields (see read_manifest) to bytes
+
+    a render shares nothing mutable with other renders (new plate and canvas, immutable specs,
+    read only glyph store, locked LAYOUT_CACHE and METRICS), so it may be called from many threads at once,
+    with pdf_mode invariant same row gives same bytes in any thread
+
+    :param output_format: pdf, svg or png (plate_preview.py)
+    :raise ValueError: bad row
+    """
+    return plate_bytes(plate_from_key(row_key(row, default_wide)), output_format)
+
+
+def plate_bytes(plate: 'BasePlate', output_format: str = 'pdf') -> bytes:
+    """
+    :param output_format: pdf, svg or png (plate_preview.py)
+    """
+    if output_format == 'pdf':
+        return plate.pdf().read()
+    from plate_preview import preview
+
+    return preview(plate, output_format)
+
+
+def render_key(key: tuple, output_format: str = 'pdf') -> tuple:
+    """
+    :param output_format: pdf, svg or png (plate_preview.py)
+    :return: (bytes, None) or (None, error message)
+    """
+    try:
+        return plate_bytes(plate_from_key(key), output_format), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+def _render_chunk(start: int, keys: list, output_format: str = 'pdf') -> tuple:
+    """
+    :return: ([(index, bytes, error)], raw metrics of this worker since last chunk or None)
+    """
+    rendered = [(start + i, *render_key(key, output_format)) for i, key in enumerate(keys)]
+    return rendered, METRICS.pop() if METRICS is not None else None
+
+
+def render_parallel(keys, workers: int = None, chunksize: int = 16, ordered: bool = True):
+    """ render plate keys (see plate_from_key) in a process pool
+
+    a worker loads the glyph paths once (TextPaths.path_dict, inherited on fork) and keeps them
+    for all its chunks, plates are sent as small key tuples and come back as pdf bytes,
+    render settings of this process are passed to workers (init_worker), not inherited
+
+    :param workers: processes, all cores if None
+    :param chunksize: keys per pool task
+    :param ordered: yield in keys order, else as soon as chunk is done
+    :return: generator of (index in keys, pdf bytes or None, error message or None)
+    """
+    from concurrent.futures import as_completed, ProcessPoolExecutor
+
+    keys = list(keys)
+    # workers record own metrics (from empty, not copies of the parent ones) and send them with every chunk
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(render_settings(), METRICS is not None)) as executor:
+        futures = [executor.submit(_render_chunk, start, keys[start:start + chunksize])
+                   for start in range(0, len(keys), chunksize)]
+        for future in futures if ordered else as_completed(futures):
+            rendered, raw_metrics = future.result()
+            if raw_metrics is not None and METRICS is not None:
+                METRICS.merge(raw_metrics)
+            yield from rendered
+
+
+# compression: zlib level of page streams, 0 - not compressed, None - reportlab default
+# precision: digits after point of coordinates (direct backend), None - BasePlate.direct_pdf decides
+# invariant: no creation date and random id, same input - same bytes (False - reportlab rl_config.invariant)
+PdfMode = namedtuple('PdfMode', 'compression precision invariant')
+
+PDF_MODES = {
+    'default': PdfMode(compression=None, precision=None, invariant=False),
+    # local hand-off to rip, cpu bound batches, direct backend with plate_canvas.PDF_PRECISION
+    'fast': PdfMode(compression=0, precision=3, invariant=False),
+    # archive/email, 0.01 pt is 3.5 µm on the plate
+    'compact': PdfMode(compression=9, precision=2, invariant=False),
+    'invariant': PdfMode(compression=None, precision=None, invariant=True),
+}
+
+
+def pdf_canvas(out, pagesize: tuple = None, text_forms: bool = False, header_forms: bool = False) -> 'PlateCanvas':
+    """ PlateCanvas of BasePlate.direct_pdf backend and BasePlate.pdf_mode output
+    """
+    from plate_canvas import PDF_PRECISION, PlateCanvas
+
+    mode = BasePlate.pdf_mode
+    kwargs = {} if pagesize is None else {'pagesize': pagesize}
+    return PlateCanvas(out, bottomup=0, text_forms=text_forms, header_forms=header_forms,
+                       direct=BasePlate.direct_pdf or mode.precision is not None,
+                       precision=PDF_PRECISION if mode.precision is None else mode.precision,
+                       compression=mode.compression, invariant=1 if mode.invariant else None, **kwargs)
 
 
 class BasePlate:
 
+    text_paths_class = None  # TextPaths if None, see use_numpy()
+    direct_pdf = False  # PlateCanvas direct backend, see --direct
+    pdf_mode = PDF_MODES['default']  # see --pdf_mode
+
     def __init__(self):
         self.margin = self.width = self.height = self.radius = 0
-        self.canvas = None
         self._init_margin()
         self._init_width()
         self._init_height()
@@ -240,13 +1002,17 @@ class BasePlate:
         """
         pass
 
-    def _draw_face(self):
+    def _draw_face(self, work_canvas: 'PlateCanvas'):
         """ must be override in children class
         """
         pass
 
-    def _draw_background(self):
-        self.canvas.roundRect(0, 0, self.width, self.height, self.radius, stroke=0, fill=1)
+    def _draw_background(self, work_canvas: 'PlateCanvas'):
+        work_canvas.roundRect(0, 0, self.width, self.height, self.radius, stroke=0, fill=1)
+
+    def text_paths(self, text: str, font: dict) -> 'TextPaths':
+        with _phase('layout', type(self).__name__):
+            return LAYOUT_CACHE.get(self.text_paths_class or TextPaths, text, font)
 
     @staticmethod
     def parse_house_number(house_num_str, regex_tuple):
@@ -257,79 +1023,131 @@ class BasePlate:
                 return match_res.groupdict()
         return None
 
+    def draw_page(self, work_canvas: 'PlateCanvas'):
+        """ draw plate on a new page of work_canvas (PlateCanvas or plate_preview.py canvas),
+        page is sized to the plate
+        """
+        with _phase('draw_page', type(self).__name__):
+            work_canvas.setPageSize((self.width, self.height))
+            self.draw(work_canvas)
+            work_canvas.showPage()
+
+    def draw(self, work_canvas: 'PlateCanvas'):
+        """ draw plate with its top left corner at (0, 0) of current work_canvas transform,
+        colors and transform are left changed (wrap in saveState/restoreState to draw more), page is not changed
+        """
+        work_canvas.setFillColor(work_canvas.background_color)
+        self._draw_background(work_canvas)
+
+        work_canvas.setFillColor(work_canvas.face_color)
+        work_canvas.setStrokeColor(work_canvas.face_color)
+        work_canvas.translate(self.margin, 0)
+
+        self._draw_face(work_canvas)
+
+        if METRICS is not None:
+            METRICS.count('plates', plate=type(self).__name__)
+
+    def write_pdf(self, out):
+        """ one page pdf of plate to out - file name or binary file object
+        """
+        work_canvas = pdf_canvas(out, (self.width, self.height))
+        self.draw_page(work_canvas)
+        with _phase('save', type(self).__name__):
+            work_canvas.save()
+
     def pdf(self):
         pdf = io.BytesIO()
-        self.canvas = canvas.Canvas(pdf, (self.width, self.height), bottomup=0)
+        self.write_pdf(pdf)
+        if METRICS is not None:
+            METRICS.count('output_bytes', pdf.tell(), type(self).__name__)
+        pdf.seek(0)
+        return pdf
 
-        self.canvas.setFillColor(COLOR_DARK_BLUE)
-        self._draw_background()
 
-        self.canvas.setFillColor(COLOR_WHITE)
-        self.canvas.setStrokeColor(COLOR_WHITE)
-        self.canvas.translate(self.margin, 0)
+def plates_pdf(plates, out=None, text_forms: bool = False, header_forms: bool = True):
+    """ many plates as pages of one pdf, every page sized to its plate
 
-        self._draw_face()
+    page streams are compressed as soon as the page is done, so a long generator of plates
+    costs memory of the compressed pages only,
+    street header of Vertical plates is drawn once per street and size (form xobject), pages of a street
+    draw the house number only
 
-        self.canvas.showPage()
-        self.canvas.save()
-        self.canvas = None
+    :param plates: iterable (or generator) of StreetName/StreetNumber/Vertical
+    :param out: file name or binary file object, BytesIO if None
+    :param text_forms: draw texts repeated on many pages (street type and name of StreetName plates) once as
+                       form xobjects (see PlateCanvas), saves about half of a name plate document
+    :param header_forms: draw every Vertical street header once per document as form xobject
+    :return: out, BytesIO is seeked to start
+    """
+    pdf = io.BytesIO() if out is None else out
+    work_canvas = pdf_canvas(pdf, text_forms=text_forms, header_forms=header_forms)
+    if work_canvas.compression != 0:
+        work_canvas.compress_pages()
+    for plate in plates:
+        plate.draw_page(work_canvas)
+    with _phase('save', 'plates_pdf'):
+        work_canvas.save()
+    if out is None:
+        if METRICS is not None:
+            METRICS.count('output_bytes', pdf.tell(), 'plates_pdf')
         pdf.seek(0)
-        return pdf
+    return pdf
 
 
 class StreetName(BasePlate):
 
     def __init__(self, street_type: str, street_name: str, street_translit: str, wide: str = THIN):
-        self.street_type_text_path = TextPaths(text=street_type, font=SIZES_PT[f'{wide}_street_type_font'])
-        self.street_name_text_path = TextPaths(text=street_name, font=SIZES_PT[f'{wide}_street_name_font'])
-        self.street_translit_text_path = TextPaths(text=street_translit, font=SIZES_PT[f'{wide}_street_translit_font'])
+        self.spec = layout_spec('name', wide)
+        self.street_type = street_type
+        self.street_name = street_name
+        self.street_translit = street_translit
         self.wide = wide
         super().__init__()
 
     def _init_margin(self):
-        self.margin = SIZES_PT[f'{self.wide}_margin']
+        self.margin = self.spec.margin
 
     def _init_width(self):
-        self.width = ((max([text_path.get_path_extents()[2] for text_path in [
-            self.street_translit_text_path, self.street_name_text_path, self.street_translit_text_path
+        self.width = ((max([measure_text(text, font).get_path_extents()[2] for text, font in [
+            (self.street_name, self.spec.name_font), (self.street_translit, self.spec.translit_font)
         ]])+self.margin*0.7)//self.margin+2)*self.margin
 
     def _init_height(self):
-        self.height = SIZES_PT[f'{self.wide}_height']
+        self.height = self.spec.height
 
     def _init_radius(self):
-        self.radius = SIZES_PT[f'{self.wide}_round_radius']
-
-    def _draw_face(self):
-        self._draw_street_type()
-        self._draw_street_name()
-        self._draw_line()
-        self._draw_street_translit()
-
-    def _draw_line(self):
-        self.canvas.saveState()
-        self.canvas.setLineWidth(SIZES_PT[f'{self.wide}_street_line_width'])
-        self.canvas.line(0, SIZES_PT[f'{self.wide}_street_line_bl'],
-                         self.width - SIZES_PT[f'{self.wide}_margin'] * 2, SIZES_PT[f'{self.wide}_street_line_bl'])
-        self.canvas.restoreState()
-
-    def _draw_street_type(self):
-        self.canvas.saveState()
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_street_type_bl'])
-        self.street_type_text_path.draw(self.canvas)
-        self.canvas.restoreState()
-
-    def _draw_street_name(self):
-        self.canvas.saveState()
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_street_name_bl'])
-        self.street_name_text_path.draw(self.canvas)
-        self.canvas.restoreState()
-
-    def _draw_street_translit(self):
-        self.canvas.saveState()
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_street_translit_bl'])
-        self.street_translit_text_path.draw(self.canvas)
-        self.canvas.restoreState()
+        self.radius = self.spec.radius
+
+    def _draw_face(self, work_canvas: 'PlateCanvas'):
+        self._draw_street_type(work_canvas)
+        self._draw_street_name(work_canvas)
+        self._draw_line(work_canvas)
+        self._draw_street_translit(work_canvas)
+
+    def _draw_line(self, work_canvas: 'PlateCanvas'):
+        work_canvas.saveState()
+        work_canvas.setLineWidth(self.spec.line_width)
+        work_canvas.line(0, self.spec.line_bl, self.width - self.spec.margin * 2, self.spec.line_bl)
+        work_canvas.restoreState()
+
+    def _draw_street_type(self, work_canvas: 'PlateCanvas'):
+        work_canvas.saveState()
+        work_canvas.translate(0, self.spec.type_bl)
+        self.text_paths(text=self.street_type, font=self.spec.type_font).draw(work_canvas)
+        work_canvas.restoreState()
+
+    def _draw_street_name(self, work_canvas: 'PlateCanvas'):
+        work_canvas.saveState()
+        work_canvas.translate(0, self.spec.name_bl)
+        self.text_paths(text=self.street_name, font=self.spec.name_font).draw(work_canvas)
+        work_canvas.restoreState()
+
+    def _draw_street_translit(self, work_canvas: 'PlateCanvas'):
+        work_canvas.saveState()
+        work_canvas.translate(0, self.spec.translit_bl)
+        self.text_paths(text=self.street_translit, font=self.spec.translit_font).draw(work_canvas)
+        work_canvas.restoreState()
 
 
 class StreetNumber(BasePlate):
@@ -340,133 +1158,129 @@ class StreetNumber(BasePlate):
         self.right_num = right_num
         self.wide = wide
         self.arrow = '_arrow' if self.left_num or self.right_num else ''
+        self.spec = layout_spec('number', wide, bool(self.arrow))
         super().__init__()
 
     def _init_margin(self):
-        self.margin = SIZES_PT[f'{self.wide}_margin']
+        self.margin = self.spec.margin
 
     def _init_width(self):
-        self.width = SIZES_PT[f'{self.wide}_house_number{self.arrow}_width'][min(len(self.house_num) - 1, 4)]
+        self.width = self.spec.widths[min(len(self.house_num) - 1, 4)]
 
     def _init_height(self):
-        self.height = SIZES_PT[f'{self.wide}_height']
+        self.height = self.spec.height
 
     def _init_radius(self):
-        self.radius = SIZES_PT[f'{self.wide}_round_radius']
+        self.radius = self.spec.radius
 
-    def _draw_face(self):
-        self._draw_number()
+    def _draw_face(self, work_canvas: 'PlateCanvas'):
+        self._draw_number(work_canvas)
         if self.left_num or self.right_num:
-            self._draw_arrows()
+            self._draw_arrows(work_canvas)
         if self.left_num:
-            self._draw_left_num()
+            self._draw_left_num(work_canvas)
         if self.right_num:
-            self._draw_right_num()
+            self._draw_right_num(work_canvas)
 
-    def _draw_number(self):
+    def _draw_number(self, work_canvas: 'PlateCanvas'):
 
         house_number_dict = self.parse_house_number(self.house_num, HOUSE_NUMBER_RE_TUPLE)
-        text_paths = {}
         house_number_width = 0
-        
+
         for key in sorted(house_number_dict.keys()):
-            font = SIZES_PT[f'{self.wide}_house_number{self.arrow}_font_{key}'] if key != SLASH else \
-                SIZES_PT[f'{self.wide}_house_number_slash_size']
-            text_paths[key] = TextPaths(house_number_dict[key], font)
-            house_number_width += text_paths[key].get_current_point()[0]
+            house_number_width += measure_text(house_number_dict[key], self.spec.fonts[key]).get_current_point()[0]
 
         width = self.width_without_margin
         translate_x = (width - house_number_width)/2
 
-        self.canvas.saveState()
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_house_number{self.arrow}_bl'])
+        work_canvas.saveState()
+        work_canvas.translate(0, self.spec.bl)
 
         if translate_x >= 0:
-            self.canvas.translate(translate_x, 0)
+            work_canvas.translate(translate_x, 0)
         else:
             scale = width/house_number_width
         #         work_canvas.translate(SIZES_PT[f'{wide}_margin']*(1-scale), 0)
-            self.canvas.scale(scale, scale)
+            work_canvas.scale(scale, scale)
 
         after_slash = False
-        for key in text_paths.keys():
+        for key in sorted(house_number_dict.keys()):
+            text_path = self.text_paths(house_number_dict[key], self.spec.fonts[key])
             if after_slash:
-                self.canvas.translate(-text_paths[key].get_path_extents()[0], 0)
+                work_canvas.translate(-text_path.get_path_extents()[0], 0)
                 after_slash = False
-            text_paths[key].draw(self.canvas)
-            self.canvas.translate(text_paths[key].get_current_point()[0], 0)
+            text_path.draw(work_canvas)
+            work_canvas.translate(text_path.get_current_point()[0], 0)
             if key == SLASH:
                 after_slash = True
 
-        self.canvas.restoreState()
+        work_canvas.restoreState()
 
-    def _draw_arrow(self, x: float, y: float, k: int, length: float, half_height: float):
+    def _draw_arrow(self, work_canvas: 'PlateCanvas', x: float, y: float, k: int, length: float,
+                    half_height: float):
         """ k= -1 or 1
         """
-        p = self.canvas.beginPath()
-        p.moveTo(x, y)
-        p.lineTo(x + k * length, y + half_height)
-        p.lineTo(x + k * length, y - half_height)
-        p.close()
-        self.canvas.drawPath(p, fill=1, stroke=0)
-
-    def _draw_arrows(self):
-        arrow_size = SIZES_PT[f'{self.wide}_house_number_arrow_arrow_size']
-        base_line = SIZES_PT[f'{self.wide}_house_number_arrow_arrow_bl']
+        work_canvas.fill_operations((
+            ('moveTo', (x, y)),
+            ('lineTo', (x + k * length, y + half_height)),
+            ('lineTo', (x + k * length, y - half_height)),
+            ('close', ()),
+        ))
+
+    def _draw_arrows(self, work_canvas: 'PlateCanvas'):
+        arrow_size = self.spec.arrow_size
+        base_line = self.spec.arrow_bl
         width = self.width_without_margin
 
-        self.canvas.saveState()
-        self.canvas.setLineWidth(arrow_size['line_width'])
+        work_canvas.saveState()
+        work_canvas.setLineWidth(arrow_size['line_width'])
 
         if self.left_num:
-            self._draw_arrow(0, base_line, 1, arrow_size['length'], arrow_size['half_height'])
-            self.canvas.line(arrow_size['length'], base_line, width/2-arrow_size['half_space'], base_line)
+            self._draw_arrow(work_canvas, 0, base_line, 1, arrow_size['length'], arrow_size['half_height'])
+            work_canvas.line(arrow_size['length'], base_line, width/2-arrow_size['half_space'], base_line)
         else:
-            self.canvas.line(0, base_line, width/2+arrow_size['half_space'], base_line)
+            work_canvas.line(0, base_line, width/2+arrow_size['half_space'], base_line)
 
         if self.right_num:
-            self._draw_arrow(width, base_line, -1, arrow_size['length'], arrow_size['half_height'])
-            self.canvas.line(width/2 + arrow_size['half_space'], base_line, width - arrow_size['length'], base_line)
+            self._draw_arrow(work_canvas, width, base_line, -1, arrow_size['length'], arrow_size['half_height'])
+            work_canvas.line(width/2 + arrow_size['half_space'], base_line, width - arrow_size['length'], base_line)
         else:
-            self.canvas.line(width/2 - arrow_size['half_space'], base_line, width, base_line)
+            work_canvas.line(width/2 - arrow_size['half_space'], base_line, width, base_line)
 
-        self.canvas.restoreState()
+        work_canvas.restoreState()
 
-    def _draw_left_num(self):
+    def _draw_left_num(self, work_canvas: 'PlateCanvas'):
         left_num_dict = self.parse_house_number(self.left_num, HOUSE_NUMBER_ARROW_RE_TUPLE)
 
-        self.canvas.saveState()
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_house_number_arrow_number_bl'])
+        work_canvas.saveState()
+        work_canvas.translate(0, self.spec.number_bl)
 
-        lvl_a1_path = TextPaths(left_num_dict[LVL_A1], SIZES_PT[f'{self.wide}_house_number_arrow_number_font_{LVL_A1}'])
-        lvl_a1_path.draw(self.canvas)
+        lvl_a1_path = self.text_paths(left_num_dict[LVL_A1], self.spec.number_fonts[LVL_A1])
+        lvl_a1_path.draw(work_canvas)
 
         if left_num_dict[LVL_A2C]:
-            lvl_a2c_path = TextPaths(left_num_dict[LVL_A2C],
-                                     SIZES_PT[f'{self.wide}_house_number_arrow_number_font_{LVL_A2C}'])
-            self.canvas.translate(lvl_a1_path.get_current_point()[0], 0)
-            lvl_a2c_path.draw(self.canvas)
+            lvl_a2c_path = self.text_paths(left_num_dict[LVL_A2C], self.spec.number_fonts[LVL_A2C])
+            work_canvas.translate(lvl_a1_path.get_current_point()[0], 0)
+            lvl_a2c_path.draw(work_canvas)
 
-        self.canvas.restoreState()
+        work_canvas.restoreState()
 
-    def _draw_right_num(self):
+    def _draw_right_num(self, work_canvas: 'PlateCanvas'):
 
         right_num_dict = self.parse_house_number(self.right_num, HOUSE_NUMBER_ARROW_RE_TUPLE)
 
-        self.canvas.saveState()
-        self.canvas.translate(self.width_without_margin, SIZES_PT[f'{self.wide}_house_number_arrow_number_bl'])
+        work_canvas.saveState()
+        work_canvas.translate(self.width_without_margin, self.spec.number_bl)
 
         if right_num_dict[LVL_A2C]:
-            lvl_a2c_path = TextPaths(right_num_dict[LVL_A2C],
-                                     SIZES_PT[f'{self.wide}_house_number_arrow_number_font_{LVL_A2C}'])
-            self.canvas.translate(-lvl_a2c_path.get_current_point()[0], 0)
-            lvl_a2c_path.draw(self.canvas)
+            lvl_a2c_path = self.text_paths(right_num_dict[LVL_A2C], self.spec.number_fonts[LVL_A2C])
+            work_canvas.translate(-lvl_a2c_path.get_current_point()[0], 0)
+            lvl_a2c_path.draw(work_canvas)
 
-        lvl_a1_path = TextPaths(right_num_dict[LVL_A1],
-                                SIZES_PT[f'{self.wide}_house_number_arrow_number_font_{LVL_A1}'])
-        self.canvas.translate(-lvl_a1_path.get_current_point()[0], 0)
-        lvl_a1_path.draw(self.canvas)
-        self.canvas.restoreState()
+        lvl_a1_path = self.text_paths(right_num_dict[LVL_A1], self.spec.number_fonts[LVL_A1])
+        work_canvas.translate(-lvl_a1_path.get_current_point()[0], 0)
+        lvl_a1_path.draw(work_canvas)
+        work_canvas.restoreState()
 
 
 class Vertical(BasePlate):
@@ -476,114 +1290,173 @@ class Vertical(BasePlate):
         self.street_translit = street_translit
         self.house_num = house_num
         self.wide = wide
+        self.spec = layout_spec('vertical', wide)
         super().__init__()
 
 
     def _init_margin(self):
-        self.margin = SIZES_PT[f'{self.wide}_vertical_margin']
+        self.margin = self.spec.margin
 
     def _init_width(self):
-        self.width = SIZES_PT[f'{self.wide}_vertical_width']
+        self.width = self.spec.width
 
     def _init_height(self):
-        self.height = SIZES_PT[f'{self.wide}_vertical_height']
+        self.height = self.spec.height
 
     def _init_radius(self):
-        self.radius = SIZES_PT[f'{self.wide}_round_radius']
-
-    def _draw_face(self):
-        self._draw_street_type()
-        self._draw_street_name()
-        self._draw_line()
-        self._draw_translit()
-        self._draw_number()
-
-    def _draw_street_type(self):
-        self.canvas.saveState()
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_street_type_bl'])
-
-        street_type_text_path = TextPaths(text=self.street_type,
-                                          font=SIZES_PT[f'{self.wide}_vertical_street_type_font'])
-        street_type_text_path.draw(self.canvas)
-
-    def _draw_street_name(self):
-        street_name_text_path = TextPaths(text=self.street_name,
-                                          font=SIZES_PT[f'{self.wide}_vertical_street_name_font'])
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_street_name_translate'])
-        if street_name_text_path.get_path_extents()[2] < self.width_without_margin:
-            street_name_text_path.draw(self.canvas)
+        self.radius = self.spec.radius
+
+    def _draw_face(self, work_canvas: 'PlateCanvas'):
+        work_canvas.saveState()
+        if getattr(work_canvas, 'header_forms', False):
+            # same on every house of the street, plate (without margin) is bbox
+            key = ('vertical', self.wide, self.street_type, self.street_name, self.street_translit)
+            bbox = (-self.margin, 0, self.width - self.margin, self.height)
+            with _phase('header_form', type(self).__name__):
+                work_canvas.doForm(work_canvas.header_form(key, bbox, self._draw_header))
+        else:
+            self._draw_header(work_canvas)
+        work_canvas.restoreState()
+        self._draw_number(work_canvas)
+
+    def _draw_header(self, work_canvas: 'PlateCanvas'):
+        # street type, name, line and translit are placed one under another by translate (and scale) of one state
+        self._draw_street_type(work_canvas)
+        self._draw_street_name(work_canvas)
+        self._draw_line(work_canvas)
+        self._draw_translit(work_canvas)
+
+    def _draw_street_type(self, work_canvas: 'PlateCanvas'):
+        work_canvas.translate(0, self.spec.type_bl)
+
+        street_type_text_path = self.text_paths(text=self.street_type, font=self.spec.type_font)
+        street_type_text_path.draw(work_canvas)
+
+    def _draw_street_name(self, work_canvas: 'PlateCanvas'):
+        work_canvas.translate(0, self.spec.name_translate)
+        if measure_text(self.street_name, self.spec.name_font).get_path_extents()[2] < self.width_without_margin:
+            self.text_paths(text=self.street_name, font=self.spec.name_font).draw(work_canvas)
         else:
-            str_list = textwrap.wrap(self.street_name, width=SIZES_PT[f'{self.wide}_vertical_street_name_max_char'],
-                                     break_long_words=False)
-
-            str_path_list = [TextPaths(text=s,
-                                       font=SIZES_PT[f'{self.wide}_vertical_street_name_font']) for s in str_list]
-            scale = min(1, self.width_without_margin / max([path.get_path_extents()[2] for path in str_path_list]))
-
-            self.canvas.scale(scale, scale)
-            for path in str_path_list:
-                path.draw(self.canvas)
-                if path != str_path_list[-1]:
-                    self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_street_name_font']['leading'])
-            self.canvas.scale(1, 1)
-
-    def _draw_line(self):
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_street_line_translate'])
-        self.canvas.setLineWidth(SIZES_PT[f'{self.wide}_vertical_street_line_width'])
-        self.canvas.line(0, 0, self.width_without_margin, 0)
-
-    def _draw_translit(self):
-        street_translit_text_path = TextPaths(text=self.street_translit,
-                                              font=SIZES_PT[f'{self.wide}_vertical_street_translit_font'])
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_street_translit_translate'])
-        if street_translit_text_path.get_path_extents()[2] < self.width_without_margin:
-            street_translit_text_path.draw(self.canvas)
+            str_list = textwrap.wrap(self.street_name, width=self.spec.name_max_char, break_long_words=False)
+
+            scale = min(1, self.width_without_margin / max([
+                measure_text(s, self.spec.name_font).get_path_extents()[2] for s in str_list]))
+            str_path_list = [self.text_paths(text=s, font=self.spec.name_font) for s in str_list]
+
+            work_canvas.scale(scale, scale)
+            for path in str_path_list[:-1]:
+                path.draw(work_canvas)
+                work_canvas.translate(0, self.spec.name_font['leading'])
+            str_path_list[-1].draw(work_canvas)
+            work_canvas.scale(1, 1)
+
+    def _draw_line(self, work_canvas: 'PlateCanvas'):
+        work_canvas.translate(0, self.spec.line_translate)
+        work_canvas.setLineWidth(self.spec.line_width)
+        work_canvas.line(0, 0, self.width_without_margin, 0)
+
+    def _draw_translit(self, work_canvas: 'PlateCanvas'):
+        work_canvas.translate(0, self.spec.translit_translate)
+        if measure_text(self.street_translit, self.spec.translit_font).get_path_extents()[2] \
+                < self.width_without_margin:
+            self.text_paths(text=self.street_translit, font=self.spec.translit_font).draw(work_canvas)
         else:
-            str_list = textwrap.wrap(self.street_translit,
-                                     width=SIZES_PT[f'{self.wide}_vertical_street_translit_max_char'],
-                                     break_long_words=False)
-
-            str_path_list = [TextPaths(text=s,
-                                       font=SIZES_PT[f'{self.wide}_vertical_street_translit_font']) for s in str_list]
-            scale = min(1, self.width_without_margin / max([path.get_path_extents()[2] for path in str_path_list]))
-            self.canvas.scale(scale, scale)
-            for path in str_path_list:
-                path.draw(self.canvas)
-                if path != str_path_list[-1]:
-                    self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_street_translit_font']['leading'])
-            self.canvas.scale(1, 1)
-
-        self.canvas.restoreState()
-
-    def _draw_number(self):
+            str_list = textwrap.wrap(self.street_translit, width=self.spec.translit_max_char, break_long_words=False)
+
+            scale = min(1, self.width_without_margin / max([
+                measure_text(s, self.spec.translit_font).get_path_extents()[2] for s in str_list]))
+            str_path_list = [self.text_paths(text=s, font=self.spec.translit_font) for s in str_list]
+            work_canvas.scale(scale, scale)
+            for path in str_path_list[:-1]:
+                path.draw(work_canvas)
+                work_canvas.translate(0, self.spec.translit_font['leading'])
+            str_path_list[-1].draw(work_canvas)
+            work_canvas.scale(1, 1)
+
+    def _draw_number(self, work_canvas: 'PlateCanvas'):
         house_number_dict = self.parse_house_number(self.house_num, HOUSE_NUMBER_RE_TUPLE)
-        text_paths = {}
         house_number_width = 0
 
         for key in sorted(house_number_dict.keys()):
-            font = SIZES_PT[f'{self.wide}_vertical_house_number_font_{key}'] if key != SLASH else \
-                SIZES_PT[f'{self.wide}_vertical_house_number_slash_size']
-            text_paths[key] = TextPaths(house_number_dict[key], font)
-            house_number_width += text_paths[key].get_current_point()[0]
+            house_number_width += measure_text(house_number_dict[key], self.spec.fonts[key]).get_current_point()[0]
 
-        self.canvas.saveState()
+        work_canvas.saveState()
 
-        self.canvas.translate(0, SIZES_PT[f'{self.wide}_vertical_house_number_bl'])
+        work_canvas.translate(0, self.spec.number_bl)
         if house_number_width > self.width_without_margin:
             scale = self.width_without_margin / house_number_width
-            self.canvas.scale(scale, scale)
+            work_canvas.scale(scale, scale)
 
         after_slash = False
         for key in sorted(house_number_dict.keys()):
+            text_path = self.text_paths(house_number_dict[key], self.spec.fonts[key])
             if after_slash:
-                self.canvas.translate(-text_paths[key].get_path_extents()[0], 0)
+                work_canvas.translate(-text_path.get_path_extents()[0], 0)
                 after_slash = False
-            text_paths[key].draw(self.canvas)
-            self.canvas.translate(text_paths[key].get_current_point()[0], 0)
+            text_path.draw(work_canvas)
+            work_canvas.translate(text_path.get_current_point()[0], 0)
             if key == SLASH:
                 after_slash = True
 
-        self.canvas.restoreState()
+        work_canvas.restoreState()
+
+
+PLATE_CLASSES = {
+    'name': StreetName,
+    'number': StreetNumber,
+    'vertical': Vertical,
+}
+
+
+class LayoutCache:
+    """ LRU cache of laid out TextPaths by (text, face, size), shared by all plates and threads
+
+    cached TextPaths are shared by plates and must not be changed,
+    text is laid out outside of the lock, threads missing the same text at once lay it out each (same result)
+    """
+
+    def __init__(self, capacity: int = 4096):
+        """
+        :param capacity: max cached TextPaths, 0 - no cache
+        """
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, text_paths_class: type, text: str, font: dict) -> 'TextPaths':
+        key = (text, font['face'], font['size'])
+        with self._lock:
+            text_paths = self._cache.get(key)
+            if text_paths is not None:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return text_paths
+            self.misses += 1
+
+        text_paths = text_paths_class(text, font)
+        if self.capacity > 0:
+            with self._lock:
+                self._cache[key] = text_paths
+                if len(self._cache) > self.capacity:
+                    self._cache.popitem(last=False)
+                    self.evictions += 1
+        return text_paths
+
+    def clear(self):
+        """ drop cached TextPaths and reset counters
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._cache), 'capacity': self.capacity,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+LAYOUT_CACHE = LayoutCache()
 
 
 class TextPaths:
@@ -594,13 +1467,15 @@ class TextPaths:
     }
     """
 
-    path_dict = _load_path()
+    path_dict = LazyPaths()
+    _pdf_code = None  # (precision, pdf operators of operations), see pdf_code()
 
     def __init__(self, text: str, font: dict):
         self.text = text
         self.face = font['face']
         self.size = font['size']
         self.operations = []
+        self.glyphs = []
         self.current_point = (0, 0)
         self.path_extents = (0, 0, 0, 0)
         self._init_path()
@@ -608,9 +1483,13 @@ class TextPaths:
     def _init_path(self):
         for char in self.text:
             self._append_char(char)
+        self.operations = tuple(self.operations)
+        self.glyphs = tuple(self.glyphs)
 
     def _append_char(self, char: str):
-        char_operations, char_current_point, char_path_extends = self.path_dict[f"{self.face}_{self.size}_{char}"]
+        key = f"{self.face}_{self.size}_{char}"
+        char_operations, char_current_point, char_path_extends = self.path_dict[key]
+        self.glyphs.append((key, self.current_point))
         self._appends_operations(char_operations)
         self._calc_path_extends(char_path_extends)
         self._calc_current_point(char_current_point)
@@ -640,18 +1519,34 @@ class TextPaths:
         """
         return tuple(x + y for x, y in zip(point*(len(points)//2), points))
 
-    def draw(self, work_canvas: canvas.Canvas):
-        p = work_canvas.beginPath()
-        for type_op, points in self.operations:
-            if type_op == 'moveTo':
-                p.moveTo(*points)
-            elif type_op == 'lineTo':
-                p.lineTo(*points)
-            elif type_op == 'curveTo':
-                p.curveTo(*points)
-            elif type_op == 'close':
-                p.close()
-        work_canvas.drawPath(p, fill=1, stroke=0)
+    def draw(self, work_canvas: 'PlateCanvas'):
+        if METRICS is not None:
+            METRICS.count('glyphs', len(self.glyphs))
+        with _phase('draw_text'):
+            if getattr(work_canvas, 'text_forms', False):
+                name = work_canvas.text_form(self)
+                if name:
+                    work_canvas.doForm(name)
+                    return
+            if getattr(work_canvas, 'direct', False):
+                work_canvas.fill_code(self.pdf_code(work_canvas.precision))
+                return
+            if getattr(work_canvas, 'preview', False):
+                work_canvas.fill_text_paths(self)
+                return
+            from plate_canvas import build_path
+
+            p = build_path(work_canvas, self.operations)
+            work_canvas.drawPath(p, fill=1, stroke=0)
+
+    def pdf_code(self, precision: int) -> str:
+        """ pdf path operators of the text, made once (TextPaths are shared by LAYOUT_CACHE)
+        """
+        if self._pdf_code is None or self._pdf_code[0] != precision:
+            from plate_canvas import operations_code
+
+            self._pdf_code = (precision, operations_code(self.operations, precision))
+        return self._pdf_code[1]
 
     def get_path_extents(self):
         """
@@ -672,6 +1567,48 @@ class TextPaths:
         return self.current_point
 
 
+class TextMetrics:
+    """ get_current_point() and get_path_extents() of text, same as TextPaths gives,
+    from glyph advances and boxes only (no outlines are read or laid out), for width and fit decisions
+    """
+
+    path_dict = TextPaths.path_dict
+
+    def __init__(self, text: str, font: dict):
+        self.text = text
+        face, size = font['face'], font['size']
+        metrics = self.path_dict.metrics
+        x, y = 0, 0
+        x1 = y1 = x2 = y2 = 0
+        for char in text:
+            (dx, dy), (char_x1, char_y1, char_x2, char_y2) = metrics(f"{face}_{size}_{char}")
+            x1, y1 = min(x1, x + char_x1), min(y1, y + char_y1)
+            x2, y2 = max(x2, x + char_x2), max(y2, y + char_y2)
+            x, y = x + dx, y + dy
+        self.current_point = (x, y)
+        self.path_extents = (x1, y1, x2, y2)
+
+    def get_path_extents(self):
+        """
+        :return: (x1, y1, x2, y2) as TextPaths.get_path_extents()
+        """
+        return self.path_extents
+
+    def get_current_point(self):
+        """
+        :return: (x, y) as TextPaths.get_current_point()
+        """
+        return self.current_point
+
+
+def measure_text(text: str, font: dict) -> TextMetrics:
+    """ size of text in font without layout, O(len(text)) glyph metrics lookups
+    """
+    return TextMetrics(text, font)
+
+
 if __name__ == '__main__':
+    # text_paths_numpy imports address_plate, it must get this module and not a second copy
+    sys.modules.setdefault('address_plate', sys.modules[__name__])
     main()
 
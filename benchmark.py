@@ -0,0 +1,365 @@
+""" address plate benchmarks on fixed corpora, offline, results are printed as json
+
+everything (latency per plate type, batch throughput, cold start, peak rss):
+    python3 benchmark.py all --output before.json
+    python3 benchmark.py all --output after.json
+    python3 benchmark.py compare before.json after.json
+cold start of single number plate (as web form calls the cli), fails over COLD_START_BUDGETS of glyph source:
+    python3 benchmark.py cold_start
+every plate type at every plate size (address_plate.PLATE_SIZES), e.g. glyph store before and after optimize:
+    ADDRESS_PLATE_GLYPHS=paths.glyphs python3 benchmark.py --output before.json sizes
+    ADDRESS_PLATE_GLYPHS=optimized.glyphs python3 benchmark.py --output after.json sizes
+    python3 benchmark.py compare before.json after.json
+time and size of every pdf output mode (address_plate.PDF_MODES) per plate type:
+    python3 benchmark.py pdf_modes
+plates rendered by many threads at once (address_plate.render) are the same bytes as one by one, fails if not:
+    python3 benchmark.py threads --plates 2000 --threads 8
+"""
+import address_plate
+from argparse import ArgumentParser
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ADDRESS_PLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'address_plate.py')
+
+# s, interpreter start + imports + glyphs + render of a number plate, per glyph source (address_plate._load_path),
+# best of 10 runs measured 0.14-0.19 s of glyph store and 0.19-0.27 s of paths.pkl (whole pickle is loaded),
+# about 0.12 s of it is interpreter start and reportlab import (with PIL), so budgets are measured + 30%
+COLD_START_BUDGETS = {'store': 0.25, 'pickle': 0.35}
+COLD_START_ARGS = ('number', '--house_num', '12')
+
+# (street_type, street_name, street_translit)
+STREETS = (
+    ('вулиця', 'Хорива', 'Khoryva vulytsia'),
+    ('вулиця', 'Омеляновича-Павленка', 'Omelyanovycha-Pavlenka vulytsia'),
+    ('вулиця', 'Іоанна Павла ІІ', 'Ioanna Pavla Druhoho vulytsia'),
+    ('проспект', 'Перемоги', 'Peremohy avenue'),
+    ('провулок', 'Лабораторний', 'Laboratornyi provulok'),
+    ('бульвар', 'Тараса Шевченка', 'Tarasa Shevchenka bulvar'),
+    ('площа', 'Контрактова', 'Kontraktova ploshcha'),
+    ('вулиця', 'Велика Васильківська', 'Velyka Vasylkivska vulytsia'),
+    ('набережна', 'Дніпровська', 'Dniprovska naberezhna'),
+    ('вулиця', 'Січових Стрільців', 'Sichovykh Striltsiv vulytsia'),
+    ('узвіз', 'Андріївський', 'Andriivskyi uzviz'),
+    ('вулиця', 'Академіка Заболотного', 'Akademika Zabolotnoho vulytsia'),
+)
+
+# every shape of HOUSE_NUMBER_RE_TUPLE
+HOUSE_NUMBERS = (
+    '1', '7', '25', '148', '10-12', '2-4',
+    '7Б', '12А', '3АБ', '10-12В',
+    '25/3', '5/4А', '117/21', '1-3/2Б',
+    '3 к2', '10-12 к1',
+)
+
+# every shape of HOUSE_NUMBER_ARROW_RE_TUPLE, (left_num, right_num)
+ARROW_NUMBERS = (('14', None), (None, '12А'), ('8-10', '4'), ('21Б', '17'))
+
+
+def plate_cases(sizes: tuple = (address_plate.THIN, address_plate.WIDE)) -> dict:
+    """ {case name: [plate key (see address_plate.plate_from_key)]} for every plate type and size
+    """
+    cases = {}
+    for wide in sizes:
+        cases[f'name_{wide}'] = [('name', wide, *street) for street in STREETS]
+        cases[f'number_{wide}'] = [('number', wide, house_num, None, None) for house_num in HOUSE_NUMBERS]
+        cases[f'number_arrow_{wide}'] = [('number', wide, house_num, *ARROW_NUMBERS[i % len(ARROW_NUMBERS)])
+                                         for i, house_num in enumerate(HOUSE_NUMBERS)]
+        cases[f'vertical_{wide}'] = [('vertical', wide, *STREETS[i % len(STREETS)], house_num)
+                                     for i, house_num in enumerate(HOUSE_NUMBERS)]
+    return cases
+
+
+def latency(repeat: int = 5, sizes: tuple = (address_plate.THIN, address_plate.WIDE)) -> dict:
+    """ time of one plate (init + pdf) per case, layout cache is cleared before every case
+
+    :return: {case: {'plates': n, 'mean_ms', 'median_ms', 'p95_ms', 'bytes'}}
+    """
+    result = {}
+    for case, keys in plate_cases(sizes).items():
+        address_plate.LAYOUT_CACHE.clear()
+        times = []
+        size = 0
+        for _ in range(repeat):
+            for key in keys:
+                start = time.perf_counter()
+                size += len(address_plate.plate_from_key(key).pdf().getvalue())
+                times.append(time.perf_counter() - start)
+        times.sort()
+        result[case] = {'plates': len(times),
+                        'mean_ms': statistics.fmean(times) * 1000,
+                        'median_ms': statistics.median(times) * 1000,
+                        'p95_ms': times[int(len(times) * 0.95)] * 1000,
+                        'bytes': size // len(times)}
+    return result
+
+
+def pdf_modes(repeat: int = 5) -> dict:
+    """ latency() of every address_plate.PDF_MODES, and whether two renders of a plate are byte-identical
+
+    :return: {mode: {'identical': bool, case: {'plates', 'mean_ms', 'median_ms', 'p95_ms', 'bytes'}}}
+    """
+    mode = address_plate.BasePlate.pdf_mode
+    result = {}
+    try:
+        for name, pdf_mode in address_plate.PDF_MODES.items():
+            address_plate.BasePlate.pdf_mode = pdf_mode
+            key = plate_cases()['vertical_thin'][0]
+            first = address_plate.plate_from_key(key).pdf().getvalue()
+            # creation date is in seconds
+            time.sleep(1)
+            result[name] = {'identical': first == address_plate.plate_from_key(key).pdf().getvalue(),
+                            **latency(repeat)}
+    finally:
+        address_plate.BasePlate.pdf_mode = mode
+    return result
+
+
+class _NullSink:
+
+    def write(self, name: str, data: bytes):
+        pass
+
+    def close(self):
+        pass
+
+
+def district_keys(rows: int) -> list:
+    """ street sorted district run: per street name plates, then vertical and number plate
+    of every house in all HOUSE_NUMBERS shapes, number plates repeat on every street as in real runs
+    """
+    shapes = ('{}', '{}Б', '{}/3', '{}/4А', '{} к2', '{}-{}')
+    keys = []
+    for street_index in range(rows):
+        street = STREETS[street_index % len(STREETS)]
+        wide = address_plate.WIDE if street_index // len(STREETS) % 2 else address_plate.THIN
+        keys.append(('name', wide, *street))
+        for house in range(1, 301):
+            house_num = shapes[house % len(shapes)].format(house, house + 2)
+            keys.append(('vertical', wide, *street, house_num))
+            keys.append(('number', wide, house_num, *ARROW_NUMBERS[house % len(ARROW_NUMBERS)])
+                        if house % 3 == 0 else ('number', wide, house_num, None, None))
+            if len(keys) >= rows:
+                return keys[:rows]
+    return keys
+
+
+def throughput(rows: int = 2000, workers: int = 1) -> dict:
+    """ render_batch of district_keys manifest, outputs are dropped
+
+    :return: {'rows', 'unique', 'workers', 'seconds', 'plates_per_second'}
+    """
+    keys = district_keys(rows)
+    manifest = [dict(zip(('plate', 'wide') + address_plate.PLATE_FIELDS[key[0]], key), output=f'{i}.pdf')
+                for i, key in enumerate(keys)]
+    address_plate.LAYOUT_CACHE.clear()
+    start = time.perf_counter()
+    results = address_plate.render_batch(manifest, workers=workers, sink=_NullSink())
+    seconds = time.perf_counter() - start
+    errors = [result.error for result in results if result.error]
+    if errors:
+        raise RuntimeError(f'{len(errors)} rows failed, first: {errors[0]}')
+    return {'rows': len(keys), 'unique': len(set(keys)), 'workers': workers, 'seconds': seconds,
+            'plates_per_second': len(keys) / seconds}
+
+
+def threads(plates: int = 2000, thread_count: int = 8, layout_cache: int = 64) -> dict:
+    """ district_keys rows rendered by address_plate.render one by one, then by threads in shuffled order,
+    invariant pdf mode, small layout cache so threads evict each other's layouts
+
+    :return: {'plates', 'threads', 'gil', 'serial_seconds', 'threads_seconds', 'speedup', 'mismatches'}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import random
+
+    rows = [dict(zip(('plate', 'wide') + address_plate.PLATE_FIELDS[key[0]], key)) for key in district_keys(plates)]
+    mode, capacity = address_plate.BasePlate.pdf_mode, address_plate.LAYOUT_CACHE.capacity
+    address_plate.BasePlate.pdf_mode = address_plate.PDF_MODES['invariant']
+    address_plate.LAYOUT_CACHE.capacity = layout_cache
+    try:
+        address_plate.LAYOUT_CACHE.clear()
+        start = time.perf_counter()
+        expected = [address_plate.render(row) for row in rows]
+        serial_seconds = time.perf_counter() - start
+
+        order = list(range(len(rows)))
+        random.Random(0).shuffle(order)
+        address_plate.LAYOUT_CACHE.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(thread_count) as executor:
+            rendered = list(executor.map(lambda i: address_plate.render(rows[i]), order))
+        threads_seconds = time.perf_counter() - start
+    finally:
+        address_plate.BasePlate.pdf_mode = mode
+        address_plate.LAYOUT_CACHE.capacity = capacity
+    mismatches = sum(data != expected[i] for i, data in zip(order, rendered))
+    gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return {'plates': len(rows), 'threads': thread_count, 'gil': gil_enabled() if gil_enabled else True,
+            'serial_seconds': serial_seconds, 'threads_seconds': threads_seconds,
+            'speedup': serial_seconds / threads_seconds, 'mismatches': mismatches}
+
+
+def peak_rss() -> int:
+    """ peak rss of this process, KiB
+    """
+    try:
+        with open('/proc/self/status') as f:
+            return int(next(line.split()[1] for line in f if line.startswith('VmHWM')))
+    except (OSError, StopIteration):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(ADDRESS_PLATE)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'layout_cache': address_plate.LAYOUT_CACHE.capacity, 'glyphs': address_plate.GLYPH_STORE_PATH,
+            'text_paths': (address_plate.BasePlate.text_paths_class or address_plate.TextPaths).__name__,
+            'direct_pdf': address_plate.BasePlate.direct_pdf,
+            'pdf_mode': address_plate.BasePlate.pdf_mode._asdict()}
+
+
+def run_all(repeat: int = 5, rows: int = 2000, workers: int = 1) -> dict:
+    result = {'environment': _environment(),
+              'latency': latency(repeat),
+              'throughput': throughput(rows, workers),
+              'cold_start': cold_start()}
+    result['peak_rss_kib'] = peak_rss()
+    return result
+
+
+def _flatten(data: dict, prefix: str = '') -> dict:
+    flat = {}
+    for name, value in data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{name}'] = value
+    return flat
+
+
+def compare(before: dict, after: dict) -> dict:
+    """ {metric: {'before', 'after', 'change'}}, change is after/before - 1
+    """
+    before, after = _flatten(before), _flatten(after)
+    return {name: {'before': before[name], 'after': after[name],
+                   'change': after[name] / before[name] - 1 if before[name] else None}
+            for name in before if name in after and not name.startswith('environment.')}
+
+
+def _import_time(stderr: str) -> float:
+    """ sum of cumulative time of top level imports from -X importtime output, s
+    """
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit() and not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1e6
+
+
+def cold_start(repeat: int = 10, args: tuple = COLD_START_ARGS) -> dict:
+    """ best of repeat fresh runs of address_plate.py
+
+    :return: {'wall': s, 'import': s, 'glyphs': 'store' or 'pickle', 'budget': s}
+    """
+    glyphs = 'store' if 'ADDRESS_PLATE_GLYPHS' in os.environ or os.path.exists(address_plate.GLYPH_STORE_PATH) \
+        else 'pickle'
+    walls = []
+    imports = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run = subprocess.run([sys.executable, '-X', 'importtime', ADDRESS_PLATE, *args],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+        walls.append(time.perf_counter() - start)
+        imports.append(_import_time(run.stderr))
+    return {'wall': min(walls), 'import': min(imports), 'glyphs': glyphs, 'budget': COLD_START_BUDGETS[glyphs]}
+
+
+def _load_json(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--output', help='Json file, stdout if not set', type=str)
+    parser.add_argument('--numpy', help='Numpy text layout', action='store_true')
+    parser.add_argument('--direct', help='Direct pdf backend', action='store_true')
+    parser.add_argument('--pdf_mode', help='Pdf output mode', choices=address_plate.PDF_MODES, default='default')
+    parser.add_argument('--layout_cache', help='Cached text layouts, 0 - no cache', type=int,
+                        default=address_plate.LAYOUT_CACHE.capacity)
+    sub_parser = parser.add_subparsers(title='Benchmark')
+
+    all_parser = sub_parser.add_parser('all', help='Latency, throughput, cold start and peak rss')
+    all_parser.add_argument('--repeat', help='Passes over corpora for latency', type=int, default=5)
+    all_parser.add_argument('--rows', help='Rows of throughput batch', type=int, default=2000)
+    all_parser.add_argument('--workers', help='Processes of throughput batch, 0 - all cores', type=int, default=1)
+    all_parser.set_defaults(func=lambda args: run_all(args.repeat, args.rows, args.workers))
+
+    latency_parser = sub_parser.add_parser('latency', help='Time of one plate per plate type')
+    latency_parser.add_argument('--repeat', help='Passes over corpora', type=int, default=5)
+    latency_parser.set_defaults(func=lambda args: latency(args.repeat))
+
+    throughput_parser = sub_parser.add_parser('throughput', help='Batch plates per second')
+    throughput_parser.add_argument('--rows', help='Rows of batch', type=int, default=2000)
+    throughput_parser.add_argument('--workers', help='Processes, 0 - all cores', type=int, default=1)
+    throughput_parser.set_defaults(func=lambda args: throughput(args.rows, args.workers))
+
+    sizes_parser = sub_parser.add_parser('sizes', help='Time of one plate per plate type and plate size')
+    sizes_parser.add_argument('--repeat', help='Passes over corpora', type=int, default=5)
+    sizes_parser.set_defaults(func=lambda args: {'environment': _environment(),
+                                                 'latency': latency(args.repeat, address_plate.PLATE_SIZES)})
+
+    pdf_modes_parser = sub_parser.add_parser('pdf_modes', help='Time and size per pdf output mode and plate type')
+    pdf_modes_parser.add_argument('--repeat', help='Passes over corpora', type=int, default=5)
+    pdf_modes_parser.set_defaults(func=lambda args: pdf_modes(args.repeat))
+
+    threads_parser = sub_parser.add_parser('threads', help='Same bytes from renders in threads, fails if not')
+    threads_parser.add_argument('--plates', help='Rows rendered', type=int, default=2000)
+    threads_parser.add_argument('--threads', help='Render threads', type=int, default=8)
+    threads_parser.add_argument('--cache', help='Layout cache while rendering', type=int, default=64)
+    threads_parser.set_defaults(func=lambda args: threads(args.plates, args.threads, args.cache))
+
+    compare_parser = sub_parser.add_parser('compare', help='Change of every metric between two json results')
+    compare_parser.add_argument('before', help='Json result', type=str)
+    compare_parser.add_argument('after', help='Json result', type=str)
+    compare_parser.set_defaults(func=lambda args: compare(_load_json(args.before), _load_json(args.after)))
+
+    cold_start_parser = sub_parser.add_parser('cold_start', help='Fresh process rendering a number plate')
+    cold_start_parser.add_argument('--repeat', help='Runs, best is reported', type=int, default=10)
+    cold_start_parser.set_defaults(func=lambda args: cold_start(args.repeat))
+
+    args = parser.parse_args()
+    address_plate.LAYOUT_CACHE.capacity = args.layout_cache
+    if args.numpy:
+        address_plate.use_numpy()
+    address_plate.BasePlate.direct_pdf = args.direct
+    address_plate.BasePlate.pdf_mode = address_plate.PDF_MODES[args.pdf_mode]
+    result = args.func(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    else:
+        json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    if result.get('wall', 0) > result.get('budget', float('inf')) or result.get('mismatches'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,620 @@
+""" binary glyph store, replacement of paths.pkl
+
+file layout (little-endian):
+
+    header      magic, version, coordinate format ('d' float64 or 'f' float32),
+                glyphs count n, key blob size, opcodes count, coordinates count,
+                unit size (0 - 'face_size_char' keys, glyphs of every size are stored,
+                else 'face_char' keys, glyphs of unit size scaled to any size on lookup, see ScaledGlyphs)
+    key offsets (n + 1) uint32, offsets of sorted keys in key blob
+    key blob    utf-8 keys
+    glyphs      n records: opcodes start, opcodes count, coordinates start, coordinates count,
+                current point (x, y), path extents (x1, y1, x2, y2)
+    opcodes     uint8 per operation, index in OPERATIONS
+    coordinates float per point coordinate
+
+the file is opened with mmap, so nothing is read till a glyph is used
+and the pages are shared by all processes using the store
+
+convert paths.pkl:
+    python3 glyph_store.py convert paths.pkl paths.glyphs
+convert paths.pkl to unit size store (every outline once per face, any size):
+    python3 glyph_store.py unit paths.pkl paths.glyphs
+build unit size store from font files (pip install fonttools):
+    python3 glyph_store.py build paths.glyphs --font regular=Regular.ttf --font semi-bold=SemiBold.ttf \
+        --font bold=Bold.ttf --font slash=Slash.ttf
+compare startup time and memory of pickle and store:
+    python3 glyph_store.py bench paths.pkl paths.glyphs
+drop redundant outline operations (within tolerance, em), savings per face to stdout:
+    python3 glyph_store.py optimize paths.glyphs optimized.glyphs --tolerance 0.0001
+"""
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Mapping
+import math
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'APGS'
+VERSION = 2
+UNIT_SIZE = 1.0  # font size of unit size store glyphs
+
+# characters of plates: digits, ukrainian, russian and latin letters, punctuation
+DEFAULT_CHARS = ('0123456789АБВГҐДЕЄЖЗИІЇЙКЛМНОПРСТУФХЦЧШЩЬЮЯабвгґдеєжзиіїйклмнопрстуфхцчшщьюя'
+                 'ЁЪЫЭёъыэABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz -\'’.,()/№')
+
+OPERATIONS = ('moveTo', 'lineTo', 'curveTo', 'close')
+OPERATION_CODES = {name: code for code, name in enumerate(OPERATIONS)}
+OPERATION_POINTS = (2, 2, 6, 0)
+
+HEADER = struct.Struct('<4sHcxIIIId')
+HEADER_V1 = struct.Struct('<4sHcxIIII')
+GLYPH = struct.Struct('<IIII6d')
+
+
+def _align(offset: int, size: int = 8) -> int:
+    return (offset + size - 1) // size * size
+
+
+class GlyphStore(Mapping):
+    """ read only {'face_size_char': ([(operation_type, (points))], (current_point), (path_extents))}
+    over mmap of store file, same values as paths.pkl dict
+
+    unit size store (unit_size != 0) has 'face_char' keys, ScaledGlyphs makes 'face_size_char' of it
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = struct.unpack_from('<4sH', self._mmap, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f'{path} is not glyph store version {VERSION}')
+        header = HEADER if version == VERSION else HEADER_V1
+        _, _, coord_format, self._count, keys_size, ops_count, coords_count, *unit_size = \
+            header.unpack_from(self._mmap, 0)
+        self.unit_size = unit_size[0] if unit_size else 0
+        self._coord_format = coord_format.decode()
+        coord_size = struct.calcsize(self._coord_format)
+
+        self._key_offsets = header.size
+        self._keys = self._key_offsets + (self._count + 1) * 4
+        self._glyphs = _align(self._keys + keys_size)
+        self._ops = self._glyphs + self._count * GLYPH.size
+        self._coords = _align(self._ops + ops_count)
+        if self._coords + coords_count * coord_size > len(self._mmap):
+            raise ValueError(f'{path} is truncated')
+
+        self._cache = {}
+        self._metrics = {}
+
+    def _key(self, index: int) -> str:
+        start, end = struct.unpack_from('<II', self._mmap, self._key_offsets + index * 4)
+        return self._mmap[self._keys + start:self._keys + end].decode()
+
+    def _index(self, key: str) -> int:
+        index = bisect_left(_Keys(self), key)
+        if index == self._count or self._key(index) != key:
+            raise KeyError(key)
+        return index
+
+    def _glyph(self, index: int) -> tuple:
+        ops_start, ops_count, coords_start, coords_count, *numbers = \
+            GLYPH.unpack_from(self._mmap, self._glyphs + index * GLYPH.size)
+        codes = self._mmap[self._ops + ops_start:self._ops + ops_start + ops_count]
+        coords = struct.unpack_from(f'<{coords_count}{self._coord_format}', self._mmap,
+                                    self._coords + coords_start * struct.calcsize(self._coord_format))
+        operations = []
+        i = 0
+        for code in codes:
+            n = OPERATION_POINTS[code]
+            operations.append((OPERATIONS[code], coords[i:i + n]))
+            i += n
+        return operations, tuple(numbers[:2]), tuple(numbers[2:])
+
+    def __getitem__(self, key: str) -> tuple:
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        glyph = self._cache[key] = self._glyph(self._index(key))
+        return glyph
+
+    def metrics(self, key: str) -> tuple:
+        """ (current_point, path_extents) of glyph, outline is not read
+        """
+        try:
+            return self._metrics[key]
+        except KeyError:
+            pass
+        numbers = GLYPH.unpack_from(self._mmap, self._glyphs + self._index(key) * GLYPH.size)[4:]
+        glyph_metrics = self._metrics[key] = (numbers[:2], numbers[2:])
+        return glyph_metrics
+
+    def __contains__(self, key) -> bool:
+        try:
+            self._index(key)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self):
+        return (self._key(i) for i in range(self._count))
+
+
+class _Keys:
+    """ sorted keys of store as sequence for bisect
+    """
+
+    def __init__(self, store: GlyphStore):
+        self._store = store
+
+    def __len__(self):
+        return self._store._count
+
+    def __getitem__(self, index: int) -> str:
+        return self._store._key(index)
+
+
+class ScaledGlyphs(Mapping):
+    """ {'face_size_char': glyph} of unit size glyphs {'face_char': glyph},
+    glyph of a size is scaled once on first lookup, so any size costs nothing in the store
+
+    sizes are not listed, iteration and len() are of unit size keys
+    """
+
+    def __init__(self, unit_glyphs: Mapping, unit_size: float = UNIT_SIZE):
+        self._unit_glyphs = unit_glyphs
+        self.unit_size = unit_size
+        self._cache = {}
+        self._metrics = {}
+
+    @staticmethod
+    def _split(key: str) -> tuple:
+        """ 'face_size_char' to ('face_char', size)
+        """
+        try:
+            face, size, char = key.split('_', 2)
+            return f'{face}_{char}', float(size)
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __getitem__(self, key: str) -> tuple:
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        unit_key, size = self._split(key)
+        operations, current_point, path_extents = self._unit_glyphs[unit_key]
+        k = size / self.unit_size
+        glyph = self._cache[key] = (
+            [(type_op, tuple([x * k for x in points])) for type_op, points in operations],
+            tuple([x * k for x in current_point]),
+            tuple([x * k for x in path_extents]),
+        )
+        return glyph
+
+    def metrics(self, key: str) -> tuple:
+        """ (current_point, path_extents) of glyph, outline is not read nor scaled
+        """
+        try:
+            return self._metrics[key]
+        except KeyError:
+            pass
+        unit_key, size = self._split(key)
+        current_point, path_extents = glyph_metrics(self._unit_glyphs, unit_key)
+        k = size / self.unit_size
+        result = self._metrics[key] = (tuple([x * k for x in current_point]), tuple([x * k for x in path_extents]))
+        return result
+
+    def __contains__(self, key) -> bool:
+        try:
+            return self._split(key)[0] in self._unit_glyphs
+        except KeyError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self._unit_glyphs)
+
+    def __iter__(self):
+        return iter(self._unit_glyphs)
+
+
+def glyph_metrics(path_dict: Mapping, key: str) -> tuple:
+    """ (current_point, path_extents) of glyph in store or paths.pkl dict
+    """
+    metrics = getattr(path_dict, 'metrics', None)
+    if metrics is not None:
+        return metrics(key)
+    _, current_point, path_extents = path_dict[key]
+    return current_point, path_extents
+
+
+def open_store(path: str) -> Mapping:
+    """ glyph store of path, unit size store as ScaledGlyphs
+    """
+    store = GlyphStore(path)
+    return ScaledGlyphs(store, store.unit_size) if store.unit_size else store
+
+
+def unit_glyphs(path_dict: dict, unit_size: float = UNIT_SIZE) -> tuple:
+    """ unit size glyphs of {'face_size_char': glyph}, every glyph is taken from its largest size
+
+    :return: ({'face_char': glyph}, max difference of other sizes from scaled unit glyph in pt)
+    """
+    sized = {}
+    for key in path_dict:
+        unit_key, size = ScaledGlyphs._split(key)
+        sized.setdefault(unit_key, []).append((size, key))
+
+    result = {}
+    for unit_key, sizes in sized.items():
+        size, key = max(sizes)
+        operations, current_point, path_extents = path_dict[key]
+        k = unit_size / size
+        result[unit_key] = (
+            [(type_op, tuple([x * k for x in points])) for type_op, points in operations],
+            tuple([x * k for x in current_point]),
+            tuple([x * k for x in path_extents]),
+        )
+
+    scaled = ScaledGlyphs(result, unit_size)
+    deviation = 0
+    for key in path_dict:
+        operations, current_point, path_extents = path_dict[key]
+        scaled_operations, scaled_current_point, scaled_path_extents = scaled[key]
+        if [type_op for type_op, _ in operations] != [type_op for type_op, _ in scaled_operations]:
+            raise ValueError(f'{key}: outline is not the same at all sizes')
+        numbers = [x for _, points in operations for x in points] + [*current_point, *path_extents]
+        scaled_numbers = [x for _, points in scaled_operations for x in points] + \
+            [*scaled_current_point, *scaled_path_extents]
+        deviation = max([deviation] + [abs(x - y) for x, y in zip(numbers, scaled_numbers)])
+    return result, deviation
+
+
+def font_glyphs(fonts: dict, chars: str, unit_size: float = UNIT_SIZE) -> dict:
+    """ unit size glyphs {'face_char': glyph} of font files, needs fonttools (pip install fonttools)
+
+    outlines are in plate coordinates (y down, baseline y = 0), quadratic curves are converted to cubic
+
+    :param fonts: {face: ttf/otf path}
+    """
+    from fontTools.pens.basePen import BasePen
+    from fontTools.pens.boundsPen import BoundsPen
+    from fontTools.ttLib import TTFont
+
+    class OperationsPen(BasePen):
+
+        def __init__(self, glyph_set, k: float):
+            super().__init__(glyph_set)
+            self.k = k
+            self.operations = []
+
+        def _point(self, *points) -> tuple:
+            return tuple([v for x, y in points for v in (x * self.k, -y * self.k)])
+
+        def _moveTo(self, pt):
+            self.operations.append(('moveTo', self._point(pt)))
+
+        def _lineTo(self, pt):
+            self.operations.append(('lineTo', self._point(pt)))
+
+        def _curveToOne(self, pt1, pt2, pt3):
+            self.operations.append(('curveTo', self._point(pt1, pt2, pt3)))
+
+        def _closePath(self):
+            self.operations.append(('close', ()))
+
+    result = {}
+    for face, font_path in fonts.items():
+        font = TTFont(font_path)
+        glyph_set = font.getGlyphSet()
+        cmap = font.getBestCmap()
+        k = unit_size / font['head'].unitsPerEm
+        for char in chars:
+            name = cmap.get(ord(char))
+            if name is None:
+                print(f'{face}: no glyph of {char!r} in {font_path}', file=sys.stderr)
+                continue
+            pen = OperationsPen(glyph_set, k)
+            glyph_set[name].draw(pen)
+            bounds_pen = BoundsPen(glyph_set)
+            glyph_set[name].draw(bounds_pen)
+            path_extents = (0, 0, 0, 0)
+            if bounds_pen.bounds is not None:
+                x1, y1, x2, y2 = bounds_pen.bounds
+                path_extents = (x1 * k, -y2 * k, x2 * k, -y1 * k)
+            result[f'{face}_{char}'] = (pen.operations, (glyph_set[name].width * k, 0), path_extents)
+    return result
+
+
+def write_store(path_dict: dict, path: str, coord_format: str = 'd', unit_size: float = 0):
+    """ write {'face_size_char': (operations, current_point, path_extents)} as glyph store
+
+    :param coord_format: 'd' - float64 (exact copy of pickle), 'f' - float32 (half size)
+    :param unit_size: not 0 - path_dict is unit size {'face_char': glyph}
+    """
+    keys = sorted(path_dict)
+    key_blob = bytearray()
+    key_offsets = [0]
+    glyphs = bytearray()
+    ops = bytearray()
+    coords = []
+    for key in keys:
+        operations, current_point, path_extents = path_dict[key]
+        glyphs += GLYPH.pack(len(ops), len(operations), len(coords),
+                             sum(OPERATION_POINTS[OPERATION_CODES[op]] for op, _ in operations),
+                             *current_point, *path_extents)
+        for type_op, points in operations:
+            if len(points) != OPERATION_POINTS[OPERATION_CODES[type_op]]:
+                raise ValueError(f'{key}: {type_op} with {len(points)} coordinates')
+            ops.append(OPERATION_CODES[type_op])
+            coords.extend(points)
+        key_blob += key.encode()
+        key_offsets.append(len(key_blob))
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, coord_format.encode(), len(keys), len(key_blob), len(ops), len(coords),
+                            unit_size))
+        f.write(struct.pack(f'<{len(key_offsets)}I', *key_offsets))
+        f.write(key_blob)
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        f.write(glyphs)
+        f.write(ops)
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        f.write(struct.pack(f'<{len(coords)}{coord_format}', *coords))
+
+
+def convert(pkl_path: str, store_path: str, coord_format: str = 'd'):
+    import pickle
+
+    with open(pkl_path, 'rb') as f:
+        write_store(pickle.load(f), store_path, coord_format)
+
+
+def convert_unit(pkl_path: str, store_path: str, coord_format: str = 'd'):
+    import pickle
+
+    with open(pkl_path, 'rb') as f:
+        path_dict = pickle.load(f)
+    glyphs, deviation = unit_glyphs(path_dict)
+    write_store(glyphs, store_path, coord_format, UNIT_SIZE)
+    print(f'{len(path_dict)} glyphs -> {len(glyphs)} unit size glyphs, {os.path.getsize(store_path)} bytes, '
+          f'max difference {deviation:.6f} pt')
+
+
+def build(store_path: str, fonts: dict, chars: str = DEFAULT_CHARS, coord_format: str = 'd'):
+    glyphs = font_glyphs(fonts, chars)
+    write_store(glyphs, store_path, coord_format, UNIT_SIZE)
+    print(f'{len(glyphs)} unit size glyphs of {len(fonts)} faces, {os.path.getsize(store_path)} bytes')
+
+
+def _segment_distance(point: tuple, start: tuple, end: tuple) -> float:
+    """ distance of point to segment start - end
+    """
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = dx * dx + dy * dy
+    t = 0 if length == 0 else max(0, min(1, ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length))
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+def optimize_operations(operations, tolerance: float, counts: Counter = None) -> list:
+    """ outline without redundant operations, filled shape moves by tolerance at most:
+
+    zero length lineTo and curveTo are dropped,
+    curveTo with control points within tolerance of its chord is lineTo,
+    lineTo runs along one line are one lineTo (every dropped point within tolerance of it),
+    lineTo back to subpath start before close is dropped (close draws it),
+    moveTo of empty subpath (followed by moveTo, close or end) is dropped
+
+    :param tolerance: in outline coordinates
+    :param counts: Counter of removed operations by reason, updated
+    """
+    counts = Counter() if counts is None else counts
+    result = []
+    current = start = (0, 0)
+    run = None  # (start point, [dropped points]) of last lineTo of result
+    for type_op, points in operations:
+        if type_op == 'moveTo':
+            if result and result[-1][0] == 'moveTo':
+                result.pop()
+                counts['empty_subpath'] += 1
+            result.append((type_op, points))
+            current = start = points
+            run = None
+            continue
+
+        if type_op == 'close':
+            if result and result[-1][0] == 'moveTo':
+                result.pop()
+                counts['empty_subpath'] += 2
+            else:
+                if run is not None and _segment_distance(start, current, current) <= tolerance and \
+                        all(_segment_distance(point, run[0], start) <= tolerance for point in run[1]):
+                    result.pop()
+                    counts['close_line'] += 1
+                result.append((type_op, points))
+            current = start
+            run = None
+            continue
+
+        end = tuple(points[-2:])
+        inner = []  # control points of flat curve, curve is within tolerance of any line they are within
+        if type_op == 'curveTo':
+            if max(_segment_distance(points[0:2], current, end), _segment_distance(points[2:4], current, end)) \
+                    > tolerance:
+                result.append((type_op, points))
+                current = end
+                run = None
+                continue
+            counts['flat_curve'] += 1
+            inner = [tuple(points[0:2]), tuple(points[2:4])]
+            type_op, points = 'lineTo', end
+
+        if _segment_distance(end, current, current) <= tolerance:
+            counts['zero_length'] += 1
+            if run is not None:
+                # a longer lineTo of the run must pass them too
+                run[1].extend(inner + [end])
+            continue
+        if run is not None:
+            run_start, dropped = run
+            if all(_segment_distance(point, run_start, end) <= tolerance for point in dropped + [current] + inner):
+                result[-1] = ('lineTo', points)
+                dropped += [current] + inner
+                current = end
+                counts['collinear'] += 1
+                continue
+        result.append(('lineTo', points))
+        run = (current, inner)
+        current = end
+
+    if result and result[-1][0] == 'moveTo':
+        result.pop()
+        counts['empty_subpath'] += 1
+    return result
+
+
+def optimize_glyphs(path_dict: Mapping, tolerance: float, unit_size: float = 0, coord_format: str = 'd') -> tuple:
+    """ optimize_operations() of every glyph, current point and path extents are kept
+
+    :param tolerance: em, outline coordinates tolerance is tolerance * font size of glyph
+    :param unit_size: not 0 - path_dict is unit size {'face_char': glyph}
+    :return: ({key: glyph}, {face: {'glyphs', 'operations', 'coordinates', 'bytes': [before, after],
+        'removed': {reason: n}}}), bytes are of opcodes and coordinates in store of coord_format
+    """
+    coord_bytes = struct.calcsize(coord_format)
+    result = {}
+    report = {}
+    for key in path_dict:
+        operations, current_point, path_extents = path_dict[key]
+        if unit_size:
+            face, size = key.rsplit('_', 1)[0], unit_size
+        else:
+            face, size = key.split('_', 1)[0], ScaledGlyphs._split(key)[1]
+        stats = report.setdefault(face, {'glyphs': 0, 'operations': [0, 0], 'coordinates': [0, 0], 'bytes': [0, 0],
+                                         'removed': Counter()})
+        optimized = optimize_operations(operations, tolerance * size, stats['removed'])
+        result[key] = (optimized, current_point, path_extents)
+        stats['glyphs'] += 1
+        for i, glyph_operations in enumerate((operations, optimized)):
+            coordinates = sum(len(points) for _, points in glyph_operations)
+            stats['operations'][i] += len(glyph_operations)
+            stats['coordinates'][i] += coordinates
+            stats['bytes'][i] += len(glyph_operations) + coordinates * coord_bytes
+    for stats in report.values():
+        stats['removed'] = dict(sorted(stats['removed'].items()))
+    return result, report
+
+
+def optimize(source_path: str, store_path: str, tolerance: float = 1e-4, coord_format: str = 'd') -> dict:
+    """ glyph store (or paths.pkl) to glyph store of optimize_glyphs()
+
+    :return: optimize_glyphs() report + 'file_bytes': [before, after]
+    """
+    if source_path.endswith('.pkl'):
+        import pickle
+
+        with open(source_path, 'rb') as f:
+            path_dict = pickle.load(f)
+        unit_size = 0
+    else:
+        store = GlyphStore(source_path)
+        path_dict = {key: store[key] for key in store}
+        unit_size = store.unit_size
+    glyphs, report = optimize_glyphs(path_dict, tolerance, unit_size, coord_format)
+    write_store(glyphs, store_path, coord_format, unit_size)
+    return {'tolerance': tolerance, 'faces': report,
+            'file_bytes': [os.path.getsize(source_path), os.path.getsize(store_path)]}
+
+
+_BENCH_CODE = '''
+import sys, time
+t = time.perf_counter()
+path = sys.argv[1]
+if path.endswith('.pkl'):
+    import pickle
+    with open(path, 'rb') as f:
+        glyphs = pickle.load(f)
+else:
+    from glyph_store import open_store
+    glyphs = open_store(path)
+for key in sys.argv[2:]:
+    glyphs[key]
+t = time.perf_counter() - t
+with open('/proc/self/status') as f:
+    print(t, next(line.split()[1] for line in f if line.startswith('VmHWM')))
+'''
+
+
+def bench(pkl_path: str, store_path: str, repeat: int = 5):
+    """ load time and peak rss of fresh interpreter loading pickle vs store and using a few glyphs
+    """
+    import pickle
+    import subprocess
+
+    with open(pkl_path, 'rb') as f:
+        keys = [key for key in pickle.load(f) if key.startswith('semi-bold_480.0_')]
+    for path in (pkl_path, store_path):
+        runs = [subprocess.run([sys.executable, '-c', _BENCH_CODE, os.path.abspath(path), *keys], check=True,
+                               capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+                for _ in range(repeat)]
+        load = min(float(run[0]) for run in runs)
+        rss = min(int(run[1]) for run in runs)
+        print(f'{path}: {os.path.getsize(path)} bytes, load {load * 1000:.1f} ms, max rss {rss} KiB')
+
+
+def main():
+    from argparse import ArgumentParser
+    import json
+
+    parser = ArgumentParser()
+    sub_parser = parser.add_subparsers(title='Glyph store')
+
+    convert_parser = sub_parser.add_parser('convert', help='paths.pkl to glyph store')
+    convert_parser.add_argument('pkl', help='Pickle file', type=str)
+    convert_parser.add_argument('store', help='Glyph store file', type=str)
+    convert_parser.add_argument('--float32', help='Float32 coordinates', action='store_true')
+    convert_parser.set_defaults(func=lambda args: convert(args.pkl, args.store, 'f' if args.float32 else 'd'))
+
+    unit_parser = sub_parser.add_parser('unit', help='paths.pkl to unit size glyph store')
+    unit_parser.add_argument('pkl', help='Pickle file', type=str)
+    unit_parser.add_argument('store', help='Glyph store file', type=str)
+    unit_parser.add_argument('--float32', help='Float32 coordinates', action='store_true')
+    unit_parser.set_defaults(func=lambda args: convert_unit(args.pkl, args.store, 'f' if args.float32 else 'd'))
+
+    build_parser = sub_parser.add_parser('build', help='Unit size glyph store from font files (needs fonttools)')
+    build_parser.add_argument('store', help='Glyph store file', type=str)
+    build_parser.add_argument('--font', help='face=font file (ttf/otf), face is regular, semi-bold, bold or slash',
+                              type=str, action='append', required=True)
+    build_parser.add_argument('--chars', help='Characters of glyphs', type=str, default=DEFAULT_CHARS)
+    build_parser.add_argument('--float32', help='Float32 coordinates', action='store_true')
+    build_parser.set_defaults(func=lambda args: build(args.store, dict(font.split('=', 1) for font in args.font),
+                                                      args.chars, 'f' if args.float32 else 'd'))
+
+    optimize_parser = sub_parser.add_parser('optimize', help='Glyph store without redundant outline operations')
+    optimize_parser.add_argument('source', help='Glyph store or pickle file', type=str)
+    optimize_parser.add_argument('store', help='Glyph store file', type=str)
+    optimize_parser.add_argument('--tolerance', help='Max outline change, em (0.0001 - 0.048 pt at 480 pt)',
+                                 type=float, default=1e-4)
+    optimize_parser.add_argument('--float32', help='Float32 coordinates', action='store_true')
+    optimize_parser.set_defaults(func=lambda args: print(json.dumps(
+        optimize(args.source, args.store, args.tolerance, 'f' if args.float32 else 'd'), indent=2)))
+
+    bench_parser = sub_parser.add_parser('bench', help='Startup time and memory of pickle and glyph store')
+    bench_parser.add_argument('pkl', help='Pickle file', type=str)
+    bench_parser.add_argument('store', help='Glyph store file', type=str)
+    bench_parser.set_defaults(func=lambda args: bench(args.pkl, args.store))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+""" SIZES_PT compiled to layout specs, one per (plate kind, size, arrow)
+
+every key a plate needs is looked up and checked once at load, plates get a ready spec,
+new plate sizes come from a json data file with SIZES_PT keys of the new size prefix:
+
+    {"xl_round_radius": {"mm": 30}, "xl_margin": {"mm": 80}, ...,
+     "xl_street_type_font": {"face": "regular", "size": 180}, ...}
+
+numbers are pt, {"mm": x} is mm
+"""
+from collections import namedtuple
+import json
+from types import MappingProxyType
+
+# house number parts (address_plate LVL1, LVL2C, LVL2S, LVL3, SLASH, LVL_A1, LVL_A2C)
+HOUSE_NUMBER_LEVELS = ('lvl1', 'lvl2c', 'lvl2s', 'lvl3')
+SLASH_LEVEL = 'lvl2_slash'
+ARROW_NUMBER_LEVELS = ('lvl_a1', 'lvl_a2c')
+
+NameSpec = namedtuple('NameSpec', 'margin height radius type_font type_bl name_font name_bl line_width line_bl '
+                                  'translit_font translit_bl')
+
+NumberSpec = namedtuple('NumberSpec', 'margin height radius widths bl fonts '
+                                      'arrow_bl arrow_size number_bl number_fonts')
+
+VerticalSpec = namedtuple('VerticalSpec', 'width height margin radius type_font type_bl '
+                                          'name_font name_translate name_max_char line_width line_translate '
+                                          'translit_font translit_translate translit_max_char number_bl fonts')
+
+
+class _Sizes:
+    """ typed lookups of SIZES_PT keys, errors are collected, not raised one by one
+    """
+
+    def __init__(self, sizes: dict):
+        self.sizes = sizes
+        self.errors = []
+
+    def number(self, key: str, positive: bool = True) -> float:
+        value = self.sizes.get(key)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or positive and value <= 0:
+            self.errors.append(f'{key}: {"missing" if value is None else f"bad number {value!r}"}')
+            return 0
+        return value
+
+    def count(self, key: str) -> int:
+        value = self.sizes.get(key)
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            self.errors.append(f'{key}: {"missing" if value is None else f"bad count {value!r}"}')
+            return 1
+        return value
+
+    def numbers(self, key: str, length: int) -> tuple:
+        value = self.sizes.get(key)
+        if not isinstance(value, (list, tuple)) or len(value) != length \
+                or not all(isinstance(x, (int, float)) and x > 0 for x in value):
+            self.errors.append(f'{key}: {"missing" if value is None else f"expected {length} numbers"}')
+            return (0,) * length
+        return tuple(value)
+
+    def font(self, key: str, leading: bool = False) -> MappingProxyType:
+        value = self.sizes.get(key)
+        if not isinstance(value, dict) or not isinstance(value.get('face'), str) \
+                or not isinstance(value.get('size'), (int, float)) or leading and 'leading' not in value:
+            expected = 'expected face, size, leading' if leading else 'expected face, size'
+            self.errors.append(f'{key}: {"missing" if value is None else expected}')
+            return MappingProxyType({'face': '', 'size': 0, 'leading': 0})
+        return MappingProxyType(dict(value))
+
+    def mapping(self, key: str, names: tuple) -> MappingProxyType:
+        value = self.sizes.get(key)
+        if not isinstance(value, dict) or any(not isinstance(value.get(name), (int, float)) for name in names):
+            self.errors.append(f'{key}: {"missing" if value is None else "expected " + ", ".join(names)}')
+            return MappingProxyType(dict.fromkeys(names, 0))
+        return MappingProxyType(dict(value))
+
+
+def plate_sizes(sizes: dict) -> tuple:
+    """ size names (thin, wide, ...) - prefixes of *_round_radius keys
+    """
+    return tuple(key[:-len('_round_radius')] for key in sizes if key.endswith('_round_radius'))
+
+
+def _name_spec(s: _Sizes, size: str) -> NameSpec:
+    return NameSpec(
+        margin=s.number(f'{size}_margin'),
+        height=s.number(f'{size}_height'),
+        radius=s.number(f'{size}_round_radius', positive=False),
+        type_font=s.font(f'{size}_street_type_font'),
+        type_bl=s.number(f'{size}_street_type_bl'),
+        name_font=s.font(f'{size}_street_name_font'),
+        name_bl=s.number(f'{size}_street_name_bl'),
+        line_width=s.number(f'{size}_street_line_width'),
+        line_bl=s.number(f'{size}_street_line_bl'),
+        translit_font=s.font(f'{size}_street_translit_font'),
+        translit_bl=s.number(f'{size}_street_translit_bl'),
+    )
+
+
+def _number_spec(s: _Sizes, size: str, arrow: bool) -> NumberSpec:
+    prefix = f'{size}_house_number{"_arrow" if arrow else ""}'
+    fonts = {level: s.font(f'{prefix}_font_{level}') for level in HOUSE_NUMBER_LEVELS}
+    # slash of plain number plate on arrow plates too
+    fonts[SLASH_LEVEL] = s.font(f'{size}_house_number_slash_size')
+    return NumberSpec(
+        margin=s.number(f'{size}_margin'),
+        height=s.number(f'{size}_height'),
+        radius=s.number(f'{size}_round_radius', positive=False),
+        widths=s.numbers(f'{prefix}_width', 5),
+        bl=s.number(f'{prefix}_bl'),
+        fonts=MappingProxyType(fonts),
+        arrow_bl=s.number(f'{prefix}_arrow_bl') if arrow else None,
+        arrow_size=s.mapping(f'{prefix}_arrow_size', ('line_width', 'length', 'half_height', 'half_space'))
+        if arrow else None,
+        number_bl=s.number(f'{prefix}_number_bl') if arrow else None,
+        number_fonts=MappingProxyType({level: s.font(f'{prefix}_number_font_{level}')
+                                       for level in ARROW_NUMBER_LEVELS}) if arrow else None,
+    )
+
+
+def _vertical_spec(s: _Sizes, size: str) -> VerticalSpec:
+    prefix = f'{size}_vertical'
+    fonts = {level: s.font(f'{prefix}_house_number_font_{level}') for level in HOUSE_NUMBER_LEVELS}
+    fonts[SLASH_LEVEL] = s.font(f'{prefix}_house_number_slash_size')
+    return VerticalSpec(
+        width=s.number(f'{prefix}_width'),
+        height=s.number(f'{prefix}_height'),
+        margin=s.number(f'{prefix}_margin'),
+        radius=s.number(f'{size}_round_radius', positive=False),
+        type_font=s.font(f'{prefix}_street_type_font'),
+        type_bl=s.number(f'{prefix}_street_type_bl'),
+        name_font=s.font(f'{prefix}_street_name_font', leading=True),
+        name_translate=s.number(f'{prefix}_street_name_translate'),
+        name_max_char=s.count(f'{prefix}_street_name_max_char'),
+        line_width=s.number(f'{prefix}_street_line_width'),
+        line_translate=s.number(f'{prefix}_street_line_translate'),
+        translit_font=s.font(f'{prefix}_street_translit_font', leading=True),
+        translit_translate=s.number(f'{prefix}_street_translit_translate'),
+        translit_max_char=s.count(f'{prefix}_street_translit_max_char'),
+        number_bl=s.number(f'{prefix}_house_number_bl'),
+        fonts=MappingProxyType(fonts),
+    )
+
+
+def compile_specs(sizes: dict) -> MappingProxyType:
+    """ {(plate kind, size, arrow): NameSpec/NumberSpec/VerticalSpec} of every size in sizes
+
+    :raise ValueError: with every missing or bad key
+    """
+    s = _Sizes(sizes)
+    specs = {}
+    for size in plate_sizes(sizes):
+        specs['name', size, False] = _name_spec(s, size)
+        specs['number', size, False] = _number_spec(s, size, False)
+        specs['number', size, True] = _number_spec(s, size, True)
+        specs['vertical', size, False] = _vertical_spec(s, size)
+    if s.errors:
+        raise ValueError('bad plate sizes:\n    ' + '\n    '.join(dict.fromkeys(s.errors)))
+    return MappingProxyType(specs)
+
+
+def _from_json(value):
+    if isinstance(value, dict) and set(value) == {'mm'}:
+        return value['mm'] * 2.834645669  # address_plate.pt()
+    if isinstance(value, list):
+        return tuple(_from_json(x) for x in value)
+    if isinstance(value, dict):
+        return {name: _from_json(x) for name, x in value.items()}
+    return value
+
+
+def load_sizes(path: str) -> dict:
+    """ SIZES_PT keys from json data file
+    """
+    with open(path, encoding='utf-8') as f:
+        sizes = json.load(f)
+    if not isinstance(sizes, dict):
+        raise ValueError(f'{path}: json object of SIZES_PT keys expected')
+    return {key: _from_json(value) for key, value in sizes.items()}
@@ -0,0 +1,225 @@
+""" reportlab side of plates, imported by address_plate only when a pdf is drawn
+"""
+from functools import lru_cache
+from reportlab.lib.colors import PCMYKColor
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFDictionary, PDFFormXObject, PDFName, PDFStream, PDFZCompress
+from reportlab.pdfgen import canvas
+from reportlab.pdfgen.canvas import PATH_OPS
+import zlib
+
+COLOR_WHITE = PCMYKColor(0, 0, 0, 0)
+COLOR_DARK_BLUE = PCMYKColor(75, 65, 0, 75)
+COLOR_REGISTRATION = PCMYKColor(100, 100, 100, 100)  # crop marks, on every plate of separation
+# пока будет так, если цвета не подойдут поменяю
+
+PDF_PRECISION = 3  # digits after point of coordinates written by direct backend
+# text_forms: text is a form from this use on, a form (object, resource entries, doForm) costs about
+# as much as a short compressed outline, so texts used 2-3 times are cheaper inline
+TEXT_FORM_USES = 4
+
+# operation_type: (pdf operator, number of coordinates)
+PDF_OPERATORS = {'moveTo': ('m', 2), 'lineTo': ('l', 2), 'curveTo': ('c', 6), 'close': ('h', 0)}
+
+
+def build_path(work_canvas: canvas.Canvas, operations):
+    """ reportlab path from [(operation_type, (points))]
+    """
+    p = work_canvas.beginPath()
+    for type_op, points in operations:
+        if type_op == 'moveTo':
+            p.moveTo(*points)
+        elif type_op == 'lineTo':
+            p.lineTo(*points)
+        elif type_op == 'curveTo':
+            p.curveTo(*points)
+        elif type_op == 'close':
+            p.close()
+    return p
+
+
+@lru_cache()
+def _operator_formats(precision: int) -> dict:
+    """ {operation_type: '%.3f %.3f m'}
+    """
+    return {type_op: ' '.join([f'%.{precision}f'] * n + [operator])
+            for type_op, (operator, n) in PDF_OPERATORS.items()}
+
+
+def operations_code(operations, precision: int = PDF_PRECISION) -> str:
+    """ pdf path operators of [(operation_type, (points))], coordinates with fixed precision
+    """
+    formats = _operator_formats(precision)
+    return ' '.join([formats[type_op] % points for type_op, points in operations])
+
+
+def round_rect_operations(x: float, y: float, width: float, height: float, radius: float) -> tuple:
+    """ same path as reportlab roundRect()
+    """
+    t = 0.4472 * radius
+    x1, x2 = min(x, x + width), max(x, x + width)
+    y1, y2 = min(y, y + height), max(y, y + height)
+    return (
+        ('moveTo', (x1 + radius, y1)),
+        ('lineTo', (x2 - radius, y1)),
+        ('curveTo', (x2 - t, y1, x2, y1 + t, x2, y1 + radius)),
+        ('lineTo', (x2, y2 - radius)),
+        ('curveTo', (x2, y2 - t, x2 - t, y2, x2 - radius, y2)),
+        ('lineTo', (x1 + radius, y2)),
+        ('curveTo', (x1 + t, y2, x1, y2 - t, x1, y2 - radius)),
+        ('lineTo', (x1, y1 + radius)),
+        ('curveTo', (x1, y1 + t, x1 + t, y1, x1 + radius, y1)),
+        ('close', ()),
+    )
+
+
+def path_code(work_canvas: canvas.Canvas, operations) -> str:
+    """ pdf operators filling operations path, same as drawPath(fill=1, stroke=0) puts to page
+    """
+    p = build_path(work_canvas, operations)
+    return f'{p.getCode()} {PATH_OPS[0, 1, work_canvas._fillMode]}'
+
+
+class PlateCanvas(canvas.Canvas):
+    """ canvas for plates
+
+    text_forms: a text (TextPaths of same text, face and size) drawn TEXT_FORM_USES times is a form xobject,
+    placed by doForm from then on, so outlines of texts repeated on many pages (street type, name and translit)
+    are written TEXT_FORM_USES times per document, texts drawn fewer times cost nothing
+
+    header_forms: plates draw parts same on many pages (Vertical street header) by header_form() + doForm,
+    the part is written once per document
+
+    direct: paths, lines and background go to page stream as ready pdf operators with precision digits
+    (see operations_code, TextPaths.pdf_code), not by reportlab path object calls
+
+    compression: zlib level of page streams, 0 - not compressed, None - reportlab default (flate + ascii85)
+    """
+
+    background_color = COLOR_DARK_BLUE
+    face_color = COLOR_WHITE
+
+    def __init__(self, *args, text_forms: bool = False, header_forms: bool = False, direct: bool = False,
+                 precision: int = PDF_PRECISION, compression: int = None, **kwargs):
+        if compression == 0:
+            kwargs['pageCompression'] = 0
+        super().__init__(*args, **kwargs)
+        self.text_forms = text_forms
+        self.header_forms = header_forms
+        self.direct = direct
+        self.precision = precision
+        self.compression = compression
+        self._text_uses = {}  # (text, face, size): times drawn inline
+        self._text_form_names = {}  # (text, face, size): form name
+        self._header_form_names = {}
+        if compression:
+            self.compress_pages()
+
+    def fill_code(self, code: str):
+        """ fill path of pdf operators, as drawPath(fill=1, stroke=0)
+        """
+        self._code.append(f'{code} {PATH_OPS[0, 1, self._fillMode]}')
+
+    def fill_operations(self, operations):
+        """ fill path of [(operation_type, (points))]
+        """
+        if self.direct:
+            self.fill_code(operations_code(operations, self.precision))
+        else:
+            self.drawPath(build_path(self, operations), fill=1, stroke=0)
+
+    def line(self, x1: float, y1: float, x2: float, y2: float):
+        if not self.direct:
+            return super().line(x1, y1, x2, y2)
+        self._code.append(f'n {operations_code((("moveTo", (x1, y1)), ("lineTo", (x2, y2))), self.precision)} S')
+
+    def roundRect(self, x: float, y: float, width: float, height: float, radius: float, stroke: int = 1,
+                  fill: int = 0):
+        if not self.direct or isinstance(radius, (list, tuple)):
+            return super().roundRect(x, y, width, height, radius, stroke, fill)
+        self._code.append(operations_code(round_rect_operations(x, y, width, height, radius), self.precision))
+        self._strokeAndFill(stroke, fill)
+
+    def text_form(self, text_paths) -> str:
+        """ name of form with text_paths outline, form is added to document on TEXT_FORM_USES use of the text
+
+        :return: form name or None - draw it inline (used fewer times, text without outline)
+        """
+        key = (text_paths.text, text_paths.face, text_paths.size)
+        name = self._text_form_names.get(key)
+        if name is not None:
+            return name
+        uses = self._text_uses[key] = self._text_uses.get(key, 0) + 1
+        if uses < TEXT_FORM_USES or not text_paths.operations:
+            return None
+
+        name = self._text_form_names[key] = f'text{len(self._text_form_names)}'
+        if self.direct:
+            code = f'{text_paths.pdf_code(self.precision)} {PATH_OPS[0, 1, self._fillMode]}'
+        else:
+            code = path_code(self, text_paths.operations)
+        x1, y1, x2, y2 = text_paths.get_path_extents()
+        self._add_form(name, (x1 - 1, min(y1, y2) - 1, x2 + 1, max(y1, y2) + 1), code)
+        return name
+
+    def header_form(self, key, bbox: tuple, draw) -> str:
+        """ name of form drawn by draw(self) in current transform, drawn and added to document on first use of key
+
+        draw must leave graphics state as it found it or be wrapped in saveState/restoreState by caller,
+        the form is placed in graphics state of doForm
+
+        :param key: hashable, same key - same drawing
+        :param bbox: (x1, y1, x2, y2) of drawing
+        """
+        name = self._header_form_names.get(key)
+        if name is not None:
+            return name
+
+        name = f'header{len(self._header_form_names)}'
+        code, forms_in_use = self._code, self._formsinuse
+        self._code, self._formsinuse = [], []
+        try:
+            draw(self)
+            form_code, form_forms = self._code, self._formsinuse
+        finally:
+            self._code, self._formsinuse = code, forms_in_use
+        # text forms drawn inside
+        self._add_form(name, bbox, '\n'.join(form_code), form_forms)
+        self._header_form_names[key] = name
+        return name
+
+    def _add_form(self, name: str, bbox: tuple, code: str, forms=()):
+        """ form xobject of pdf operators, built here as beginForm()/endForm() put page preamble (bottomup flip)
+        into form, resources are the forms it draws only (no fonts and procsets of reportlab forms),
+        stream is compressed as page streams
+        """
+        form = PDFFormXObject(*bbox)
+        form.Resources = PDFDictionary({'XObject': self._doc.xobjDict(sorted(set(forms)))} if forms else {})
+        form.Contents = self._stream(code, 'xobject form stream')
+        self._doc.addForm(name, form)
+
+    def compress_pages(self):
+        """ compress every page stream as soon as the page is done
+        """
+        self.setPageCallBack(lambda page_number: self._compress_last_page())
+
+    def _compress_last_page(self):
+        """ replace source of just finished page with flate compressed stream,
+        reportlab keeps page source as str till canvas.save() otherwise
+        """
+        page = self._doc.Pages.pages[-1]
+        if not page.compression or not page.stream:
+            return
+        page.Contents = self._stream(page.stream, 'page stream')
+        page.stream = None
+
+    def _stream(self, code: str, comment: str) -> PDFStream:
+        """ flate compressed stream of pdf operators (no ascii85), not compressed with pageCompression off
+        """
+        if not self._pageCompression:
+            stream = PDFStream(content=code.encode('utf8'))
+        else:
+            level = -1 if self.compression is None else self.compression
+            stream = PDFStream(content=zlib.compress(code.encode('utf8'), level))
+            stream.dictionary['Filter'] = PDFArray([PDFName(PDFZCompress.pdfname)])
+        stream.__Comment__ = comment
+        return stream
@@ -0,0 +1,216 @@
+""" sheet imposition: many plates packed onto fixed size print sheets, one pdf page per sheet with crop marks
+
+    python3 address_plate.py impose --manifest plates.csv --output sheets.pdf --sheet 3050x1525 --gutter 10 --bleed 3
+
+packing is shelf first fit decreasing height: plates sorted by height go left to right on shelves,
+a plate takes the first shelf with room for it, a new shelf goes to the first sheet with room for it,
+first shelf and sheet are found by max trees (_FirstFit) in O(log n), so 100k plates are packed in 1-2 s,
+with rotate plates are packed upright, lying and standing and the packing of fewest sheets is kept (3x time)
+
+sizes here are pt, the cli takes mm
+"""
+from collections import namedtuple
+
+CROP_MARK_LENGTH = 14.17  # pt, 5 mm
+CROP_MARK_OFFSET = 2.83  # pt, 1 mm from bleed
+CROP_MARK_WIDTH = 0.25  # pt
+
+# sheet number, x, y (top left of plate trim box on sheet), width, height (as placed), rotated 90°, plate index
+Placement = namedtuple('Placement', 'sheet x y width height rotated index')
+
+
+class _FirstFit:
+    """ slots (shelves, sheets) with room, first slot with room >= need in O(log n)
+    """
+
+    def __init__(self, capacity: int):
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.room = [-1] * (self.size * 2)  # max room of subtree, leaves are slots
+        self.count = 0
+
+    def append(self, room: float) -> int:
+        self.count += 1
+        self.update(self.count - 1, room)
+        return self.count - 1
+
+    def update(self, slot: int, room: float):
+        i = slot + self.size
+        self.room[i] = room
+        i //= 2
+        while i:
+            self.room[i] = max(self.room[i * 2], self.room[i * 2 + 1])
+            i //= 2
+
+    def find(self, need: float) -> int:
+        """
+        :return: first slot with room >= need or -1
+        """
+        if self.room[1] < need:
+            return -1
+        i = 1
+        while i < self.size:
+            i = i * 2 if self.room[i * 2] >= need else i * 2 + 1
+        return i - self.size
+
+
+def pack(sizes, sheet_width: float, sheet_height: float, gutter: float = 0, bleed: float = 0, margin: float = 0,
+         rotate: bool = False) -> tuple:
+    """
+    :param sizes: [(width, height)] of plates
+    :param gutter: space between bleed boxes of plates
+    :param bleed: background around every plate, cut off
+    :param margin: sheet border without plates
+    :param rotate: plates may be turned 90°, packed upright (turned only if it does not fit), lying
+                   and standing, packing of fewest sheets is kept (upright on a tie)
+    :return: ([Placement] in sheet, shelf order; sheets count, [index of plate larger than sheet])
+    """
+    # cells are bleed boxes + gutter, the last gutter of a row or column is not needed
+    free_width = sheet_width - margin * 2 + gutter
+    free_height = sheet_height - margin * 2 + gutter
+    # orientations: upright (turned only if it does not fit), lying (long side horizontal), standing (vertical)
+    orientations = ([], [], []) if rotate else ([],)
+    too_large = []
+    for index, (width, height) in enumerate(sizes):
+        cell = (width + bleed * 2 + gutter, height + bleed * 2 + gutter, False)
+        turned = (cell[1], cell[0], True)
+        fits = cell[0] <= free_width and cell[1] <= free_height
+        turned_fits = rotate and turned[0] <= free_width and turned[1] <= free_height
+        if not fits and not turned_fits:
+            too_large.append(index)
+            continue
+        orientations[0].append((cell if fits else turned, index))
+        if rotate:
+            orientations[1].append((turned if turned_fits and (width < height or not fits) else cell, index))
+            orientations[2].append((turned if turned_fits and (width > height or not fits) else cell, index))
+    if not orientations[0]:
+        return [], 0, too_large
+
+    # which orientation fills a sheet best depends on plate and sheet sizes, all are packed, fewest sheets win
+    placements, sheets = None, 0
+    for cells in orientations:
+        packed = _pack_shelves(cells, free_width, free_height, bleed, gutter, margin)
+        if placements is None or packed[1] < sheets:
+            placements, sheets = packed
+    return placements, sheets, too_large
+
+
+def _pack_shelves(cells: list, free_width: float, free_height: float, bleed: float, gutter: float,
+                  margin: float) -> tuple:
+    """
+    :param cells: [((cell width, cell height, rotated), plate index)]
+    :return: ([Placement] in sheet, shelf order; sheets count)
+    """
+    # plates come in decreasing height, so every shelf is high enough for the plate and only its width is checked
+    cells = sorted(cells, key=lambda item: (-item[0][1], -item[0][0]))
+
+    placements = []
+    shelves = []  # [sheet, y, used width]
+    shelf_room = _FirstFit(len(cells))
+    sheets = []  # used height
+    sheet_room = _FirstFit(len(cells))
+    for (cell_width, cell_height, rotated), index in cells:
+        shelf_index = shelf_room.find(cell_width)
+        if shelf_index < 0:
+            sheet = sheet_room.find(cell_height)
+            if sheet < 0:
+                sheet = sheet_room.append(free_height)
+                sheets.append(0)
+            shelf_index = shelf_room.append(free_width)
+            shelves.append([sheet, sheets[sheet], 0])
+            sheets[sheet] += cell_height
+            sheet_room.update(sheet, free_height - sheets[sheet])
+
+        shelf = shelves[shelf_index]
+        sheet, y, x = shelf
+        placements.append(Placement(sheet, margin + x + bleed, margin + y + bleed, cell_width - bleed * 2 - gutter,
+                                    cell_height - bleed * 2 - gutter, rotated, index))
+        shelf[2] += cell_width
+        shelf_room.update(shelf_index, free_width - shelf[2])
+
+    placements.sort(key=lambda placement: placement.sheet)
+    return placements, len(sheets)
+
+
+def utilisation(placements, sheets: int, sheet_width: float, sheet_height: float) -> dict:
+    """ plate (trim box) area / sheet area, overall and per sheet
+    """
+    used = [0] * sheets
+    for placement in placements:
+        used[placement.sheet] += placement.width * placement.height
+    sheet_area = sheet_width * sheet_height
+    return {'sheets': sheets, 'plates': len(placements),
+            'utilisation': sum(used) / (sheet_area * sheets) if sheets else 0,
+            'sheet_utilisation': [area / sheet_area for area in used]}
+
+
+def _draw_crop_marks(work_canvas, x: float, y: float, width: float, height: float, bleed: float, length: float):
+    offset = bleed + CROP_MARK_OFFSET
+    for corner_x, corner_y, kx, ky in ((x, y, -1, -1), (x + width, y, 1, -1),
+                                       (x, y + height, -1, 1), (x + width, y + height, 1, 1)):
+        work_canvas.line(corner_x + kx * offset, corner_y, corner_x + kx * (offset + length), corner_y)
+        work_canvas.line(corner_x, corner_y + ky * offset, corner_x, corner_y + ky * (offset + length))
+
+
+def draw_sheets(work_canvas, plates: list, placements, sheets: int, sheet_width: float, sheet_height: float,
+                gutter: float = 0, bleed: float = 0, crop_marks: bool = True):
+    """ one page per sheet, every plate on its bleed box of background color, crop marks at trim box corners
+    in the gutter
+
+    :param work_canvas: PlateCanvas (address_plate.pdf_canvas)
+    :param placements: of pack(), in sheet order
+    """
+    from plate_canvas import COLOR_REGISTRATION
+
+    mark_length = min(CROP_MARK_LENGTH, max(0, gutter / 2 - CROP_MARK_OFFSET))
+    placements = iter(placements)
+    placement = next(placements, None)
+    for sheet in range(sheets):
+        work_canvas.setPageSize((sheet_width, sheet_height))
+        while placement is not None and placement.sheet == sheet:
+            x, y, width, height = placement.x, placement.y, placement.width, placement.height
+            work_canvas.saveState()
+            if bleed:
+                work_canvas.setFillColor(work_canvas.background_color)
+                work_canvas.rect(x - bleed, y - bleed, width + bleed * 2, height + bleed * 2, stroke=0, fill=1)
+            if placement.rotated:
+                # plate (u, v) is drawn at (x + width - v, y + u) of sheet (y is down), width as placed
+                work_canvas.translate(x + width, y)
+                work_canvas.rotate(90)
+            else:
+                work_canvas.translate(x, y)
+            plates[placement.index].draw(work_canvas)
+            work_canvas.restoreState()
+
+            if crop_marks and mark_length:
+                work_canvas.saveState()
+                work_canvas.setStrokeColor(COLOR_REGISTRATION)
+                work_canvas.setLineWidth(CROP_MARK_WIDTH)
+                _draw_crop_marks(work_canvas, x, y, width, height, bleed, mark_length)
+                work_canvas.restoreState()
+            placement = next(placements, None)
+        work_canvas.showPage()
+
+
+def impose(plates: list, out, sheet_width: float, sheet_height: float, gutter: float = 0, bleed: float = 0,
+           margin: float = 0, rotate: bool = False, crop_marks: bool = True, text_forms: bool = False) -> dict:
+    """ plates packed onto sheets as pages of one pdf
+
+    :param plates: StreetName/StreetNumber/Vertical
+    :param out: file name or binary file object
+    :param text_forms: texts repeated on many plates as form xobjects (see PlateCanvas)
+    :return: utilisation() + 'too_large': [index of plate larger than sheet]
+    """
+    from address_plate import pdf_canvas
+
+    placements, sheets, too_large = pack([(plate.width, plate.height) for plate in plates], sheet_width,
+                                         sheet_height, gutter, bleed, margin, rotate)
+    work_canvas = pdf_canvas(out, text_forms=text_forms, header_forms=True)
+    if work_canvas.compression != 0:
+        work_canvas.compress_pages()
+    draw_sheets(work_canvas, plates, placements, sheets, sheet_width, sheet_height, gutter, bleed, crop_marks)
+    work_canvas.save()
+    report = utilisation(placements, sheets, sheet_width, sheet_height)
+    report['too_large'] = too_large
+    return report
@@ -0,0 +1,285 @@
+""" resumable batch job: manifest rows in a sqlite queue, rendered in chunks by any number of worker processes
+
+    python3 address_plate.py job create --job city.job --manifest plates.csv --out_dir out
+    python3 address_plate.py job work --job city.job --workers 0  # more machines: same command on shared fs
+    python3 address_plate.py job status --job city.job
+
+a worker claims a pending chunk, renders its rows by render_batch() and marks it done with row errors
+in one transaction, an interrupted job goes on with chunks not done, a claim older than stale seconds
+(worker died) is claimed again, a chunk claimed max_attempts times is failed, a chunk render_batch() raised on
+(out_dir not writable, font error) is failed at once with the error on its rows, 'job retry' makes failed
+chunks pending again
+
+workers on several machines need a filesystem with working file locks (sqlite locking), out_dir is shared too,
+render settings of job create (--numpy, --direct, --pdf_mode) are kept in the job and used by every worker
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'  # claimed max_attempts times (worker died on every try) or render_batch() raised
+
+CHUNK_ROWS = 256
+STALE = 600  # s, claim of a worker not done in this time is taken by other worker
+MAX_ATTEMPTS = 3
+RATE_WINDOW = 60  # s, throughput of status() is of chunks done in this last time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS job (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk INTEGER PRIMARY KEY, state TEXT NOT NULL, rows INTEGER NOT NULL, errors INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0, claim TEXT, worker TEXT, claimed_at REAL, done_at REAL, seconds REAL
+);
+CREATE INDEX IF NOT EXISTS chunks_state ON chunks (state, claimed_at);
+CREATE TABLE IF NOT EXISTS rows (line INTEGER PRIMARY KEY, chunk INTEGER NOT NULL, row TEXT NOT NULL, error TEXT);
+CREATE INDEX IF NOT EXISTS rows_chunk ON rows (chunk);
+'''
+
+
+def connect(path: str, new: bool = False) -> sqlite3.Connection:
+    """ autocommit connection, transactions are begun explicitly (BEGIN IMMEDIATE - claim is atomic)
+
+    :param new: create job file, else it must exist
+    """
+    if not new and not os.path.exists(path):
+        raise FileNotFoundError(f'no job {path}')
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def create(path: str, rows, out_dir: str = '.', default_wide: str = None, chunk_rows: int = CHUNK_ROWS,
+           settings: dict = None) -> int:
+    """ new job of manifest rows, chunks of chunk_rows rows
+
+    :param default_wide: address_plate.THIN if None
+    :param settings: address_plate.render_settings() of workers, of this process if None
+    :return: rows
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f'job {path} exists, run it or remove it')
+    from address_plate import THIN, render_settings
+
+    connection = connect(path, new=True)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.executemany('INSERT INTO job VALUES (?, ?)', (
+            ('out_dir', os.path.abspath(out_dir)), ('default_wide', default_wide or THIN),
+            ('render_settings', json.dumps(render_settings() if settings is None else settings)),
+            ('created', str(time.time()))))
+        chunk = count = 0
+        batch = []
+        for line, row in enumerate(rows, 1):
+            chunk = (line - 1) // chunk_rows
+            batch.append((line, chunk, json.dumps(row, ensure_ascii=False)))
+            count = line
+            if len(batch) >= 4096:
+                connection.executemany('INSERT INTO rows (line, chunk, row) VALUES (?, ?, ?)', batch)
+                batch = []
+        connection.executemany('INSERT INTO rows (line, chunk, row) VALUES (?, ?, ?)', batch)
+        connection.executemany('INSERT INTO chunks (chunk, state, rows) VALUES (?, ?, ?)',
+                               ((c, PENDING, min(chunk_rows, count - c * chunk_rows))
+                                for c in range(chunk + 1 if count else 0)))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.close()
+        os.unlink(path)
+        raise
+    connection.close()
+    return count
+
+
+def _job(connection: sqlite3.Connection) -> dict:
+    return dict(connection.execute('SELECT name, value FROM job'))
+
+
+def claim(connection: sqlite3.Connection, worker: str, stale: float = STALE, max_attempts: int = MAX_ATTEMPTS):
+    """ take first pending chunk or chunk of stale claim
+
+    :return: (chunk, claim token) or None if nothing to claim
+    """
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        connection.execute('UPDATE chunks SET state = ?, claim = NULL WHERE state = ? AND claimed_at < ? '
+                           'AND attempts >= ?', (FAILED, CLAIMED, now - stale, max_attempts))
+        found = connection.execute('SELECT chunk FROM chunks WHERE state = ? OR state = ? AND claimed_at < ? '
+                                   'ORDER BY chunk LIMIT 1', (PENDING, CLAIMED, now - stale)).fetchone()
+        if found is None:
+            connection.execute('COMMIT')
+            return None
+        token = uuid.uuid4().hex
+        connection.execute('UPDATE chunks SET state = ?, claim = ?, worker = ?, claimed_at = ?, '
+                           'attempts = attempts + 1 WHERE chunk = ?', (CLAIMED, token, worker, now, found[0]))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return found[0], token
+
+
+def complete(connection: sqlite3.Connection, chunk: int, token: str, errors: list, seconds: float) -> bool:
+    """ mark chunk done with its row errors, if the claim is still of this worker
+
+    :param errors: [(line, error message)]
+    :return: False - chunk was claimed by other worker (this one was stale), nothing is changed
+    """
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        updated = connection.execute('UPDATE chunks SET state = ?, errors = ?, done_at = ?, seconds = ? '
+                                     'WHERE chunk = ? AND claim = ? AND state = ?',
+                                     (DONE, len(errors), time.time(), seconds, chunk, token, CLAIMED)).rowcount
+        if updated:
+            connection.executemany('UPDATE rows SET error = ? WHERE line = ?',
+                                   [(error, line) for line, error in errors])
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return bool(updated)
+
+
+def fail(connection: sqlite3.Connection, chunk: int, token: str, error: str, seconds: float) -> bool:
+    """ mark chunk failed with error on all its rows, if the claim is still of this worker
+
+    :return: False - chunk was claimed by other worker (this one was stale), nothing is changed
+    """
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        updated = connection.execute('UPDATE chunks SET state = ?, done_at = ?, seconds = ? '
+                                     'WHERE chunk = ? AND claim = ? AND state = ?',
+                                     (FAILED, time.time(), seconds, chunk, token, CLAIMED)).rowcount
+        if updated:
+            connection.execute('UPDATE rows SET error = ? WHERE chunk = ?', (error, chunk))
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return bool(updated)
+
+
+def retry(path: str) -> int:
+    """ failed chunks to pending, their row errors are cleared
+
+    :return: chunks
+    """
+    connection = connect(path)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('UPDATE rows SET error = NULL WHERE chunk IN (SELECT chunk FROM chunks WHERE state = ?)',
+                               (FAILED,))
+            chunks = connection.execute('UPDATE chunks SET state = ?, attempts = 0, claim = NULL, errors = 0 '
+                                        'WHERE state = ?', (PENDING, FAILED)).rowcount
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+    finally:
+        connection.close()
+    return chunks
+
+
+def work(path: str, stale: float = STALE, max_attempts: int = MAX_ATTEMPTS, cache_dir: str = None,
+         cache_size: int = 1024 ** 3) -> dict:
+    """ claim and render chunks till there is nothing to claim, with render settings of the job
+    (of this process for jobs created without them)
+
+    :param cache_dir: RenderCache directory (render_cache.py)
+    :return: {'worker', 'chunks', 'rows', 'errors', 'failed' (chunks), 'seconds'} done by this worker
+    """
+    from address_plate import apply_render_settings, render_batch
+    from plate_output import DirectorySink
+
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    connection = connect(path)
+    job = _job(connection)
+    if 'render_settings' in job:
+        apply_render_settings(json.loads(job['render_settings']))
+    sink = DirectorySink(job['out_dir'])
+    cache = None
+    if cache_dir:
+        from render_cache import RenderCache
+
+        cache = RenderCache(cache_dir, max_bytes=cache_size)
+    done = {'worker': worker, 'chunks': 0, 'rows': 0, 'errors': 0, 'failed': 0, 'seconds': 0.0}
+    try:
+        while True:
+            claimed = claim(connection, worker, stale, max_attempts)
+            if claimed is None:
+                break
+            chunk, token = claimed
+            start = time.perf_counter()
+            lines, rows = [], []
+            for line, row in connection.execute('SELECT line, row FROM rows WHERE chunk = ? ORDER BY line',
+                                                (chunk,)):
+                lines.append(line)
+                rows.append(json.loads(row))
+            try:
+                results = render_batch(rows, default_wide=job['default_wide'], sink=sink, cache=cache)
+            except Exception as e:
+                # would raise again on retry, stale reclaim is for workers that died
+                if fail(connection, chunk, token, f'{type(e).__name__}: {e}', time.perf_counter() - start):
+                    done['failed'] += 1
+                continue
+            errors = [(lines[result.line - 1], result.error) for result in results if result.error]
+            seconds = time.perf_counter() - start
+            if complete(connection, chunk, token, errors, seconds):
+                done['chunks'] += 1
+                done['rows'] += len(rows)
+                done['errors'] += len(errors)
+                done['seconds'] += seconds
+    finally:
+        connection.close()
+    return done
+
+
+def status(path: str, stale: float = STALE) -> dict:
+    """ progress of job, may be called while workers run
+
+    :return: {'rows', 'rows_done', 'rows_failed' (of failed chunks), 'errors' (rows not rendered of done chunks),
+        'chunks': {state: n}, 'workers' (active), 'rows_per_second' (last RATE_WINDOW s), 'eta_seconds',
+        'elapsed_seconds', 'done'}
+    """
+    connection = connect(path)
+    try:
+        now = time.time()
+        chunks = dict(connection.execute('SELECT state, COUNT(*) FROM chunks GROUP BY state'))
+        rows, rows_done, rows_failed, errors, first_claim = connection.execute(
+            'SELECT SUM(rows), SUM(CASE WHEN state = ? THEN rows ELSE 0 END), '
+            'SUM(CASE WHEN state = ? THEN rows ELSE 0 END), SUM(errors), MIN(claimed_at) FROM chunks',
+            (DONE, FAILED)).fetchone()
+        recent = connection.execute('SELECT SUM(rows) FROM chunks WHERE state = ? AND done_at >= ?',
+                                    (DONE, now - RATE_WINDOW)).fetchone()[0]
+        workers = connection.execute('SELECT COUNT(DISTINCT worker) FROM chunks WHERE state = ? AND claimed_at >= ?',
+                                     (CLAIMED, now - stale)).fetchone()[0]
+    finally:
+        connection.close()
+    rows, rows_done, rows_failed, errors = rows or 0, rows_done or 0, rows_failed or 0, errors or 0
+    window = min(RATE_WINDOW, now - first_claim) if first_claim else 0
+    rate = (recent or 0) / window if window > 0 else 0
+    left = rows - rows_done - rows_failed
+    return {'rows': rows, 'rows_done': rows_done, 'rows_failed': rows_failed, 'errors': errors,
+            'chunks': {state: chunks.get(state, 0) for state in (PENDING, CLAIMED, DONE, FAILED)},
+            'workers': workers, 'rows_per_second': rate, 'eta_seconds': left / rate if rate else None,
+            'elapsed_seconds': now - first_claim if first_claim else 0,
+            'done': chunks.get(PENDING, 0) == chunks.get(CLAIMED, 0) == 0}
+
+
+def row_errors(path: str):
+    """ yield (line, output, error) of failed rows and rows of failed chunks
+    """
+    connection = connect(path)
+    try:
+        for line, row, error, state in connection.execute(
+                'SELECT line, row, error, state FROM rows JOIN chunks USING (chunk) '
+                'WHERE error IS NOT NULL OR state = ? ORDER BY line', (FAILED,)):
+            yield line, json.loads(row).get('output'), error or 'chunk failed, worker died on every attempt'
+    finally:
+        connection.close()
@@ -0,0 +1,170 @@
+""" opt-in render metrics: wall time and calls per phase and plate type, counters
+
+    python3 address_plate.py --metrics metrics.json batch --manifest plates.csv
+    ADDRESS_PLATE_METRICS=metrics.prom python3 address_plate.py number --house_num 12 > 12.pdf
+
+phases:
+    layout        BasePlate.text_paths(), text layout including layout cache and glyph_lookup
+    glyph_lookup  glyph outline lookup in glyph store (TextPaths.path_dict)
+    draw_page     BasePlate.draw_page(), whole plate drawing including draw_text
+    draw_text     TextPaths.draw(), reportlab path building
+    save          canvas.save(), pdf serialization and stream compression
+counters:
+    plates, glyphs (drawn), output_bytes, layout_cache_hits, layout_cache_misses, layout_cache_evictions
+
+metrics of pool workers come back to the parent with every rendered chunk (pop() - merge()),
+threads rendering at once record to the same Metrics, plate type of running phase is per thread
+"""
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+
+class Metrics:
+
+    def __init__(self, layout_cache=None):
+        """
+        :param layout_cache: LayoutCache, its hits/misses/evictions are added to counters
+        """
+        # (phase, plate): [calls, seconds]
+        self.phases = {}
+        # (counter, plate): value
+        self.counters = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # func(phase, plate, seconds) called at end of every phase
+        self.hooks = []
+        self.layout_cache = layout_cache
+        self._layout_cache_seen = layout_cache.stats() if layout_cache is not None else {}
+
+    @property
+    def plate(self) -> str:
+        """ plate type of running phase of this thread, nested phases and counters get it
+        """
+        return getattr(self._local, 'plate', '')
+
+    @plate.setter
+    def plate(self, plate: str):
+        self._local.plate = plate
+
+    @contextmanager
+    def phase(self, name: str, plate: str = None):
+        outer = self.plate
+        if plate is not None:
+            self.plate = plate
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+            self.plate = outer
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        plate = self.plate
+        with self._lock:
+            stat = self.phases.setdefault((name, plate), [0, 0.0])
+            stat[0] += calls
+            stat[1] += seconds
+        for hook in self.hooks:
+            hook(name, plate, seconds)
+
+    def count(self, name: str, value: int = 1, plate: str = None):
+        key = (name, self.plate if plate is None else plate)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def _count_layout_cache(self):
+        """ layout cache hits/misses/evictions since last call to counters
+        """
+        if self.layout_cache is None:
+            return
+        with self._lock:
+            stats = self.layout_cache.stats()
+            for name in ('hits', 'misses', 'evictions'):
+                seen = self._layout_cache_seen.get(name, 0)
+                # LayoutCache.clear() resets its counters
+                self.count(f'layout_cache_{name}', stats[name] - seen if stats[name] >= seen else stats[name],
+                           plate='')
+            self._layout_cache_seen = stats
+
+    def pop(self) -> dict:
+        """ raw metrics for merge() in other process, metrics are reset
+        """
+        with self._lock:
+            self._count_layout_cache()
+            raw = {'phases': list(self.phases.items()), 'counters': list(self.counters.items())}
+            self.reset()
+        return raw
+
+    def merge(self, raw: dict):
+        with self._lock:
+            for key, (calls, seconds) in raw['phases']:
+                stat = self.phases.setdefault(tuple(key), [0, 0.0])
+                stat[0] += calls
+                stat[1] += seconds
+            for key, value in raw['counters']:
+                key = tuple(key)
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}
+            self.counters = {}
+
+    def _items(self) -> tuple:
+        """ sorted copies of phases and counters, consistent while other threads record
+        """
+        with self._lock:
+            self._count_layout_cache()
+            return (sorted((key, tuple(stat)) for key, stat in self.phases.items()),
+                    sorted(self.counters.items()))
+
+    def snapshot(self) -> dict:
+        """
+        {
+            'phases': {phase: {plate: {'calls': n, 'seconds': s}}},
+            'counters': {counter: {plate: n}},
+            'layout_cache_hit_rate': hits / (hits + misses)
+        }
+        """
+        phase_items, counter_items = self._items()
+        phases = {}
+        for (name, plate), (calls, seconds) in phase_items:
+            phases.setdefault(name, {})[plate] = {'calls': calls, 'seconds': seconds}
+        counters = {}
+        for (name, plate), value in counter_items:
+            counters.setdefault(name, {})[plate] = value
+        hits = counters.get('layout_cache_hits', {}).get('', 0)
+        lookups = hits + counters.get('layout_cache_misses', {}).get('', 0)
+        return {'phases': phases, 'counters': counters, 'layout_cache_hit_rate': hits / lookups if lookups else None}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """ prometheus text exposition format
+        """
+        phase_items, counter_items = self._items()
+        lines = ['# TYPE address_plate_phase_seconds_total counter']
+        lines += [f'address_plate_phase_seconds_total{{phase="{name}",plate="{plate}"}} {seconds}'
+                  for (name, plate), (_, seconds) in phase_items]
+        lines.append('# TYPE address_plate_phase_calls_total counter')
+        lines += [f'address_plate_phase_calls_total{{phase="{name}",plate="{plate}"}} {calls}'
+                  for (name, plate), (calls, _) in phase_items]
+        for name in sorted({name for (name, _), _ in counter_items}):
+            lines.append(f'# TYPE address_plate_{name}_total counter')
+            lines += [f'address_plate_{name}_total{{plate="{plate}"}} {value}'
+                      for (counter, plate), value in counter_items if counter == name]
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str):
+        """ to file, prometheus text for .prom/.txt, json otherwise, '-' - stderr as json
+        """
+        if path == '-':
+            import sys
+
+            print(self.to_json(), file=sys.stderr)
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus() if path.endswith(('.prom', '.txt')) else self.to_json())
@@ -0,0 +1,179 @@
+""" where batch outputs go: files in a directory or entries of zip/tar written as a stream
+
+archives are written entry by entry to any binary stream (stdout, pipe),
+so memory does not grow with number of plates,
+invariant archives (--pdf_mode invariant, reportlab rl_config.invariant) are the same bytes every run
+"""
+import gzip
+import io
+import os
+import posixpath
+import sys
+import tarfile
+import time
+import uuid
+import zipfile
+
+
+def entry_name(name: str) -> str:
+    """ relative path of output in archive
+
+    :raise ValueError: absolute name or name with '..', archive would be extracted outside its directory
+    """
+    parts = name.replace('\\', '/').split('/')
+    if not name or os.path.isabs(name) or name.startswith(('/', '\\')) or '..' in parts:
+        raise ValueError(f'output {name!r} is not a relative path')
+    return name
+
+
+# entry time of invariant archives, first date of zip
+INVARIANT_TIME = (1980, 1, 1, 0, 0, 0)
+INVARIANT_MTIME = 315532800  # INVARIANT_TIME UTC, s
+
+
+def _invariant(invariant: bool = None) -> bool:
+    if invariant is None:
+        from reportlab import rl_config
+
+        return bool(rl_config.invariant)
+    return invariant
+
+
+class _Entries:
+    """ names of archive entries, an archive may have entries of one name, but extracted one file is left
+    """
+
+    def __init__(self):
+        self.names = set()
+
+    def add(self, name: str) -> str:
+        """
+        :return: entry_name(name)
+        :raise ValueError: not a relative path, or an entry of this name (as extracted) is written already
+        """
+        path = posixpath.normpath(entry_name(name).replace('\\', '/'))
+        if path in self.names:
+            raise ValueError(f'output {name!r} is in archive already')
+        self.names.add(path)
+        return name
+
+
+class DirectorySink:
+    """ every file is written to a temp file and renamed, so a killed batch (or job worker) leaves
+    no half written plates and workers writing the same file do not mix
+    """
+
+    def __init__(self, out_dir: str = '.'):
+        self.out_dir = out_dir
+
+    def path(self, name: str) -> str:
+        """
+        :raise ValueError: name (absolute, '..', symlink) is outside out_dir
+        """
+        out_dir = os.path.realpath(self.out_dir)
+        path = os.path.realpath(os.path.join(out_dir, name))
+        if path == out_dir or os.path.commonpath((out_dir, path)) != out_dir:
+            raise ValueError(f'output {name!r} is outside {self.out_dir}')
+        return path
+
+    def write(self, name: str, data: bytes):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # not mkstemp, plates get usual (umask) permissions
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(temp_path, 'xb') as out:
+                out.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        pass
+
+
+class ZipSink:
+    """ pdf is compressed already, so entries are stored
+    """
+
+    def __init__(self, fileobj, close_fileobj: bool = False, invariant: bool = None):
+        """
+        :param invariant: entries of INVARIANT_TIME, reportlab rl_config.invariant if None
+        """
+        self.fileobj = fileobj
+        self.close_fileobj = close_fileobj
+        self.invariant = _invariant(invariant)
+        self.zip = zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED)
+        self.entries = _Entries()
+
+    def write(self, name: str, data: bytes):
+        name = self.entries.add(name)
+        self.zip.writestr(zipfile.ZipInfo(name, INVARIANT_TIME if self.invariant else time.localtime()[:6]), data)
+        self.fileobj.flush()
+
+    def close(self):
+        self.zip.close()
+        self.fileobj.flush()
+        if self.close_fileobj:
+            self.fileobj.close()
+
+
+class TarSink:
+
+    def __init__(self, fileobj, compression: str = '', close_fileobj: bool = False, invariant: bool = None):
+        """
+        :param compression: '', 'gz', 'bz2' or 'xz'
+        :param invariant: entries of INVARIANT_MTIME, reportlab rl_config.invariant if None
+        """
+        self.fileobj = fileobj
+        self.close_fileobj = close_fileobj
+        self.invariant = _invariant(invariant)
+        self.gzip = None
+        if compression == 'gz' and self.invariant:
+            # gzip header of tarfile has time of writing
+            self.gzip = gzip.GzipFile(filename='', mode='wb', fileobj=fileobj, mtime=0)
+            fileobj, compression = self.gzip, ''
+        self.tar = tarfile.open(fileobj=fileobj, mode=f'w|{compression}')
+        self.entries = _Entries()
+
+    def write(self, name: str, data: bytes):
+        info = tarfile.TarInfo(self.entries.add(name))
+        info.size = len(data)
+        info.mtime = INVARIANT_MTIME if self.invariant else int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+        self.fileobj.flush()
+
+    def close(self):
+        self.tar.close()
+        if self.gzip is not None:
+            self.gzip.close()
+        self.fileobj.flush()
+        if self.close_fileobj:
+            self.fileobj.close()
+
+
+ARCHIVE_FORMATS = {'zip': None, 'tar': '', 'tar.gz': 'gz', 'tgz': 'gz', 'tar.bz2': 'bz2', 'tar.xz': 'xz'}
+
+
+def open_sink(archive: str = None, out_dir: str = '.', archive_format: str = None, invariant: bool = None):
+    """
+    :param archive: None - files in out_dir, '-' - archive to stdout, else archive file name
+    :param archive_format: key of ARCHIVE_FORMATS, by archive extension (zip for '-') if None
+    :param invariant: archive of fixed entry times, reportlab rl_config.invariant if None
+    """
+    if archive is None:
+        return DirectorySink(out_dir)
+
+    if archive_format is None:
+        archive_format = next((name for name in ARCHIVE_FORMATS if archive.endswith(f'.{name}')), 'zip')
+    compression = ARCHIVE_FORMATS[archive_format]
+
+    stdout = archive == '-'
+    fileobj = sys.stdout.buffer if stdout else open(archive, 'wb')
+    if compression is None:
+        return ZipSink(fileobj, close_fileobj=not stdout, invariant=invariant)
+    return TarSink(fileobj, compression, close_fileobj=not stdout, invariant=invariant)
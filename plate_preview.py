@@ -0,0 +1,290 @@
+""" svg and png previews of plates, no pdf machinery (reportlab is not imported)
+
+plates are drawn by the same BasePlate.draw_page() from the same TextPaths and SIZES_PT as pdf,
+preview canvas is the part of canvas api plates use, so preview can not drift from print
+
+    python3 address_plate.py --preview svg number --house_num 12 > 12.svg
+    python3 address_plate.py --preview png number --house_num 12 > 12.png
+
+png is rasterized by pillow (comes with reportlab), svg needs nothing
+"""
+import io
+import math
+import weakref
+
+IDENTITY = (1, 0, 0, 1, 0, 0)
+CURVE_SEGMENTS = 8  # lines per bezier curve in png
+ARC_SEGMENTS = 8  # lines per round corner in png
+
+# (precision, svg path data) and [[(x, y)]] subpaths of shared (LAYOUT_CACHE) TextPaths
+_svg_paths = weakref.WeakKeyDictionary()
+_polygons = weakref.WeakKeyDictionary()
+
+
+def svg_path_data(operations, precision: int = 2) -> str:
+    """ svg path d of [(operation_type, (points))]
+    """
+    number = f'%.{precision}f'
+    formats = {'moveTo': f'M{number} {number}', 'lineTo': f'L{number} {number}',
+               'curveTo': f'C{number} {number} {number} {number} {number} {number}', 'close': 'Z'}
+    return ''.join([formats[type_op] % points for type_op, points in operations])
+
+
+def polygons(operations) -> list:
+    """ subpaths of [(operation_type, (points))] as [[(x, y)]], curves are split to CURVE_SEGMENTS lines
+    """
+    result = []
+    polygon = []
+    x, y = 0, 0
+    for type_op, points in operations:
+        if type_op == 'moveTo':
+            if len(polygon) > 2:
+                result.append(polygon)
+            x, y = points
+            polygon = [(x, y)]
+        elif type_op == 'lineTo':
+            x, y = points
+            polygon.append((x, y))
+        elif type_op == 'curveTo':
+            x1, y1, x2, y2, x3, y3 = points
+            for i in range(1, CURVE_SEGMENTS + 1):
+                t = i / CURVE_SEGMENTS
+                s = 1 - t
+                polygon.append((s * s * s * x + 3 * s * s * t * x1 + 3 * s * t * t * x2 + t * t * t * x3,
+                                s * s * s * y + 3 * s * s * t * y1 + 3 * s * t * t * y2 + t * t * t * y3))
+            x, y = x3, y3
+    if len(polygon) > 2:
+        result.append(polygon)
+    return result
+
+
+class PreviewCanvas:
+    """ canvas state (translate, scale, saveState/restoreState, colors, line width) as reportlab keeps it,
+    drawing is done by SvgCanvas/PngCanvas
+    """
+
+    preview = True  # TextPaths.draw() calls fill_text_paths()
+    background_color = '#171b45'  # COLOR_DARK_BLUE (cmyk 75 65 0 75) as pdf viewers show it
+    face_color = '#ffffff'
+
+    def __init__(self):
+        self.width = self.height = 0
+        self.pages = []
+        self._reset()
+
+    def _reset(self):
+        self.matrix = IDENTITY
+        self.fill_color = self.stroke_color = '#000000'
+        self.line_width = 1
+        self._states = []
+
+    def setPageSize(self, size: tuple):
+        self.width, self.height = size
+
+    def setFillColor(self, color: str):
+        self.fill_color = color
+
+    def setStrokeColor(self, color: str):
+        self.stroke_color = color
+
+    def setLineWidth(self, width: float):
+        self.line_width = width
+
+    def saveState(self):
+        self._states.append((self.matrix, self.fill_color, self.stroke_color, self.line_width))
+
+    def restoreState(self):
+        self.matrix, self.fill_color, self.stroke_color, self.line_width = self._states.pop()
+
+    def translate(self, dx: float, dy: float):
+        a, b, c, d, e, f = self.matrix
+        self.matrix = (a, b, c, d, e + a * dx + c * dy, f + b * dx + d * dy)
+
+    def scale(self, x: float, y: float):
+        a, b, c, d, e, f = self.matrix
+        self.matrix = (a * x, b * x, c * y, d * y, e, f)
+
+    def showPage(self):
+        self.pages.append(self._page())
+        self._reset()
+
+    def _page(self):
+        """ must be override in children class
+        """
+        pass
+
+
+class SvgCanvas(PreviewCanvas):
+
+    def __init__(self, scale: float = 1.0, precision: int = 2):
+        """
+        :param scale: px per pt of svg width and height
+        :param precision: digits after point of coordinates
+        """
+        super().__init__()
+        self.scale_factor = scale
+        self.precision = precision
+        self._number = f'%.{precision}f'
+        self._elements = []
+
+    def _transform(self) -> str:
+        if self.matrix == IDENTITY:
+            return ''
+        return ' transform="matrix(%s)"' % ' '.join([self._number % value for value in self.matrix])
+
+    def roundRect(self, x: float, y: float, width: float, height: float, radius: float, stroke: int = 1,
+                  fill: int = 0):
+        n = self._number
+        self._elements.append(
+            f'<rect x="{n % min(x, x + width)}" y="{n % min(y, y + height)}" width="{n % abs(width)}" '
+            f'height="{n % abs(height)}" rx="{n % radius}"{self._paint(stroke, fill)}{self._transform()}/>')
+
+    def line(self, x1: float, y1: float, x2: float, y2: float):
+        n = self._number
+        self._elements.append(f'<line x1="{n % x1}" y1="{n % y1}" x2="{n % x2}" y2="{n % y2}"'
+                              f'{self._paint(1, 0)}{self._transform()}/>')
+
+    def fill_operations(self, operations):
+        self._fill_path(svg_path_data(operations, self.precision))
+
+    def fill_text_paths(self, text_paths):
+        cached = _svg_paths.get(text_paths)
+        if cached is None or cached[0] != self.precision:
+            cached = _svg_paths[text_paths] = (self.precision, svg_path_data(text_paths.operations, self.precision))
+        self._fill_path(cached[1])
+
+    def _fill_path(self, path_data: str):
+        if path_data:
+            self._elements.append(f'<path d="{path_data}" fill-rule="evenodd"{self._paint(0, 1)}{self._transform()}/>')
+
+    def _paint(self, stroke: int, fill: int) -> str:
+        paint = f' fill="{self.fill_color}"' if fill else ' fill="none"'
+        if stroke:
+            paint += f' stroke="{self.stroke_color}" stroke-width="{self._number % self.line_width}"'
+        return paint
+
+    def _page(self) -> str:
+        width, height = self._number % self.width, self._number % self.height
+        page = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{self._number % (self.width * self.scale_factor)}" '
+                f'height="{self._number % (self.height * self.scale_factor)}" viewBox="0 0 {width} {height}">'
+                + ''.join(self._elements) + '</svg>')
+        self._elements = []
+        return page
+
+
+class PngCanvas(PreviewCanvas):
+    """ pillow raster, drawn supersample times larger and reduced for antialiasing,
+    fills are even-odd as in pdf (subpaths are xor-ed)
+    """
+
+    def __init__(self, scale: float = 0.25, supersample: int = 2):
+        """
+        :param scale: px per pt
+        """
+        from PIL import Image, ImageChops, ImageDraw
+
+        super().__init__()
+        self._pil = Image, ImageChops, ImageDraw
+        self.scale_factor = scale
+        self.supersample = supersample
+        self.image = None
+
+    def setPageSize(self, size: tuple):
+        super().setPageSize(size)
+        k = self.scale_factor * self.supersample
+        # white outside of round corners, as pdf page
+        self.image = self._pil[0].new('RGB', (max(1, math.ceil(self.width * k)), max(1, math.ceil(self.height * k))),
+                                      '#ffffff')
+
+    def _device(self, polygon: list) -> list:
+        a, b, c, d, e, f = self.matrix
+        k = self.scale_factor * self.supersample
+        return [((a * x + c * y + e) * k, (b * x + d * y + f) * k) for x, y in polygon]
+
+    def _fill_polygons(self, polygon_list: list, color: str):
+        Image, ImageChops, ImageDraw = self._pil
+        polygon_list = [self._device(polygon) for polygon in polygon_list]
+        if not polygon_list:
+            return
+        x0 = max(0, math.floor(min(x for polygon in polygon_list for x, _ in polygon)))
+        y0 = max(0, math.floor(min(y for polygon in polygon_list for _, y in polygon)))
+        x1 = min(self.image.width, math.ceil(max(x for polygon in polygon_list for x, _ in polygon)) + 1)
+        y1 = min(self.image.height, math.ceil(max(y for polygon in polygon_list for _, y in polygon)) + 1)
+        if x1 <= x0 or y1 <= y0:
+            return
+
+        mask = Image.new('1', (x1 - x0, y1 - y0))
+        if len(polygon_list) == 1:
+            ImageDraw.Draw(mask).polygon([(x - x0, y - y0) for x, y in polygon_list[0]], fill=1)
+        else:
+            for polygon in polygon_list:
+                # xor in the box of the subpath only, glyph subpaths are small parts of text
+                px0 = max(x0, math.floor(min(x for x, _ in polygon)))
+                py0 = max(y0, math.floor(min(y for _, y in polygon)))
+                box = (px0 - x0, py0 - y0,
+                       min(x1, math.ceil(max(x for x, _ in polygon)) + 1) - x0,
+                       min(y1, math.ceil(max(y for _, y in polygon)) + 1) - y0)
+                if box[2] <= box[0] or box[3] <= box[1]:
+                    continue
+                part = Image.new('1', (box[2] - box[0], box[3] - box[1]))
+                ImageDraw.Draw(part).polygon([(x - px0, y - py0) for x, y in polygon], fill=1)
+                mask.paste(ImageChops.logical_xor(mask.crop(box), part), box)
+        self.image.paste(color, (x0, y0, x1, y1), mask)
+
+    def roundRect(self, x: float, y: float, width: float, height: float, radius: float, stroke: int = 1,
+                  fill: int = 0):
+        x1, x2 = min(x, x + width), max(x, x + width)
+        y1, y2 = min(y, y + height), max(y, y + height)
+        polygon = []
+        for cx, cy, start in ((x2 - radius, y1 + radius, -90), (x2 - radius, y2 - radius, 0),
+                              (x1 + radius, y2 - radius, 90), (x1 + radius, y1 + radius, 180)):
+            for i in range(ARC_SEGMENTS + 1):
+                angle = math.radians(start + 90 * i / ARC_SEGMENTS)
+                polygon.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+        if fill:
+            self._fill_polygons([polygon], self.fill_color)
+
+    def line(self, x1: float, y1: float, x2: float, y2: float):
+        length = math.hypot(x2 - x1, y2 - y1)
+        if not length:
+            return
+        nx, ny = (y1 - y2) / length * self.line_width / 2, (x2 - x1) / length * self.line_width / 2
+        self._fill_polygons([[(x1 + nx, y1 + ny), (x2 + nx, y2 + ny), (x2 - nx, y2 - ny), (x1 - nx, y1 - ny)]],
+                            self.stroke_color)
+
+    def fill_operations(self, operations):
+        self._fill_polygons(polygons(operations), self.fill_color)
+
+    def fill_text_paths(self, text_paths):
+        polygon_list = _polygons.get(text_paths)
+        if polygon_list is None:
+            polygon_list = _polygons[text_paths] = polygons(text_paths.operations)
+        self._fill_polygons(polygon_list, self.fill_color)
+
+    def _page(self) -> bytes:
+        image = self.image.reduce(self.supersample) if self.supersample > 1 else self.image
+        png = io.BytesIO()
+        image.save(png, 'PNG', compress_level=1)
+        self.image = None
+        return png.getvalue()
+
+
+def svg(plate, scale: float = 1.0, precision: int = 2) -> str:
+    work_canvas = SvgCanvas(scale, precision)
+    plate.draw_page(work_canvas)
+    return work_canvas.pages[0]
+
+
+def png(plate, scale: float = 0.25, supersample: int = 2) -> bytes:
+    work_canvas = PngCanvas(scale, supersample)
+    plate.draw_page(work_canvas)
+    return work_canvas.pages[0]
+
+
+def preview(plate, preview_format: str = 'svg') -> bytes:
+    """
+    :param preview_format: svg or png
+    """
+    if preview_format == 'svg':
+        return svg(plate).encode()
+    return png(plate)
@@ -0,0 +1,226 @@
+""" http render service, keeps glyphs and layout caches warm in a pool of render processes
+
+    python3 address_plate.py serve --port 8000 --workers 4
+
+    POST /name, /number, /vertical with json of the same fields as the subcommands
+    (and "wide": true), answer is the pdf with ETag of the inputs, If-None-Match gives 304
+
+    curl -d '{"house_num": "12", "left_num": "14"}' http://localhost:8000/number > 12.pdf
+
+    ?format=svg or ?format=png gives preview (plate_preview.py) instead of pdf
+
+    GET /health - json of pool state
+    GET /metrics - render metrics of all workers as prometheus text (?format=json - json),
+                   when started with --metrics or ADDRESS_PLATE_METRICS
+"""
+import address_plate
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from http import HTTPStatus
+import json
+import os
+
+MAX_BODY = 64 * 1024
+CONTENT_TYPES = {'pdf': 'application/pdf', 'svg': 'image/svg+xml', 'png': 'image/png'}
+
+
+def _init_worker(settings: dict, metrics: bool = False):
+    from reportlab import rl_config
+
+    # same inputs - same bytes, so ETag of inputs is ETag of pdf,
+    # settings of the server process, ETag (render_version) is of them
+    rl_config.invariant = 1
+    address_plate.init_worker(settings, metrics)
+    len(address_plate.TextPaths.path_dict)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """ If-None-Match header matches etag: '*' or one of comma separated tags, weak (W/) tags compared as strong
+    """
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+
+class PlateServer:
+
+    def __init__(self, workers: int = None, concurrency: int = None, max_queue: int = 256,
+                 default_wide: str = address_plate.THIN):
+        """
+        :param workers: render processes, all cores if None
+        :param concurrency: renders in flight, workers if None
+        :param max_queue: requests waiting for render, more are answered 503
+        """
+        self.workers = workers or os.cpu_count()
+        self.concurrency = concurrency or self.workers
+        self.max_queue = max_queue
+        self.default_wide = default_wide
+        # part of every ETag
+        self.version = address_plate.render_version()
+        self.pool = None
+        self.semaphore = None
+        self.waiting = 0
+        self.rendering = 0
+        self.rendered = 0
+        self.rejected = 0
+
+    def etag(self, key: tuple) -> str:
+        return '"' + hashlib.sha256(self.version + repr(key).encode()).hexdigest()[:32] + '"'
+
+    async def render(self, key: tuple, output_format: str = 'pdf') -> tuple:
+        """
+        :param output_format: pdf, svg or png
+        :return: (bytes, None) or (None, error message)
+        """
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.rendering += 1
+        try:
+            rendered, raw_metrics = await asyncio.get_running_loop().run_in_executor(
+                self.pool, address_plate._render_chunk, 0, [key], output_format)
+        finally:
+            self.rendering -= 1
+            self.semaphore.release()
+        self.rendered += 1
+        if raw_metrics is not None and address_plate.METRICS is not None:
+            address_plate.METRICS.merge(raw_metrics)
+        _, pdf, error = rendered[0]
+        return pdf, error
+
+    async def respond(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        """
+        :return: (status, headers, body)
+        """
+        path, _, query = path.partition('?')
+        path = path.strip('/')
+        if method == 'GET' and path == 'health':
+            return self._json(HTTPStatus.OK, self.health())
+        if method == 'GET' and path == 'metrics':
+            return self.metrics('format=json' in query)
+        if method != 'POST' or path not in address_plate.PLATE_FIELDS:
+            return self._json(HTTPStatus.NOT_FOUND, {'error': f'POST /{"|/".join(address_plate.PLATE_FIELDS)}'})
+
+        try:
+            row = json.loads(body or b'{}')
+            if not isinstance(row, dict):
+                raise ValueError('json object expected')
+            # text or number fields, wide true/false or size name, else ValueError
+            row['plate'] = path
+            key = address_plate.row_key(row, self.default_wide)
+        except ValueError as e:
+            return self._json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+
+        output_format = next((value for name, _, value in (part.partition('=') for part in query.split('&'))
+                              if name == 'format'), 'pdf')
+        if output_format not in CONTENT_TYPES:
+            return self._json(HTTPStatus.BAD_REQUEST, {'error': f'format is one of {", ".join(CONTENT_TYPES)}'})
+
+        etag = self.etag(key if output_format == 'pdf' else key + (output_format,))
+        cache_headers = {'ETag': etag, 'Cache-Control': 'public, max-age=86400'}
+        if etag_matches(headers.get('if-none-match', ''), etag):
+            return HTTPStatus.NOT_MODIFIED, cache_headers, b''
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            status, response_headers, response = self._json(HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'busy'})
+            response_headers['Retry-After'] = '1'
+            return status, response_headers, response
+
+        data, error = await self.render(key, output_format)
+        if error:
+            return self._json(HTTPStatus.UNPROCESSABLE_ENTITY, {'error': error})
+        return HTTPStatus.OK, {'Content-Type': CONTENT_TYPES[output_format], **cache_headers}, data
+
+    def health(self) -> dict:
+        return {'workers': self.workers, 'concurrency': self.concurrency, 'max_queue': self.max_queue,
+                'rendering': self.rendering, 'waiting': self.waiting,
+                'rendered': self.rendered, 'rejected': self.rejected}
+
+    def metrics(self, as_json: bool = False) -> tuple:
+        metrics = address_plate.METRICS
+        if metrics is None:
+            return self._json(HTTPStatus.NOT_FOUND, {'error': 'metrics are off, serve with --metrics'})
+        if as_json:
+            return self._json(HTTPStatus.OK, {**metrics.snapshot(), 'server': self.health()})
+        lines = [metrics.to_prometheus()]
+        for name in ('rendering', 'waiting'):
+            lines.append(f'# TYPE address_plate_server_{name} gauge\n'
+                         f'address_plate_server_{name} {getattr(self, name)}\n')
+        for name in ('rendered', 'rejected'):
+            lines.append(f'# TYPE address_plate_server_{name}_total counter\n'
+                         f'address_plate_server_{name}_total {getattr(self, name)}\n')
+        return HTTPStatus.OK, {'Content-Type': 'text/plain; version=0.0.4'}, ''.join(lines).encode()
+
+    @staticmethod
+    def _json(status: HTTPStatus, data: dict) -> tuple:
+        return status, {'Content-Type': 'application/json'}, json.dumps(data, ensure_ascii=False).encode()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ http/1.1 connection, keep-alive
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    status, response_headers, response = self._json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                                                     {'error': f'body over {MAX_BODY} bytes'})
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, response_headers, response = await self.respond(method, path, headers, body)
+                        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                    except Exception as e:
+                        # a bug on one request is its 500, not a dropped connection and asyncio traceback
+                        status, response_headers, response = self._json(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                                                         {'error': f'{type(e).__name__}: {e}'})
+                        keep_alive = False
+
+                head = [f'HTTP/1.1 {status.value} {status.phrase}', f'Content-Length: {len(response)}',
+                        f'Connection: {"keep-alive" if keep_alive else "close"}']
+                head += [f'{name}: {value}' for name, value in response_headers.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(address_plate.render_settings(),
+                                           address_plate.METRICS is not None)) as self.pool:
+            # start every worker now, not on first requests
+            await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(self.pool, len, ())
+                                   for _ in range(self.workers)])
+            server = await asyncio.start_server(self.handle, host, port)
+            async with server:
+                await server.serve_forever()
+
+
+def serve(host: str = '127.0.0.1', port: int = 8000, **kwargs):
+    try:
+        asyncio.run(PlateServer(**kwargs).serve(host, port))
+    except KeyboardInterrupt:
+        pass
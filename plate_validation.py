@@ -0,0 +1,226 @@
+""" bulk check of manifest rows without rendering: house number formats, look-alike letters and whitespace,
+glyph coverage of every face and size a row uses
+
+    python3 address_plate.py validate --manifest plates.csv --report errors.jsonl --output normalized.csv
+
+every distinct field value is normalised and checked once (registries repeat street names and numbers),
+house numbers are matched by one regex of all HOUSE_NUMBER_RE_TUPLE (HOUSE_NUMBER_ARROW_RE_TUPLE) patterns,
+report is jsonl of Issue, 'normalized' issues are fixes, not errors
+"""
+from address_plate import (HOUSE_NUMBER_ARROW_RE_TUPLE, HOUSE_NUMBER_RE_TUPLE, PLATE_FIELDS, THIN, TextPaths,
+                           cell_text, layout_spec, row_wide)
+from collections import namedtuple
+import re
+
+# issue codes
+NORMALIZED = 'normalized'  # value was changed, row is valid with the new value
+BAD_PLATE = 'bad_plate'
+BAD_WIDE = 'bad_wide'
+MISSING = 'missing'  # required field is empty
+BAD_FORMAT = 'bad_format'  # house number matches no pattern, jsonl cell is not text or number
+MISSING_GLYPHS = 'missing_glyphs'  # characters not in glyph store for face and size of field
+
+# line (1-based data row), field, code, value (as in manifest), detail (normalised value, missing characters)
+Issue = namedtuple('Issue', 'line field code value detail')
+
+LOOKALIKES = ('AaBCcEeHIiKkMOoPpTXxy', 'АаВСсЕеНІіКкМОоРрТХху')
+LATIN_TO_CYRILLIC = str.maketrans(*LOOKALIKES)
+CYRILLIC_TO_LATIN = str.maketrans(*reversed(LOOKALIKES))
+
+SPACE_RE = re.compile(r'\s+')
+DASH_RE = re.compile(r'\s*[-‐‑‒–—−]\s*')
+SLASH_RE = re.compile(r'\s*/\s*')
+LETTER_SPACE_RE = re.compile(r'(?<=\d)\s+(?=[^\W\d_])')
+BUILDING_RE = re.compile(r'(?<=\d)К(?=\d)')  # 3К2 -> 3 к2 (корпус)
+CYRILLIC_RE = re.compile(r'[Ѐ-ӿ]')
+LATIN_RE = re.compile(r'[A-Za-z]')
+
+NUMBER_FIELDS = ('house_num', 'left_num', 'right_num')
+REQUIRED_FIELDS = ('street_type', 'street_name', 'street_translit', 'house_num')
+
+ROW_CACHE_SIZE = 65536  # distinct rows of checks kept, cleared when full
+CACHED_TYPES = frozenset((str, type(None)))  # rows of these cell types only are cached
+
+
+def combined_matcher(regex_tuple: tuple) -> re.Pattern:
+    """ one regex of all patterns (tried in same order), group names get 'p<index>_' prefix
+    """
+    return re.compile('|'.join(f'(?:{re.sub(r"[(][?]P<", f"(?P<p{i}_", regex.pattern)})'
+                               for i, regex in enumerate(regex_tuple)))
+
+
+HOUSE_NUMBER_MATCHER = combined_matcher(HOUSE_NUMBER_RE_TUPLE)
+HOUSE_NUMBER_ARROW_MATCHER = combined_matcher(HOUSE_NUMBER_ARROW_RE_TUPLE)
+
+
+def match_parts(matcher: re.Pattern, value: str) -> dict:
+    """ same as BasePlate.parse_house_number of combined_matcher() regex tuple
+
+    :return: {part: text} of first matching pattern or None
+    """
+    match = matcher.match(value)
+    if match is None:
+        return None
+    groups = match.groupdict()
+    # first group of matched pattern, every pattern has lvl1 or lvl_a1
+    prefix = next(name for name, text in groups.items() if text is not None).split('_', 1)[0] + '_'
+    return {name[len(prefix):]: text or '' for name, text in groups.items() if name.startswith(prefix)}
+
+
+def normalize_space(value: str) -> str:
+    return SPACE_RE.sub(' ', value).strip()
+
+
+def normalize_house_number(value: str) -> str:
+    """ ' 12 a ' -> '12А', '25 / 3a' -> '25/3А', '10–12' -> '10-12', '3к2' -> '3 к2'
+    """
+    value = normalize_space(value).translate(LATIN_TO_CYRILLIC).upper()
+    value = SLASH_RE.sub('/', DASH_RE.sub('-', value))
+    return BUILDING_RE.sub(' к', LETTER_SPACE_RE.sub('', value))
+
+
+def normalize_text(value: str, latin: bool = False) -> str:
+    """ spaces, look-alike letters of other script in mixed words ('Xорива' with latin X -> 'Хорива')
+
+    :param latin: text is latin (translit), cyrillic look-alikes are changed
+    """
+    value = normalize_space(value)
+    own_re, other_re, table = (LATIN_RE, CYRILLIC_RE, CYRILLIC_TO_LATIN) if latin else \
+        (CYRILLIC_RE, LATIN_RE, LATIN_TO_CYRILLIC)
+    if not other_re.search(value):
+        return value
+    return ' '.join(word.translate(table) if own_re.search(word) else word for word in value.split(' '))
+
+
+class Validator:
+    """ normalises and checks manifest rows, results of rows, field values and glyph coverage are cached
+    """
+
+    def __init__(self, default_wide: str = THIN, path_dict=None):
+        """
+        :param path_dict: glyphs, TextPaths.path_dict if None
+        """
+        self.default_wide = default_wide
+        self.path_dict = TextPaths.path_dict if path_dict is None else path_dict
+        self._values = {}  # (field, value): (normalised, parts or None)
+        self._missing = {}  # (text, face, size): missing characters
+        self._rows = {}  # (plate, wide, field values): _check()
+
+    def _value(self, field: str, value: str) -> tuple:
+        key = (field, value)
+        result = self._values.get(key)
+        if result is None:
+            if field == 'house_num':
+                normalized = normalize_house_number(value)
+                result = (normalized, match_parts(HOUSE_NUMBER_MATCHER, normalized))
+            elif field in NUMBER_FIELDS:
+                normalized = normalize_house_number(value)
+                result = (normalized, match_parts(HOUSE_NUMBER_ARROW_MATCHER, normalized))
+            else:
+                result = (normalize_text(value, field == 'street_translit'), None)
+            self._values[key] = result
+        return result
+
+    def missing_glyphs(self, text: str, font) -> str:
+        """ characters of text without glyph of font face and size, in order of first use
+        """
+        key = (text, font['face'], font['size'])
+        missing = self._missing.get(key)
+        if missing is None:
+            prefix = f"{font['face']}_{font['size']}_"
+            missing = self._missing[key] = ''.join(sorted(
+                {char for char in text if prefix + char not in self.path_dict}, key=text.index))
+        return missing
+
+    def _fonts(self, plate: str, wide: str, values: dict, parts: dict) -> list:
+        """ [(field, text, font)] the plate draws
+        """
+        if plate == 'number':
+            spec = layout_spec('number', wide, bool(values.get('left_num') or values.get('right_num')))
+        else:
+            spec = layout_spec(plate, wide)
+        texts = []
+        if plate != 'number':
+            texts += [('street_type', values['street_type'], spec.type_font),
+                      ('street_name', values['street_name'], spec.name_font),
+                      ('street_translit', values['street_translit'], spec.translit_font)]
+        for field, field_parts in parts.items():
+            fonts = spec.fonts if field == 'house_num' else spec.number_fonts
+            texts += [(field, text, fonts[part]) for part, text in field_parts.items() if text]
+        return texts
+
+    def _check(self, plate: str, wide_value, values: dict) -> tuple:
+        """
+        :return: ({field: normalised value} of changed fields, [(field, code, value, detail)])
+        """
+        issues = []
+        try:
+            wide = row_wide({'wide': wide_value}, self.default_wide)
+        except ValueError:
+            issues.append(('wide', BAD_WIDE, wide_value, None))
+            wide = None
+
+        changes = {}
+        parts = {}
+        for field, value in values.items():
+            try:
+                # jsonl number is text ('normalized' issue), true/false, list and object are bad
+                text = cell_text(value, field)
+            except ValueError:
+                issues.append((field, BAD_FORMAT, value, None))
+                continue
+            normalized, field_parts = ('', None) if text is None else self._value(field, text)
+            if not normalized:
+                if field in REQUIRED_FIELDS:
+                    issues.append((field, MISSING, value, None))
+                continue
+            if normalized != value:
+                issues.append((field, NORMALIZED, value, normalized))
+                changes[field] = normalized
+            if field in NUMBER_FIELDS:
+                if field_parts is None:
+                    issues.append((field, BAD_FORMAT, value, normalized))
+                    continue
+                parts[field] = field_parts
+
+        if wide is None or len(issues) > len(changes):
+            return changes, issues
+        normalized_values = {**values, **changes}
+        for field, text, font in self._fonts(plate, wide, normalized_values, parts):
+            missing = self.missing_glyphs(text, font)
+            if missing:
+                issues.append((field, MISSING_GLYPHS, values[field], missing))
+        return changes, issues
+
+    def validate(self, row: dict, line: int) -> tuple:
+        """
+        :return: (normalised row, [Issue]), row is valid if no issue but NORMALIZED
+        """
+        plate = row.get('plate')
+        fields = PLATE_FIELDS.get(plate) if isinstance(plate, str) else None
+        if fields is None:
+            return row, [Issue(line, 'plate', BAD_PLATE, plate, None)]
+        key = (plate, row.get('wide'), *[row.get(field) for field in fields])
+        # rows of jsonl numbers and other values are not cached: 1, 1.0 and true are same key, lists not hashable
+        cached = CACHED_TYPES.issuperset(map(type, key))
+        checked = self._rows.get(key) if cached else None
+        if checked is None:
+            checked = self._check(plate, key[1], dict(zip(fields, key[2:])))
+            if cached:
+                if len(self._rows) >= ROW_CACHE_SIZE:
+                    self._rows.clear()
+                self._rows[key] = checked
+        changes, issues = checked
+        if not issues:
+            return row, []
+        if changes:
+            row = {**row, **changes}
+        return row, [Issue(line, *issue) for issue in issues]
+
+
+def validate_rows(rows, default_wide: str = THIN, path_dict=None):
+    """ yield (line, normalised row, [Issue]) of every row, see Validator
+    """
+    validator = Validator(default_wide, path_dict)
+    for line, row in enumerate(rows, 1):
+        yield (line, *validator.validate(row, line))
@@ -0,0 +1,124 @@
+""" content addressed on-disk cache of rendered plates, a re-run of a changed manifest renders changed rows only
+
+    python3 address_plate.py batch --manifest plates.csv --out_dir out --cache ~/.cache/address_plate
+
+a plate is stored under sha256 of address_plate.render_version() (code, glyphs, SIZES_PT, backend, reportlab)
+and its row key (address_plate.row_key), so any change of inputs or of the renderer is a miss
+
+files are written to a temp file and renamed, so processes and batches can share a cache directory,
+least recently used files are removed when the cache is over max_bytes (see evict())
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+SUFFIX = '.pdf'
+STALE_TEMP = 3600  # s, temp files of crashed writers older than this are removed by evict()
+
+
+class RenderCache:
+
+    def __init__(self, directory: str, max_bytes: int = 1024 ** 3, version: bytes = None):
+        """
+        :param max_bytes: evict() removes least recently used plates over it
+        :param version: address_plate.render_version() if None
+        """
+        if version is None:
+            from address_plate import render_version
+
+            version = render_version()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = self.misses = self.writes = self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: tuple) -> str:
+        digest = hashlib.sha256(self.version + repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:] + SUFFIX)
+
+    def __contains__(self, key: tuple) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: tuple) -> bytes:
+        """
+        :return: pdf bytes or None
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime is the last use for evict()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: tuple, data: bytes):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.writes += 1
+
+    def evict(self) -> int:
+        """ remove least recently used plates till cache is not over max_bytes,
+        skipped if other process is evicting now
+
+        :return: removed files
+        """
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return 0
+
+            files = []
+            total = 0
+            now = time.time()
+            removed = 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_dir():
+                    continue
+                for file_entry in os.scandir(entry.path):
+                    try:
+                        stat = file_entry.stat()
+                        if file_entry.name.endswith('.tmp'):
+                            if now - stat.st_mtime > STALE_TEMP:
+                                os.unlink(file_entry.path)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, file_entry.path))
+                    total += stat.st_size
+
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        self.evictions += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'writes': self.writes, 'evictions': self.evictions}
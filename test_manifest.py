@@ -0,0 +1,590 @@
+""" manifest rows of any json type: bad rows are reported, the rest is rendered;
+render backends, forms and packing give same plates as the plain way
+
+    python3 -m unittest test_manifest
+"""
+import asyncio
+from collections import Counter
+from http import HTTPStatus
+import importlib.util
+import io
+import json
+import os
+import re
+import tempfile
+import unittest
+
+import address_plate
+
+
+def have_glyphs() -> bool:
+    try:
+        len(address_plate.TextPaths.path_dict)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def write_jsonl(directory: str, rows: list) -> str:
+    path = os.path.join(directory, 'plates.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+    return path
+
+
+PDF_OBJECT_RE = re.compile(rb'(\d+) 0 obj\s*(.*?)endobj', re.S)
+PDF_STREAM_RE = re.compile(rb'stream\r?\n(.*?)endstream', re.S)
+
+
+def pdf_pages(pdf: bytes) -> list:
+    """ pages of an uncompressed pdf (pdf_mode fast) as [((width, height), [content token])],
+    form xobjects drawn by Do are replaced by their content, so forms and inline drawing give same tokens
+    """
+    objects = {int(number): body for number, body in PDF_OBJECT_RE.findall(pdf)}
+
+    def tokens(code: bytes, resources: bytes) -> list:
+        xobjects = re.search(rb'/XObject <<(.*?)>>', resources, re.S)
+        names = dict(re.findall(rb'/(\S+) (\d+) 0 R', xobjects.group(1))) if xobjects else {}
+        result = []
+        for token in code.split():
+            if token == b'Do':
+                form = objects[int(names[result.pop()[1:]])]
+                result += tokens(PDF_STREAM_RE.search(form).group(1), form)
+            else:
+                result.append(token)
+        return result
+
+    pages = []
+    for _, body in sorted(objects.items()):
+        if re.search(rb'/Type /Page\s', body):
+            width, height = map(float, re.search(rb'/MediaBox \[ 0 0 (\S+) (\S+) \]', body).groups())
+            contents = objects[int(re.search(rb'/Contents (\d+) 0 R', body).group(1))]
+            pages.append(((width, height), tokens(PDF_STREAM_RE.search(contents).group(1), body)))
+    return pages
+
+
+class RowKeyTest(unittest.TestCase):
+
+    def test_number_cell_is_text(self):
+        self.assertEqual(address_plate.row_key({'plate': 'number', 'house_num': 12}),
+                         address_plate.row_key({'plate': 'number', 'house_num': '12'}))
+
+    def test_bad_cells(self):
+        for row in ({'plate': 'number', 'house_num': [12]},
+                    {'plate': 'number', 'house_num': True},
+                    {'plate': 'number', 'house_num': '12', 'left_num': {'n': 14}},
+                    {'plate': 'number', 'house_num': '12', 'wide': [1]},
+                    {'plate': ['number'], 'house_num': '12'},
+                    {'plate': 1, 'house_num': '12'}):
+            with self.subTest(row=row):
+                self.assertRaises(ValueError, address_plate.row_key, row)
+
+
+class BatchTest(unittest.TestCase):
+
+    rows = [
+        {'plate': 'number', 'house_num': 12, 'output': '12.pdf'},
+        {'plate': 'number', 'house_num': [12], 'output': 'list.pdf'},
+        {'plate': {'kind': 'number'}, 'house_num': '12', 'output': 'plate.pdf'},
+        {'plate': 'number', 'house_num': '12', 'output': 12},
+    ]
+
+    def test_bad_rows_do_not_stop_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = write_jsonl(directory, self.rows[1:])
+            results = address_plate.render_batch(address_plate.read_manifest(manifest), out_dir=directory)
+        self.assertEqual([result.line for result in results], [1, 2, 3])
+        self.assertTrue(all(result.error for result in results))
+
+    @unittest.skipUnless(have_glyphs(), 'no glyph paths')
+    def test_number_cell_is_rendered(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = write_jsonl(directory, self.rows)
+            results = address_plate.render_batch(address_plate.read_manifest(manifest), out_dir=directory)
+            self.assertIsNone(results[0].error)
+            self.assertTrue(os.path.exists(os.path.join(directory, '12.pdf')))
+        self.assertTrue(all(result.error for result in results[1:]))
+
+
+class DryRunTest(unittest.TestCase):
+
+    def test_bad_cells_are_row_errors(self):
+        rows = [{'plate': 'number', 'house_num': [12], 'output': 'list.pdf'},
+                {'plate': 'vertical', 'street_type': 'вулиця', 'street_name': {'name': 'Хорива'},
+                 'street_translit': 'Khoryva', 'house_num': '1'},
+                {'plate': None}]
+        sizes = address_plate.measure_rows(rows)
+        self.assertEqual([size.line for size in sizes], [1, 2, 3])
+        self.assertTrue(all(size.error and size.width_mm is None for size in sizes))
+
+    @unittest.skipUnless(have_glyphs(), 'no glyph paths')
+    def test_number_cell_is_measured(self):
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = write_jsonl(directory, [{'plate': 'number', 'house_num': 12, 'output': '12.pdf'},
+                                               {'plate': 'number', 'house_num': '12', 'output': '12.pdf'}])
+            first, second = address_plate.measure_rows(address_plate.read_manifest(manifest))
+        self.assertIsNone(first.error)
+        self.assertEqual(first, second._replace(line=1))
+
+
+class ValidateTest(unittest.TestCase):
+
+    def test_json_cells(self):
+        from plate_validation import BAD_FORMAT, BAD_PLATE, BAD_WIDE, NORMALIZED, Validator
+
+        class AllGlyphs(dict):
+            def __contains__(self, key):
+                return True
+
+        validator = Validator(path_dict=AllGlyphs())
+        for row, codes in (({'plate': 'number', 'house_num': 12}, {('house_num', NORMALIZED)}),
+                           ({'plate': 'number', 'house_num': True}, {('house_num', BAD_FORMAT)}),
+                           ({'plate': 'number', 'house_num': '12', 'left_num': [14]}, {('left_num', BAD_FORMAT)}),
+                           ({'plate': 'number', 'house_num': '12', 'wide': [1]}, {('wide', BAD_WIDE)}),
+                           ({'plate': ['number'], 'house_num': '12'}, {('plate', BAD_PLATE)})):
+            with self.subTest(row=row):
+                # twice, second from row cache if cached
+                for _ in range(2):
+                    normalized, issues = validator.validate(row, 1)
+                    self.assertEqual({(issue.field, issue.code) for issue in issues}, codes)
+        self.assertEqual(validator.validate({'plate': 'number', 'house_num': 12}, 1)[0]['house_num'], '12')
+
+    @unittest.skipUnless(have_glyphs(), 'no glyph paths')
+    def test_csv_of_mixed_rows(self):
+        from argparse import Namespace
+        from contextlib import redirect_stderr
+        import csv
+
+        rows = [{'plate': 'number', 'house_num': '12', 'note': 'corner'},
+                {'plate': 'name', 'street_type': 'вулиця', 'street_name': 'Хорива', 'street_translit': 'Khoryva',
+                 'wide': True, 'output': 'name.pdf', 'color': 'blue'},
+                {'plate': 'vertical', 'street_type': 'вулиця', 'street_name': 'Хорива',
+                 'street_translit': 'Khoryva', 'house_num': '1'}]
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'normalized.csv')
+            args = Namespace(manifest=write_jsonl(directory, rows), report=os.path.join(directory, 'report.jsonl'),
+                             output=output, wide=False, size=None)
+            with redirect_stderr(io.StringIO()):
+                self.assertEqual(address_plate._main_validate(args), 0)
+            with open(output, encoding='utf-8', newline='') as f:
+                normalized = list(csv.DictReader(f))
+        self.assertEqual(len(normalized), 3)
+        self.assertEqual([row['plate'] for row in normalized], ['number', 'name', 'vertical'])
+        self.assertEqual((normalized[0]['house_num'], normalized[0]['note'], normalized[0]['street_name']),
+                         ('12', 'corner', ''))
+        self.assertEqual((normalized[1]['street_name'], normalized[1]['output']), ('Хорива', 'name.pdf'))
+        self.assertNotIn('color', normalized[1])
+        self.assertEqual(normalized[2]['house_num'], '1')
+
+
+class SinkTest(unittest.TestCase):
+
+    def test_outside_out_dir(self):
+        from plate_output import DirectorySink, entry_name
+
+        with tempfile.TemporaryDirectory() as directory:
+            sink = DirectorySink(os.path.join(directory, 'out'))
+            for name in ('../12.pdf', 'a/../../12.pdf', os.path.join(directory, '12.pdf'), ''):
+                with self.subTest(name=name):
+                    self.assertRaises(ValueError, sink.write, name, b'pdf')
+                    self.assertRaises(ValueError, entry_name, name)
+            sink.write('a/../12.pdf', b'pdf')
+            self.assertEqual(os.listdir(directory), ['out'])
+            self.assertEqual(os.listdir(os.path.join(directory, 'out')), ['12.pdf'])
+
+    def test_archives(self):
+        import tarfile
+        import zipfile
+        from plate_output import INVARIANT_MTIME, INVARIANT_TIME, TarSink, ZipSink
+        from reportlab import rl_config
+
+        def archive(sink_class, *args) -> bytes:
+            out = io.BytesIO()
+            sink = sink_class(out, *args)
+            sink.write('12.pdf', b'pdf')
+            for name in ('12.pdf', './12.pdf', 'a/../12.pdf'):
+                self.assertRaises(ValueError, sink.write, name, b'pdf')
+            sink.write('a/12.pdf', b'pdf')
+            sink.close()
+            return out.getvalue()
+
+        invariant = rl_config.invariant
+        rl_config.invariant = 1
+        try:
+            for args in ((ZipSink,), (TarSink,), (TarSink, 'gz'), (TarSink, 'xz')):
+                with self.subTest(args=args):
+                    data = archive(*args)
+                    if args[0] is ZipSink:
+                        infos = [(info.filename, info.date_time)
+                                 for info in zipfile.ZipFile(io.BytesIO(data)).infolist()]
+                        self.assertEqual(infos, [('12.pdf', INVARIANT_TIME), ('a/12.pdf', INVARIANT_TIME)])
+                    else:
+                        infos = [(info.name, info.mtime) for info in tarfile.open(fileobj=io.BytesIO(data))]
+                        self.assertEqual(infos, [('12.pdf', INVARIANT_MTIME), ('a/12.pdf', INVARIANT_MTIME)])
+                    if args[1:] == ('gz',):
+                        self.assertEqual(data[4:8], bytes(4))  # gzip header mtime
+                    self.assertEqual(archive(*args), data)
+        finally:
+            rl_config.invariant = invariant
+
+    @unittest.skipUnless(have_glyphs(), 'no glyph paths')
+    def test_batch_row_error(self):
+        with tempfile.TemporaryDirectory() as directory:
+            out_dir = os.path.join(directory, 'out')
+            manifest = write_jsonl(directory, [{'plate': 'number', 'house_num': '12', 'output': '../12.pdf'},
+                                               {'plate': 'number', 'house_num': '12', 'output': '12.pdf'}])
+            results = address_plate.render_batch(address_plate.read_manifest(manifest), out_dir=out_dir)
+            self.assertIn('outside', results[0].error)
+            self.assertIsNone(results[1].error)
+            self.assertEqual(sorted(os.listdir(directory)), ['out', 'plates.jsonl'])
+
+
+class JobTest(unittest.TestCase):
+
+    def test_chunk_error_fails_chunk(self):
+        import plate_jobs
+
+        def render_batch(*args, **kwargs):
+            raise RuntimeError('font error')
+
+        with tempfile.TemporaryDirectory() as directory:
+            job = os.path.join(directory, 'plates.job')
+            rows = [{'plate': 'number', 'house_num': str(n), 'output': f'{n}.pdf'} for n in range(1, 6)]
+            plate_jobs.create(job, rows, directory, chunk_rows=2)
+            original, address_plate.render_batch = address_plate.render_batch, render_batch
+            try:
+                done = plate_jobs.work(job)
+            finally:
+                address_plate.render_batch = original
+            self.assertEqual((done['chunks'], done['failed']), (0, 3))
+            status = plate_jobs.status(job)
+            self.assertEqual((status['chunks'][plate_jobs.FAILED], status['rows_failed'], status['workers']), (3, 5, 0))
+            self.assertEqual([error for _, _, error in plate_jobs.row_errors(job)], ['RuntimeError: font error'] * 5)
+
+            self.assertEqual(plate_jobs.retry(job), 3)
+            self.assertEqual(plate_jobs.status(job)['chunks'][plate_jobs.PENDING], 3)
+            self.assertEqual(list(plate_jobs.row_errors(job)), [])
+
+    @unittest.skipUnless(have_glyphs(), 'no glyph paths')
+    def test_settings_of_create(self):
+        import plate_jobs
+
+        row = {'plate': 'number', 'house_num': '12', 'output': '12.pdf'}
+        saved = address_plate.render_settings()
+        try:
+            address_plate.BasePlate.direct_pdf = True
+            address_plate.BasePlate.pdf_mode = address_plate.PDF_MODES['compact']._replace(invariant=True)
+            expected = address_plate.render(row)
+            with tempfile.TemporaryDirectory() as directory:
+                job = os.path.join(directory, 'plates.job')
+                plate_jobs.create(job, [row], directory)
+                address_plate.apply_render_settings(saved)
+                plate_jobs.work(job)
+                with open(os.path.join(directory, '12.pdf'), 'rb') as f:
+                    self.assertEqual(f.read(), expected)
+        finally:
+            address_plate.apply_render_settings(saved)
+
+
+class ImposeTest(unittest.TestCase):
+
+    def test_rotate_uses_no_more_sheets(self):
+        import random
+        from plate_imposition import pack
+
+        self.assertEqual(pack([(300, 600)] * 6, 1000, 700, rotate=True)[1], 2)
+        self.assertEqual(pack([(450, 650)] * 4, 1000, 700, rotate=True)[1], 2)
+        self.assertEqual(pack([(600, 300)] * 6, 1000, 700, rotate=True)[1], 2)
+        randomizer = random.Random(20)
+        for _ in range(200):
+            # every plate fits upright, so both pack all plates
+            sizes = [(randomizer.randint(50, 650), randomizer.randint(50, 650))
+                     for _ in range(randomizer.randint(1, 40))]
+            sheet = (randomizer.choice((700, 1000, 1400)), 700)
+            with self.subTest(sizes=sizes, sheet=sheet):
+                upright = pack(sizes, *sheet, gutter=5, bleed=3, margin=10)
+                rotated = pack(sizes, *sheet, gutter=5, bleed=3, margin=10, rotate=True)
+                self.assertEqual(upright[2], rotated[2])
+                self.assertLessEqual(rotated[1], upright[1])
+                self.assertEqual(sorted(placement.index for placement in rotated[0]),
+                                 sorted(placement.index for placement in upright[0]))
+
+
+@unittest.skipUnless(have_glyphs(), 'no glyph paths')
+class PdfTest(unittest.TestCase):
+
+    streets = [('вулиця', 'Хрещатик', 'Khreshchatyk vul.'), ('провулок', 'Тиха', 'Tykha prov.')]
+
+    def setUp(self):
+        self.settings = address_plate.render_settings()
+        address_plate.BasePlate.pdf_mode = address_plate.PDF_MODES['fast']
+
+    def tearDown(self):
+        address_plate.apply_render_settings(self.settings)
+
+    def plates(self) -> list:
+        return ([address_plate.Vertical(*self.streets[n % 2], str(n + 1)) for n in range(6)] +
+                [address_plate.StreetName(*street, wide) for street in self.streets
+                 for wide in (address_plate.THIN, address_plate.WIDE)] +
+                [address_plate.StreetNumber(house_num, wide=wide) for house_num in ('7', '12А', '125/7Б')
+                 for wide in (address_plate.THIN, address_plate.WIDE)] +
+                [address_plate.StreetNumber('10-12 к1', '8Б', '14'), address_plate.StreetNumber('3', right_num='5')])
+
+    def test_plates_pdf_pages(self):
+        plates = self.plates()
+        # generator as from a long manifest
+        pages = pdf_pages(address_plate.plates_pdf(plate for plate in plates).read())
+        self.assertEqual(len(pages), len(plates))
+        for plate, (size, _) in zip(plates, pages):
+            with self.subTest(plate=type(plate).__name__, size=size):
+                self.assertAlmostEqual(size[0], plate.width, places=2)
+                self.assertAlmostEqual(size[1], plate.height, places=2)
+        for plate, (_, page) in zip(plates, pages):
+            self.assertEqual(pdf_pages(plate.pdf().read())[0][1], page)
+
+    def test_text_forms(self):
+        from plate_canvas import TEXT_FORM_USES
+
+        # texts of a street drawn TEXT_FORM_USES times are forms, of the other street once are inline
+        plates = ([address_plate.StreetName(*self.streets[0])] * TEXT_FORM_USES * 2 +
+                  [address_plate.StreetName(*self.streets[1])])
+        inline = address_plate.plates_pdf(plates).read()
+        forms = address_plate.plates_pdf(plates, text_forms=True).read()
+        self.assertEqual(pdf_pages(forms), pdf_pages(inline))
+        self.assertNotIn(b'/FormXob.text', inline)
+        self.assertEqual(len(set(re.findall(rb'/FormXob\.text\d+ Do', forms))), 3)
+        self.assertLess(len(forms), len(inline))
+
+
+    def test_header_forms(self):
+        # header of a street and size is one form, drawn on every page of its plates
+        plates = [address_plate.Vertical(*street, str(n), wide) for street in self.streets
+                  for wide in (address_plate.THIN, address_plate.WIDE) for n in range(1, 6)]
+        inline = address_plate.plates_pdf(plates, header_forms=False).read()
+        forms = address_plate.plates_pdf(plates).read()
+        self.assertEqual(pdf_pages(forms), pdf_pages(inline))
+        self.assertNotIn(b'/FormXob.header', inline)
+        self.assertEqual(len(set(re.findall(rb'/FormXob\.header\d+ Do', forms))), 4)
+        self.assertEqual(len(re.findall(rb'/FormXob\.header\d+ Do', forms)), len(plates))
+        self.assertLess(len(forms), len(inline))
+
+    @unittest.skipUnless(importlib.util.find_spec('numpy'), 'no numpy')
+    def test_numpy_layout(self):
+        from text_paths_numpy import NumpyTextPaths
+
+        layouts = []
+        text_paths = address_plate.BasePlate.text_paths
+
+        def record(plate, text, font):
+            layouts.append((text, font))
+            return text_paths(plate, text, font)
+
+        address_plate.BasePlate.text_paths = record
+        try:
+            pages = pdf_pages(address_plate.plates_pdf(self.plates()).read())
+        finally:
+            address_plate.BasePlate.text_paths = text_paths
+        self.assertGreater(len(layouts), len(self.plates()))
+        for text, font in layouts:
+            with self.subTest(text=text, font=dict(font)):
+                expected, paths = address_plate.TextPaths(text, font), NumpyTextPaths(text, font)
+                self.assertEqual([type_op for type_op, _ in paths.operations],
+                                 [type_op for type_op, _ in expected.operations])
+                for (_, points), (_, expected_points) in zip(paths.operations, expected.operations):
+                    self.assertEqual(len(points), len(expected_points))
+                    for x, expected_x in zip(points, expected_points):
+                        self.assertAlmostEqual(x, expected_x, places=9)
+                for x, expected_x in zip(paths.get_current_point() + paths.get_path_extents(),
+                                         expected.get_current_point() + expected.get_path_extents()):
+                    self.assertAlmostEqual(x, expected_x, places=9)
+
+        address_plate.use_numpy()
+        self.assertEqual(pdf_pages(address_plate.plates_pdf(self.plates()).read()), pages)
+
+
+    def test_direct_backend(self):
+        from plate_canvas import PDF_PRECISION
+
+        address_plate.BasePlate.pdf_mode = address_plate.PdfMode(compression=0, precision=None, invariant=False)
+        expected = pdf_pages(address_plate.plates_pdf(self.plates()).read())
+        address_plate.BasePlate.direct_pdf = True
+        pages = pdf_pages(address_plate.plates_pdf(self.plates()).read())
+        self.assertEqual(len(pages), len(expected))
+        for (size, page), (expected_size, expected_page) in zip(pages, expected):
+            self.assertEqual(size, expected_size)
+            # reportlab starts a path by n (no op), direct backend writes PDF_PRECISION digits
+            page = [token for token in page if token != b'n']
+            expected_page = [token for token in expected_page if token != b'n']
+            self.assertEqual(len(page), len(expected_page))
+            for token, expected_token in zip(page, expected_page):
+                if re.fullmatch(rb'-?[\d.]+', expected_token):
+                    self.assertAlmostEqual(float(token), float(expected_token), delta=0.5 / 10 ** PDF_PRECISION + 1e-9)
+                else:
+                    self.assertEqual(token, expected_token)
+
+
+@unittest.skipUnless(have_glyphs(), 'no glyph paths')
+class ThreadTest(unittest.TestCase):
+
+    def test_threads_render_serial_bytes(self):
+        import benchmark
+
+        settings = address_plate.render_settings()
+        try:
+            for direct_pdf in (False, True):
+                address_plate.BasePlate.direct_pdf = direct_pdf
+                with self.subTest(direct_pdf=direct_pdf):
+                    # name, vertical and number plates of a street, threads evict each other's layouts
+                    result = benchmark.threads(plates=300, thread_count=8, layout_cache=16)
+                    self.assertEqual((result['plates'], result['mismatches']), (300, 0))
+        finally:
+            address_plate.apply_render_settings(settings)
+
+
+class OptimizeTest(unittest.TestCase):
+
+    def test_redundant_operations(self):
+        from glyph_store import optimize_operations
+
+        operations = [
+            ('moveTo', (9, 9)),  # empty subpath
+            ('moveTo', (0, 0)),
+            ('lineTo', (5, 0)),
+            ('lineTo', (5, 0)),  # zero length
+            ('lineTo', (10, 0)),  # collinear
+            ('curveTo', (10, 3, 10, 7, 10, 10)),  # flat
+            ('curveTo', (7, 10, 3, 12, 0, 10)),
+            ('lineTo', (0, 0)),  # to start before close
+            ('close', ()),
+            ('moveTo', (20, 20)),  # empty subpath
+            ('close', ()),
+            ('moveTo', (30, 30)),  # empty subpath
+        ]
+        counts = Counter()
+        self.assertEqual(optimize_operations(operations, 0.001, counts),
+                         [('moveTo', (0, 0)), ('lineTo', (10, 0)), ('lineTo', (10, 10)),
+                          ('curveTo', (7, 10, 3, 12, 0, 10)), ('close', ())])
+        self.assertEqual(counts, {'empty_subpath': 4, 'zero_length': 1, 'collinear': 1, 'flat_curve': 1,
+                                  'close_line': 1})
+
+    def test_tolerance(self):
+        import math
+        import random
+        from glyph_store import optimize_operations
+
+        def distance(point, segments) -> float:
+            result = math.inf
+            for (x1, y1), (x2, y2) in segments:
+                dx, dy = x2 - x1, y2 - y1
+                t = max(0, min(1, ((point[0] - x1) * dx + (point[1] - y1) * dy) / (dx * dx + dy * dy or 1)))
+                result = min(result, math.hypot(point[0] - x1 - t * dx, point[1] - y1 - t * dy))
+            return result
+
+        def outline(operations) -> tuple:
+            """ (vertices, segments, points along segments and curves) of one closed subpath
+            """
+            vertices, samples = [], []
+            for type_op, points in operations:
+                if type_op == 'curveTo':
+                    x0, y0 = vertices[-1]
+                    x1, y1, x2, y2, x3, y3 = points
+                    samples += [((1 - t) ** 3 * x0 + 3 * (1 - t) ** 2 * t * x1 + 3 * (1 - t) * t * t * x2 + t ** 3 * x3,
+                                 (1 - t) ** 3 * y0 + 3 * (1 - t) ** 2 * t * y1 + 3 * (1 - t) * t * t * y2 + t ** 3 * y3)
+                                for t in (i / 16 for i in range(17))]
+                    vertices.append((x3, y3))
+                elif type_op != 'close':
+                    vertices.append(tuple(points))
+            segments = list(zip(vertices, vertices[1:] + vertices[:1]))
+            samples += [(x1 + (x2 - x1) * i / 16, y1 + (y2 - y1) * i / 16)
+                        for (x1, y1), (x2, y2) in segments for i in range(17)]
+            return vertices, segments, samples
+
+        randomizer = random.Random(23)
+        tolerance = 0.01
+        for _ in range(50):
+            # square of jittered lines and flat curves, jitter below and above tolerance
+            jitter = randomizer.choice((0.002, 0.005, 0.02))
+            operations = [('moveTo', (0, 0))]
+            for corner_start, corner in (((0, 0), (100, 0)), ((100, 0), (100, 100)), ((100, 100), (0, 100)),
+                                         ((0, 100), (0, 0))):
+                x0, y0 = corner_start
+                for i in range(1, 13):
+                    x = corner_start[0] + (corner[0] - corner_start[0]) * i / 12
+                    y = corner_start[1] + (corner[1] - corner_start[1]) * i / 12
+                    if i < 12:
+                        x, y = x + randomizer.uniform(-jitter, jitter), y + randomizer.uniform(-jitter, jitter)
+                    if randomizer.random() < 0.3:
+                        operations.append(('curveTo', (x0 + (x - x0) / 3 + randomizer.uniform(-jitter, jitter),
+                                                       y0 + (y - y0) / 3 + randomizer.uniform(-jitter, jitter),
+                                                       x0 + (x - x0) * 2 / 3, y0 + (y - y0) * 2 / 3, x, y)))
+                    else:
+                        operations.append(('lineTo', (x, y)))
+                    x0, y0 = x, y
+            operations.append(('close', ()))
+
+            counts = Counter()
+            optimized = optimize_operations(operations, tolerance, counts)
+            with self.subTest(jitter=jitter, counts=counts):
+                vertices, segments, samples = outline(operations)
+                optimized_vertices, optimized_segments, optimized_samples = outline(optimized)
+                self.assertLess(len(optimized), len(operations))
+                self.assertTrue(set(optimized_vertices) <= set(vertices))
+                self.assertLessEqual(max(distance(point, optimized_segments) for point in samples), tolerance)
+                if all(type_op != 'curveTo' for type_op, _ in optimized):
+                    self.assertLessEqual(max(distance(point, segments) for point in optimized_samples), tolerance)
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        from plate_server import PlateServer
+
+        self.server = PlateServer(workers=1)
+
+    def test_bad_body_is_400(self):
+        for body in (b'{"house_num": [12]}', b'{"house_num": "12", "wide": {}}', b'[12]', b'{'):
+            with self.subTest(body=body):
+                status, _, _ = asyncio.run(self.server.respond('POST', '/number', {}, body))
+                self.assertEqual(status, HTTPStatus.BAD_REQUEST)
+
+    def test_if_none_match(self):
+        body = b'{"house_num": "12"}'
+        etag = self.server.etag(address_plate.row_key({'plate': 'number', 'house_num': '12'}))
+        for header in (etag, f'W/{etag}', f'"a", {etag}', f'"a",W/{etag} ', '*'):
+            with self.subTest(header=header):
+                status, headers, response = asyncio.run(
+                    self.server.respond('POST', '/number', {'if-none-match': header}, body))
+                self.assertEqual((status, headers['ETag'], response), (HTTPStatus.NOT_MODIFIED, etag, b''))
+        render = []
+
+        async def render_(*args):
+            render.append(args)
+            return b'pdf', None
+
+        self.server.render = render_
+        for header in ('', etag[:-2] + '"', f'"{etag}"', etag + 'a', f'"a" {etag}', '"*"'):
+            with self.subTest(header=header):
+                status, _, response = asyncio.run(
+                    self.server.respond('POST', '/number', {'if-none-match': header}, body))
+                self.assertEqual((status, response), (HTTPStatus.OK, b'pdf'))
+        self.assertEqual(len(render), 6)
+
+    def test_error_is_500(self):
+        async def respond(*args):
+            raise TypeError('bug')
+
+        async def request() -> bytes:
+            server = await asyncio.start_server(self.server.handle, '127.0.0.1', 0)
+            async with server:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                writer.write(b'POST /number HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}')
+                response = await reader.read()
+                writer.close()
+            return response
+
+        self.server.respond = respond
+        self.assertTrue(asyncio.run(request()).startswith(b'HTTP/1.1 500 '))
+
+
+if __name__ == '__main__':
+    unittest.main()
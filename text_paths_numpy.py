@@ -0,0 +1,81 @@
+""" numpy layout of TextPaths, needs numpy (pip install numpy)
+
+glyph operations are kept as opcode array + Nx2 coordinate array,
+a string is laid out by one cumulative advance and one broadcast add
+"""
+from address_plate import TextPaths
+from glyph_store import OPERATION_CODES, OPERATION_POINTS, OPERATIONS
+import numpy as np
+
+
+class NumpyTextPaths(TextPaths):
+    """ same get_current_point(), get_path_extents(), operations and draw() as TextPaths
+    """
+
+    # 'face_size_char': (opcodes, coordinates Nx2, current point, path extents)
+    glyph_arrays = {}
+
+    def __init__(self, text: str, font: dict):
+        self.text = text
+        self.face = font['face']
+        self.size = font['size']
+        self._operations = None
+        self._init_path()
+
+    @classmethod
+    def _glyph(cls, key: str) -> tuple:
+        try:
+            return cls.glyph_arrays[key]
+        except KeyError:
+            pass
+        char_operations, char_current_point, char_path_extents = cls.path_dict[key]
+        opcodes = np.array([OPERATION_CODES[type_op] for type_op, _ in char_operations], dtype=np.uint8)
+        coordinates = np.array([x for _, points in char_operations for x in points], dtype=np.float64).reshape(-1, 2)
+        glyph = cls.glyph_arrays[key] = (opcodes, coordinates, char_current_point, char_path_extents)
+        return glyph
+
+    def _init_path(self):
+        keys = [f"{self.face}_{self.size}_{char}" for char in self.text]
+        glyphs = [self._glyph(key) for key in keys]
+        if not glyphs:
+            self.glyphs = ()
+            self.opcodes = np.zeros(0, dtype=np.uint8)
+            self.coordinates = np.zeros((0, 2))
+            self.current_point = (0, 0)
+            self.path_extents = (0, 0, 0, 0)
+            return
+
+        advances = np.array([glyph[2] for glyph in glyphs], dtype=np.float64)
+        ends = np.cumsum(advances, axis=0)
+        starts = np.zeros_like(ends)
+        starts[1:] = ends[:-1]
+
+        self.opcodes = np.concatenate([glyph[0] for glyph in glyphs])
+        self.coordinates = np.concatenate([glyph[1] for glyph in glyphs]) + \
+            np.repeat(starts, [len(glyph[1]) for glyph in glyphs], axis=0)
+        self.coordinates.flags.writeable = False
+
+        extents = np.array([glyph[3] for glyph in glyphs], dtype=np.float64) + np.tile(starts, 2)
+        self.path_extents = (
+            min(0, extents[:, 0].min().item()),
+            min(0, extents[:, 1].min().item()),
+            max(0, extents[:, 2].max().item()),
+            max(0, extents[:, 3].max().item()),
+        )
+        self.current_point = tuple(ends[-1].tolist())
+        self.glyphs = tuple(zip(keys, map(tuple, starts.tolist())))
+
+    @property
+    def operations(self) -> tuple:
+        """ ((operation_type, (points))) as in TextPaths, built on first use (draw)
+        """
+        if self._operations is None:
+            coordinates = self.coordinates.ravel().tolist()
+            operations = []
+            i = 0
+            for code in self.opcodes.tolist():
+                n = OPERATION_POINTS[code]
+                operations.append((OPERATIONS[code], tuple(coordinates[i:i + n])))
+                i += n
+            self._operations = tuple(operations)
+        return self._operations